@@ -32,7 +32,7 @@ setuptools.setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.6.8',
+    python_requires='>=3.7',
     install_requires=[
         "fastapi>=0.68.1",
         "uvicorn>0.13",
@@ -0,0 +1,146 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: 测试使用的内存对象存储
+"""
+import io
+import uuid
+import hashlib
+import threading
+from collections import Counter
+
+from yzcore.exceptions import NotFoundObject
+from yzcore.extensions.storage.base import StorageManagerBase
+from yzcore.extensions.storage.schemas import BaseConfig
+
+
+CONF = dict(access_key_id='ak', access_key_secret='sk', bucket_name='bucket', endpoint='localhost:9000',
+            scheme='http', cache_path=None)
+
+
+class MemoryStorage(StorageManagerBase):
+    """
+    文件保存在dict中，calls记录每个方法的调用次数
+    iter_objects每页最多返回page_limit个文件，用于测试翻页
+    """
+    page_limit = 3
+
+    def __init__(self, objects: dict = None, **kwargs):
+        super().__init__(BaseConfig(mode='minio', **dict(CONF, **kwargs)))
+        self.objects = {} if objects is None else objects
+        self.headers = {}  # key -> 上传时的参数
+        self.uploads = {}  # upload_id -> {part_number: data}
+        self.calls = Counter()
+        self.list_calls = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def create_bucket(self, bucket_name):
+        pass
+
+    def get_bucket_cors(self):
+        return {}
+
+    def list_buckets(self):
+        return [self.bucket_name]
+
+    def is_exist_bucket(self, bucket_name=None):
+        return True
+
+    def delete_bucket(self, bucket_name=None):
+        pass
+
+    def get_sign_url(self, key, expire=0):
+        return f'//{self.bucket_name}/{key}'
+
+    def post_sign_url(self, key):
+        return {}
+
+    def put_sign_url(self, key):
+        return f'//{self.bucket_name}/{key}'
+
+    def get_policy(self, *args, **kwargs):
+        return {}
+
+    def iter_objects(self, prefix='', marker=None, delimiter=None, max_keys=100):
+        self.list_calls += 1
+        keys = sorted(k for k in self.objects if k.startswith(prefix) and (marker is None or k > marker)
+                      and not (delimiter and delimiter in k[len(prefix):]))
+        return [{'key': k, 'url': k, 'size': len(self.objects[k])} for k in keys[:min(max_keys, self.page_limit)]]
+
+    def get_object_meta(self, key):
+        if key not in self.objects:
+            raise NotFoundObject()
+        return {'size': len(self.objects[key])}
+
+    def _set_object_headers(self, key, headers):
+        self.headers.setdefault(key, {}).update(headers)
+        return True
+
+    def file_exists(self, key):
+        return key in self.objects
+
+    def download_stream(self, key, **kwargs):
+        self._count('download_stream')
+        if key not in self.objects:
+            raise NotFoundObject()
+        return io.BytesIO(self.objects[key])
+
+    def download_file(self, key, local_name, **kwargs):
+        self._count('download_file')
+        if key not in self.objects:
+            raise NotFoundObject()
+        with open(local_name, 'wb') as f:
+            f.write(self.objects[key])
+
+    def read_range(self, key, start, end):
+        return self.objects[key][start:end + 1]
+
+    def upload_file(self, filepath, key, **kwargs):
+        self._count('upload_file')
+        with open(filepath, 'rb') as f:
+            self.objects[key] = f.read()
+        self.headers[key] = kwargs
+        return self.get_file_url(key)
+
+    def upload_obj(self, file_obj, key, **kwargs):
+        self._count('upload_obj')
+        if isinstance(file_obj, str):
+            file_obj = file_obj.encode()
+        self.objects[key] = bytes(file_obj) if isinstance(file_obj, (bytes, bytearray)) else file_obj.read()
+        self.headers[key] = kwargs
+        return self.get_file_url(key)
+
+    def delete_object(self, key):
+        self.objects.pop(key, None)
+
+    def init_multipart_upload(self, key, content_type=None):
+        self._count('init_multipart_upload')
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {}
+        return upload_id
+
+    def upload_part(self, key, upload_id, part_number, data):
+        self._count('upload_part')
+        self.uploads[upload_id][part_number] = bytes(data)
+        return hashlib.md5(data).hexdigest()
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        self._count('complete_multipart_upload')
+        uploaded = self.uploads.pop(upload_id)
+        self.objects[key] = b''.join(uploaded[part['part_number']] for part in parts)
+        return self.get_file_url(key)
+
+    def abort_multipart_upload(self, key, upload_id):
+        self._count('abort_multipart_upload')
+        self.uploads.pop(upload_id, None)
+
+    def list_parts(self, key, upload_id):
+        return [{'part_number': n, 'etag': hashlib.md5(data).hexdigest(), 'size': len(data)}
+                for n, data in sorted(self.uploads[upload_id].items())]
+
@@ -0,0 +1,49 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: SQL分析器测试，使用sqlite
+"""
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from yzcore.db.profiler import SQLProfiler, statement_shape
+
+
+def test_profile(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/test.db')
+    sql_profiler = SQLProfiler(slow_ms=1000, n_plus_one=3)
+    sql_profiler.install(engine)
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        with sql_profiler.profile('job') as profile:
+            for i in range(3):
+                conn.execute(text('SELECT :i'), {'i': i})
+    assert profile.count == 3
+    assert profile.summary(3)['n_plus_one'] == [{'statement': 'SELECT ?', 'count': 3}]
+    stats = sql_profiler.stats()
+    assert stats['queries'] == 4 and stats['n_plus_one'] == 1
+    assert sorted(s['count'] for s in stats['statements']) == [1, 3]
+    assert sql_profiler.current() is None
+    assert statement_shape('SELECT * FROM a\n WHERE id IN (?, ?, ?)') == 'SELECT * FROM a WHERE id IN (?)'
+    sql_profiler.uninstall(engine)
+    engine.dispose()
+
+
+def test_failed_statement(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/test.db')
+    sql_profiler = SQLProfiler(slow_ms=0)
+    sql_profiler.install(engine)
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text('SELECT * FROM missing'))
+        conn.execute(text('SELECT 1'))
+        # 执行失败的语句不在连接上残留开始时间
+        assert not any(key.startswith('yzcore') for key in conn.info)
+    stats = sql_profiler.stats()
+    assert stats['queries'] == 1 and sql_profiler.slow_queries == 1
+    sql_profiler.uninstall(engine)
+    engine.dispose()
@@ -0,0 +1,145 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: get_db的测试，使用sqlite
+"""
+import time
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from yzcore.db import db_session
+from yzcore.db.sqlalchemy_crud_base import Base
+from yzcore.default_settings import default_setting as settings
+from yzcore.db.sqlalchemy_crud_base import OrmCRUDBase
+from tests.test_sqlalchemy_crud import crud, CachedItem
+
+
+@pytest.fixture
+def db_uri(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'DB_URI', f'sqlite:///{tmp_path}/primary.db')
+    for name in ('_engine', '_session_local', '_replica_set'):
+        monkeypatch.setattr(db_session, name, None)
+    monkeypatch.setattr(db_session, '_pool_metrics', {})
+    yield settings.DB_URI
+    if db_session._engine is not None:
+        db_session._engine.dispose()
+
+
+def test_get_db(db_uri):
+    result = []
+
+    def _run():
+        generator = db_session.get_db()
+        db = next(generator)
+        result.append(db.execute(text('SELECT 1')).scalar())
+        generator.close()
+    # 在线程中执行，加锁出错时不会卡住整个测试
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive(), 'get_db() deadlocked'
+    assert result == [1]
+    assert db_session.get_session_local() is db_session.SessionLocal
+
+
+@pytest.fixture
+def replica_uri(db_uri, tmp_path, monkeypatch):
+    """主库和副本是两个独立的sqlite文件，副本中没有主库写入的数据"""
+    uri = f'sqlite:///{tmp_path}/replica.db'
+    monkeypatch.setattr(settings, 'DB_REPLICA_URIS', [uri])
+    for _uri in (db_uri, uri):
+        engine = create_engine(_uri)
+        Base.metadata.create_all(engine)
+        engine.dispose()
+    yield uri
+    if db_session._replica_set is not None:
+        for engine in db_session._replica_set.engines:
+            engine.dispose()
+
+
+def test_read_after_write(replica_uri):
+    db = db_session.get_session_local()()
+    try:
+        assert crud.list(db) == []  # 只读，发送到副本
+        item = crud.create(db, data={'name': 'a', 'score': 1})  # 提交后refresh需要从主库读取
+        assert item.id and item.name == 'a'
+        item = crud.update(db, model_id=item.id, data={'score': 2}, is_return_obj=True)
+        assert item.score == 2
+        assert [obj.name for obj in crud.list(db)] == ['a']
+    finally:
+        db.close()
+
+    db = db_session.get_session_local()()
+    try:
+        assert crud.list(db) == []  # 新的Session没有写操作，读取副本
+        db.use_primary()
+        assert [obj.name for obj in crud.list(db)] == ['a']
+    finally:
+        db.close()
+
+
+def test_replica_set_created_once(replica_uri):
+    threads = [threading.Thread(target=db_session.get_replica_set) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    replica_set = db_session.get_replica_set()
+    assert len(replica_set.engines) == 1
+    assert db_session.get_session_local().kw['replicas'] is replica_set
+
+
+def test_pool_metrics_per_engine(replica_uri):
+    db = db_session.get_session_local()()
+    try:
+        crud.list(db)
+        crud.create(db, data={'name': 'a'})
+    finally:
+        db.close()
+    metrics = db_session.get_pool_metrics(None)
+    assert set(metrics) == {'primary', 'replica-0'}
+    # 只有一次只读查询发送到副本
+    assert metrics['replica-0']['connects'] == 1 and metrics['primary']['connects'] >= 1
+    assert db_session.get_pool_metrics('async')['connects'] == 0
+
+
+def test_pool_wait_excludes_connect(monkeypatch):
+    monkeypatch.setattr(db_session, '_pool_metrics', {})
+
+    def _connect():
+        time.sleep(0.2)
+        return sqlite3.connect(':memory:', check_same_thread=False)
+    engine = db_session._instrument(create_engine(
+        'sqlite://', creator=_connect, poolclass=db_session.InstrumentedQueuePool, pool_size=1, max_overflow=0))
+    try:
+        with engine.connect():
+            pass
+        engine.dispose()  # 重建连接池后继续统计
+        with engine.connect():
+            pass
+        metrics = db_session.get_pool_metrics()
+    finally:
+        engine.dispose()
+    assert metrics['checkouts'] == metrics['connects'] == 2
+    assert metrics['wait_max'] < 0.1
+
+
+def test_cache_skips_lagging_replica(replica_uri):
+    cached = OrmCRUDBase(CachedItem, cache_ttl=60, cache_size=2)
+    db = db_session.get_session_local()()
+    try:
+        cached.create(db, data={'name': 'a'})
+    finally:
+        db.close()
+    db = db_session.get_session_local()()
+    try:
+        assert cached.list(db) == []  # 副本还没有同步，结果不缓存
+        db.use_primary()
+        assert [obj.name for obj in cached.list(db)] == ['a']
+    finally:
+        db.close()
@@ -0,0 +1,232 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: OrmCRUDBase / AsyncOrmCRUDBase 测试，使用sqlite
+"""
+import time
+import asyncio
+
+import pytest
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from yzcore.db.sqlalchemy_crud_base import Base, OrmCRUDBase, AsyncOrmCRUDBase
+
+
+class Item(Base):
+    id = Column(Integer, primary_key=True)
+    name = Column(String(32), unique=True)
+    group = Column(String(32))
+    score = Column(Integer, default=0)
+
+
+class CachedItem(Base):
+    id = Column(Integer, primary_key=True)
+    name = Column(String(32))
+
+
+crud = OrmCRUDBase(Item)
+async_crud = AsyncOrmCRUDBase(Item)
+
+
+@pytest.fixture()
+def db(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/test.db')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture()
+def async_db_uri(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path}/test.db')
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    return f'sqlite+aiosqlite:///{tmp_path}/test.db'
+
+
+def run_async(async_db_uri, func):
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+    async def _run():
+        engine = create_async_engine(async_db_uri)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            result = await func(session)
+        await engine.dispose()
+        return result
+    # asyncio.run()结束时会把当前事件循环设置为None，影响后续使用get_event_loop()的测试
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(_run())
+    finally:
+        loop.close()
+
+
+def test_crud(db):
+    obj = crud.create(db, data={'name': 'a', 'group': 'g1'})
+    crud.create(db, data={'name': 'b', 'group': 'g1', 'score': 2})
+    assert crud.count(db) == 2
+    assert crud.get(db, obj.id).name == 'a'
+    assert [i.name for i in crud.list(db, sort=['-score'])] == ['b', 'a']
+    assert crud.update(db, model_id=obj.id, data={'score': 5}) == 1
+    assert crud.delete(db, model_id=obj.id) == 1
+    assert crud.count(db, group='g1') == 1
+
+
+def test_async_crud(async_db_uri):
+    async def _test(db):
+        obj = await async_crud.create(db, data={'name': 'a', 'group': 'g1'})
+        await async_crud.create(db, data={'name': 'b', 'group': 'g1', 'score': 2})
+        assert await async_crud.count(db) == 2
+        assert await async_crud.count(db, group='g2') == 0
+        assert (await async_crud.get(db, obj.id)).name == 'a'
+        assert (await async_crud.get_one(db, name='b')).score == 2
+        assert [i.name for i in await async_crud.list(db, sort=['-score'])] == ['b', 'a']
+        assert await async_crud.update(db, model_id=obj.id, data={'score': 5}) == 1
+        updated = await async_crud.update(db, query={'name': 'a'}, data={'score': 6}, is_return_obj=True)
+        assert updated.score == 6
+        assert await async_crud.delete(db, model_id=obj.id) == 1
+        assert await async_crud.bulk_delete(db, group='g1') == 1
+        await db.commit()
+        assert await async_crud.count(db) == 0
+    run_async(async_db_uri, _test)
+
+
+def test_list_by_cursor(db):
+    for i in range(25):
+        crud.create(db, data={'name': f'n{i:02d}', 'group': f'g{i % 2}', 'score': i % 4})
+    sort = ['-score', 'name']
+    expected = [i.name for i in crud.list(db, sort=sort, limit=100)]
+    names, cursor = [], None
+    while True:
+        items, cursor = crud.list_by_cursor(db, sort=sort, cursor=cursor, limit=7)
+        names += [i.name for i in items]
+        if cursor is None:
+            break
+    assert names == expected
+
+    items, cursor = crud.list_by_cursor(db, sort=sort, limit=5, group='g1')
+    assert all(i.group == 'g1' for i in items)
+    with pytest.raises(ValueError):
+        crud.list_by_cursor(db, sort=['name'], cursor=cursor)
+
+
+def test_bulk_create_update(db):
+    rows = [{'name': f'n{i}', 'group': 'g'} for i in range(5)] + [{'name': 'x', 'group': 'g', 'score': 9}]
+    assert crud.bulk_create(db, rows, chunk_size=2) == 6
+    ids = crud.bulk_create(db, [{'name': 'y'}, {'name': 'z', 'score': 1}], returning=True)
+    assert [crud.get(db, i).name for i in ids] == ['y', 'z']
+
+    items = crud.list(db, group='g')
+    rows = [{'id': i.id, 'score': 3} for i in items] + [{'id': ids[0], 'group': 'h'}, {'id': 10 ** 6, 'group': 'h'}]
+    # 返回数据库实际更新的行数，不存在的id不计入
+    assert crud.bulk_update(db, rows, chunk_size=4) == 7
+    db.expire_all()
+    assert crud.count(db, score=3) == 6
+    assert crud.get(db, ids[0]).group == 'h'
+
+
+def test_async_bulk_create(async_db_uri):
+    async def _test(db):
+        ids = await async_crud.bulk_create(db, [{'name': 'a'}, {'name': 'b'}], returning=True)
+        assert await async_crud.bulk_update(db, [{'id': ids[1], 'score': 7}, {'id': 10 ** 6, 'score': 7}]) == 1
+        return (await async_crud.get_one(db, name='b')).score
+    assert run_async(async_db_uri, _test) == 7
+
+
+def test_upsert_many(db):
+    crud.bulk_create(db, [{'name': 'a', 'score': 1}, {'name': 'b', 'score': 1}])
+    rows = [{'name': 'a', 'score': 5, 'group': 'g'}, {'name': 'c', 'score': 5, 'group': 'g'}]
+    assert crud.upsert_many(db, rows, conflict_columns=['name'], update_columns=['score']) == {'inserted': 1, 'updated': 1}
+    db.expire_all()
+    a = crud.get_one(db, name='a')
+    assert (a.score, a.group) == (5, None)
+    assert crud.upsert_many(db, [{'name': 'b', 'score': 9}], conflict_columns=['name'], update_columns=[]) == \
+        {'inserted': 0, 'updated': 1}
+    assert crud.get_one(db, name='b').score == 1
+    assert crud.count(db) == 3
+
+
+def test_query_cache(db):
+    cached = OrmCRUDBase(CachedItem, cache_ttl=60, cache_size=2)
+    obj = cached.create(db, data={'name': 'a'})
+    assert cached.get(db, obj.id).name == 'a'
+    assert cached.count(db) == 1
+    db.expunge_all()
+    assert cached.get(db, obj.id).name == 'a'
+    assert cached.cache.stats()['hits'] == 1
+
+    # 另一个CRUD对象的写入也会清空缓存
+    OrmCRUDBase(CachedItem).update(db, model_id=obj.id, data={'name': 'b'})
+    assert cached.get_one(db, id=obj.id).name == 'b'
+    assert cached.count(db) == 1
+    # 命中缓存时返回Session中已有的对象，不覆盖未提交的修改
+    obj = cached.get(db, obj.id)
+    obj.name = 'c'
+    assert cached.get(db, obj.id) is obj and obj.name == 'c'
+    db.rollback()
+    # dict结果返回副本
+    row = cached.get_one(db, row_type='dict', id=obj.id)
+    row['name'] = 'x'
+    assert cached.get_one(db, row_type='dict', id=obj.id) == {'id': obj.id, 'name': 'b'}
+    # 同一个Session多次写入只注册一次事件
+    listeners = len(db.dispatch.after_transaction_end)
+    cached.create(db, data={'name': 'd'})
+    cached.create(db, data={'name': 'e'})
+    assert len(db.dispatch.after_transaction_end) == listeners
+
+    obj_id = obj.id
+    cached.delete(db, model_id=obj_id)
+    assert cached.get(db, obj_id) is None
+    assert cached.cache.stats()['size'] <= 2
+
+    # 同一模型的CRUD对象共用缓存，各自按cache_ttl判断过期
+    short = OrmCRUDBase(CachedItem, cache_ttl=0.05, cache_size=1)
+    assert short.cache is cached.cache and cached.cache.max_size == 2
+    assert short.count(db) == cached.count(db) == 2
+    time.sleep(0.1)
+    hits = cached.cache.hits
+    assert cached.count(db) == 2 and cached.cache.hits == hits + 1
+    assert short.count(db) == 2 and cached.cache.hits == hits + 1
+
+
+def test_list_with_total(db):
+    crud.bulk_create(db, [{'name': f'n{i}', 'group': f'g{i % 2}', 'score': i} for i in range(7)])
+    items, total = crud.list_with_total(db, sort=['-score'], offset=1, limit=2, group='g0')
+    assert ([i.name for i in items], total) == (['n4', 'n2'], 4)
+    assert crud.list_with_total(db, offset=10, limit=2) == ([], 7)
+    assert crud.list_with_total(db, group='x') == ([], 0)
+
+
+def test_iter_list(db):
+    crud.bulk_create(db, [{'name': f'n{i}', 'score': i} for i in range(5)])
+    assert [i.name for i in crud.iter_list(db, sort=['-score'], batch_size=2)] == ['n4', 'n3', 'n2', 'n1', 'n0']
+    assert list(crud.iter_list(db, row_type='tuple', name='n1')) == [(2, 'n1', None, 1)]
+    assert next(crud.iter_list(db, row_type='dict', sort=['id'])) == {'id': 1, 'name': 'n0', 'group': None, 'score': 0}
+
+
+def test_columns_and_row_type(db):
+    crud.bulk_create(db, [{'name': f'n{i}', 'group': 'g', 'score': i} for i in range(3)])
+    assert crud.get(db, 2, columns=['name'], row_type='tuple') == ('n1',)
+    assert crud.get_one(db, name='n2', columns=['id', 'score'], row_type='dict') == {'id': 3, 'score': 2}
+    assert crud.list(db, sort=['-score'], limit=2, columns=['name'], row_type='tuple') == [('n2',), ('n1',)]
+    items = crud.list(db, sort=['score'], columns=['name'])
+    assert [i.name for i in items] == ['n0', 'n1', 'n2'] and 'score' not in items[0].__dict__
+    assert crud.list_with_total(db, limit=1, columns=['name'], row_type='dict') == ([{'name': 'n0'}], 3)
+    with pytest.raises(ValueError):
+        crud.list(db, row_type='json')
+
+
+def test_update_return_obj(db):
+    obj = crud.create(db, data={'name': 'a', 'group': 'g'})
+    crud.create(db, data={'name': 'b', 'group': 'g'})
+    updated = crud.update(db, model_id=obj.id, data={'score': 3, 'unknown': 1}, is_return_obj=True)
+    assert updated is obj and obj.score == 3
+    assert crud.update(db, model_id=100, data={'score': 3}, is_return_obj=True) is None
+    assert crud.update_by_query(db, {'score': 7}, group='g') == 2
+    assert crud.update_by_query(db, {'group': 'h'}, ids=[obj.id]) == 1
+    assert [(i.group, i.score) for i in crud.list(db, sort=['id'])] == [('h', 7), ('g', 7)]
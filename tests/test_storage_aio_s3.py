@@ -0,0 +1,102 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: AioS3Manager上传下载的测试，S3服务由本地的aiohttp服务模拟
+"""
+import io
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip('aiohttp')
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from yzcore.extensions.storage.aio_s3 import AioS3Manager
+from yzcore.extensions.storage.schemas import AioS3Config
+from yzcore.request import AioHTTP
+
+
+class ReadRecorder(io.BytesIO):
+    """记录read()所在的线程"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.threads = set()
+
+    def read(self, size=-1):
+        self.threads.add(threading.get_ident())
+        return super().read(size)
+
+
+def run(func, timeout=1):
+    objects = {}
+
+    async def _put(request):
+        objects[request.match_info['key']] = (await request.read(), request.headers.get('Content-Length'))
+        return web.Response(headers={'ETag': '"etag"'})
+
+    async def _get(request):
+        """分块慢速返回，总耗时超过请求的超时时间"""
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for i in range(3):
+            if i:
+                await asyncio.sleep(timeout * 0.6)
+            await response.write(b'%d' % i)
+        await response.write_eof()
+        return response
+
+    async def _head(request):
+        await asyncio.sleep(timeout * 1.5)
+        return web.Response()
+
+    async def _run():
+        app = web.Application(client_max_size=10 * 1024 * 1024)
+        app.router.add_put('/bucket/{key:.+}', _put)
+        app.router.add_head('/bucket/{key:.+}', _head)
+        app.router.add_get('/bucket/{key:.+}', _get, allow_head=False)
+        server = TestServer(app)
+        await server.start_server()
+        storage = AioS3Manager(AioS3Config(
+            mode='minio', access_key_id='ak', access_key_secret='sk', bucket_name='bucket', scheme='http',
+            endpoint=f'{server.host}:{server.port}', timeout=timeout))
+        try:
+            return await func(storage, objects)
+        finally:
+            await AioHTTP.close()
+            await server.close()
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(_run())
+    finally:
+        loop.close()
+
+
+def test_upload_file_obj_off_loop():
+    data = b'x' * (3 * 1024 * 1024 + 1)
+
+    async def _test(storage, objects):
+        file_obj = ReadRecorder(data)
+        file_obj.seek(1)
+        await storage.upload_obj(file_obj, 'a.bin')
+        assert threading.get_ident() not in file_obj.threads
+        await storage.upload_obj(b'bytes', 'b.bin')
+        return objects
+    objects = run(_test)
+    assert objects['a.bin'] == (data[1:], str(len(data) - 1))
+    assert objects['b.bin'][0] == b'bytes'
+
+
+def test_stream_timeout():
+    async def _test(storage, objects):
+        # 流式下载的总耗时超过timeout，但每次读取的间隔没有超过
+        chunks = [chunk async for chunk in storage.download_stream('a.bin')]
+        assert b''.join(chunks) == b'012'
+        assert await storage.get_object('a.bin') == b'012'
+        with pytest.raises(asyncio.TimeoutError):
+            await storage.get_object_meta('a.bin')
+    run(_test)
@@ -0,0 +1,96 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: 对象存储文件遍历和流式打包的测试，使用内存中的存储
+"""
+import io
+import asyncio
+import zipfile
+import tarfile
+from types import SimpleNamespace
+
+from botocore.stub import Stubber
+from starlette.responses import StreamingResponse
+
+from yzcore.extensions.storage.amazon import S3Manager
+from yzcore.extensions.storage.archive import ArchiveStreamer
+from yzcore.extensions.storage.base import StorageManagerBase
+from yzcore.extensions.storage.minio import MinioManager
+from yzcore.extensions.storage.schemas import MinioConfig, S3Config
+from tests.memory_storage import CONF, MemoryStorage
+
+
+OBJECTS = {f'p/{i}.txt': f'file {i}'.encode() for i in range(5)}
+OBJECTS.update({'p/a/b/c.txt': b'nested', 'p/a/': b'', 'q/other.txt': b'other'})
+
+
+def test_walk_objects_pages():
+    storage = MemoryStorage(OBJECTS)
+    keys = [obj['key'] for obj in storage.walk_objects('p/', page_size=100)]
+    assert keys == sorted(k for k in OBJECTS if k.startswith('p/'))
+    assert [obj['key'] for obj in storage.walk_objects('p/', start_after='p/3.txt')] == ['p/4.txt', 'p/a/', 'p/a/b/c.txt']
+
+
+def test_archive_prefix():
+    storage = MemoryStorage(OBJECTS)
+    data = b''.join(ArchiveStreamer(storage, prefix='p/', fmt='zip'))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert sorted(archive.namelist()) == ['0.txt', '1.txt', '2.txt', '3.txt', '4.txt', 'a/b/c.txt']
+        assert archive.read('a/b/c.txt') == b'nested'
+
+    data = b''.join(ArchiveStreamer(storage, prefix='p/', fmt='tar'))
+    with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+        assert len(archive.getnames()) == 6
+
+
+def test_archive_streaming_response():
+    storage = MemoryStorage(OBJECTS)
+    streamer = ArchiveStreamer(storage, prefix='p/', fmt='zip')
+    response = StreamingResponse(streamer, media_type=streamer.media_type)
+
+    async def _read():
+        return b''.join([chunk async for chunk in response.body_iterator])
+    loop = asyncio.new_event_loop()
+    try:
+        data = loop.run_until_complete(_read())
+    finally:
+        loop.close()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert len(archive.namelist()) == 6 and archive.read('0.txt') == b'file 0'
+
+
+def test_check_liveness():
+    storage = MemoryStorage(OBJECTS)
+    assert storage.check('liveness', ttl=60)
+    assert storage.list_calls == 1
+    assert storage.check('liveness', ttl=60) and storage.list_calls == 1
+    # 密钥不同时不使用缓存的结果
+    storage = MemoryStorage(OBJECTS, access_key_secret='other')
+    assert storage.check('liveness', ttl=60) and storage.list_calls == 1
+    assert all('other' not in map(str, key) for key in StorageManagerBase._check_cache)
+
+
+def test_s3_walk_objects():
+    storage = S3Manager(S3Config(mode='s3', **CONF))
+    with Stubber(storage.client) as stubber:
+        stubber.add_response('list_objects_v2', {
+            'IsTruncated': True, 'NextContinuationToken': 't', 'Contents': [{'Key': 'p/a', 'Size': 1}]},
+            {'Bucket': 'bucket', 'Prefix': 'p/', 'MaxKeys': 1, 'StartAfter': 'p/0'})
+        stubber.add_response('list_objects_v2', {
+            'IsTruncated': False, 'Contents': [{'Key': 'p/b/c', 'Size': 2}]},
+            {'Bucket': 'bucket', 'Prefix': 'p/', 'MaxKeys': 1, 'StartAfter': 'p/0', 'ContinuationToken': 't'})
+        assert [obj['key'] for obj in storage.walk_objects('p/', start_after='p/0', page_size=1)] == ['p/a', 'p/b/c']
+
+
+def test_minio_walk_objects_recursive():
+    storage = MinioManager(MinioConfig(mode='minio', **CONF))
+    calls = []
+
+    def list_objects(bucket_name, **kwargs):
+        calls.append(kwargs)
+        return [SimpleNamespace(object_name='p/a/b.txt', size=1)]
+    storage.minioClient = SimpleNamespace(list_objects=list_objects)
+    assert [obj['key'] for obj in storage.walk_objects('p/')] == ['p/a/b.txt']
+    assert calls == [{'prefix': 'p/', 'recursive': True, 'start_after': None}]
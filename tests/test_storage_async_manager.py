@@ -0,0 +1,113 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: AsyncStorageManager线程池的统计、排队上限、取消，以及迭代器/文件流方法的测试
+"""
+import asyncio
+import logging
+import threading
+
+import pytest
+
+from yzcore.extensions.storage.async_manager import AsyncStorageManager, AsyncStream
+from tests.memory_storage import MemoryStorage
+
+
+def get_manager(mode, objects=None, **kwargs):
+    """每个测试使用独立的mode，线程池互不影响"""
+    storage = MemoryStorage(objects)
+    storage.mode = mode
+    return AsyncStorageManager(storage, **kwargs)
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def _wait_until(predicate):
+    for _ in range(200):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError('condition not reached')
+
+
+def test_queue_limit_and_stats():
+    manager = get_manager('async-queue', max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def _test():
+        tasks = [asyncio.ensure_future(manager.run(release.wait)) for _ in range(3)]
+        pool = manager._pool
+        await _wait_until(lambda: pool.active == 1 and pool.queued == 1 and pool.waiting == 1)
+        stats = AsyncStorageManager.stats()['async-queue']
+        assert stats['utilization'] == 1 and stats['max_queue'] == 1
+        release.set()
+        assert await asyncio.gather(*tasks) == [True] * 3
+        await _wait_until(lambda: pool.completed == 3)
+        return AsyncStorageManager.stats()['async-queue']
+    stats = run(_test())
+    assert stats['active'] == stats['queued'] == stats['waiting'] == 0
+
+
+def test_cancel_and_timeout():
+    manager = get_manager('async-cancel', max_workers=1, max_queue=2)
+    release = threading.Event()
+
+    async def _test():
+        running = asyncio.ensure_future(manager.run(release.wait))
+        queued = asyncio.ensure_future(manager.run(release.wait))
+        pool = manager._pool
+        await _wait_until(lambda: pool.active == 1 and pool.queued == 1)
+        # 排队中的任务被取消后不会再执行
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        await _wait_until(lambda: pool.cancelled == 1 and pool.queued == 0)
+        with pytest.raises(asyncio.TimeoutError):
+            await manager.run(release.wait, timeout=0.05)
+        release.set()
+        await running
+        await _wait_until(lambda: pool.active == 0)
+        return pool.stats()
+    stats = run(_test())
+    # 超时的调用还在排队，同样被取消
+    assert stats['cancelled'] == 2 and stats['timeouts'] == 1 and stats['completed'] == 1
+
+
+def test_loop_closed_before_task_done(caplog):
+    manager = get_manager('async-closed', max_workers=1)
+    release = threading.Event()
+
+    async def _test():
+        with pytest.raises(asyncio.TimeoutError):
+            await manager.run(release.wait, timeout=0.05)
+    run(_test())
+    with caplog.at_level(logging.ERROR):
+        release.set()
+        manager._pool.executor.submit(lambda: None).result()
+    assert not caplog.records
+
+
+def test_iterator_and_stream_methods():
+    objects = {f'p/{i}.txt': b'%d' % i for i in range(5)}
+    manager = get_manager('async-stream', objects)
+    loop_thread = threading.get_ident()
+
+    async def _test():
+        keys = [obj['key'] async for obj in manager.walk_objects('p/')]
+        assert keys == sorted(objects)
+        stream = await manager.download_stream('p/1.txt')
+        assert isinstance(stream, AsyncStream) and await stream.read() == b'1'
+        async with await manager.download('p/2.txt', is_stream=True) as stream:
+            assert b''.join([chunk async for chunk in stream]) == b'2'
+        assert await manager.file_exists('p/3.txt')
+    run(_test())
+    assert manager.storage_manage.calls['download_stream'] == 2
+    assert threading.get_ident() == loop_thread
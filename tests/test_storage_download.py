@@ -0,0 +1,42 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: StorageManagerBase.download的并发下载测试，使用内存中的存储
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tests.memory_storage import MemoryStorage
+
+
+class SlowStorage(MemoryStorage):
+
+    def download_file(self, key, local_name, **kwargs):
+        time.sleep(0.2)  # 保证其他调用方在下载完成前进入等待
+        return super().download_file(key, local_name, **kwargs)
+
+
+def test_single_flight(tmpdir):
+    storage = SlowStorage({'a/b.txt': b'data'}, cache_path=str(tmpdir))
+    barrier = threading.Barrier(8)
+
+    def _download(_):
+        barrier.wait()
+        return storage.download('a/b.txt')
+    with ThreadPoolExecutor(8) as executor:
+        results = set(executor.map(_download, range(8)))
+
+    assert results == {os.path.join(str(tmpdir), 'a/b.txt')}
+    assert storage.calls['download_file'] == 1
+    with open(results.pop(), 'rb') as f:
+        assert f.read() == b'data'
+    # 锁文件的数量固定，不随key增长
+    lock_dir = os.path.join(str(tmpdir), '.yzcore_download_locks')
+    storage = MemoryStorage({f'k/{i}': b'' for i in range(100)}, cache_path=str(tmpdir))
+    for i in range(100):
+        storage.download(f'k/{i}')
+    assert len(os.listdir(lock_dir)) <= storage._download_lock_count
@@ -0,0 +1,221 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: 各对象存储分片上传接口的测试，SDK客户端替换为内存中的实现，S3使用botocore的Stubber
+"""
+import hashlib
+from types import SimpleNamespace
+
+from botocore.stub import Stubber, ANY
+
+from yzcore.extensions.storage.amazon import S3Manager
+from yzcore.extensions.storage.azure import AzureManager
+from yzcore.extensions.storage.minio import MinioManager
+from yzcore.extensions.storage.obs import ObsManager
+from yzcore.extensions.storage.oss import OssManager
+from yzcore.extensions.storage.schemas import AzureConfig, MinioConfig, ObsConfig, OssConfig, S3Config
+from tests.memory_storage import CONF
+
+
+KEY = 'a/b.glb'
+CONTENT_TYPE = 'model/gltf-binary'
+AZURE_CONF = dict(CONF, account_name='account', account_key='a2V5', connection_string=(
+    'DefaultEndpointsProtocol=https;AccountName=account;AccountKey=a2V5;EndpointSuffix=core.windows.net'))
+
+
+class FakeMultipart(object):
+    """分片上传的内存实现，各SDK的假客户端在此基础上转换参数"""
+
+    def __init__(self):
+        self.uploads = {}  # upload_id -> (key, content_type, {part_number: data})
+        self.objects = {}
+        self.content_types = {}
+        self.aborted = []
+
+    def _init(self, key, content_type):
+        upload_id = f'upload-{len(self.uploads) + len(self.aborted)}'
+        self.uploads[upload_id] = (key, content_type, {})
+        return upload_id
+
+    def _part(self, upload_id, part_number, data):
+        self.uploads[upload_id][2][part_number] = data
+        return hashlib.md5(data).hexdigest()
+
+    def _parts(self, upload_id):
+        return [(n, hashlib.md5(data).hexdigest(), len(data)) for n, data in sorted(self.uploads[upload_id][2].items())]
+
+    def _complete(self, upload_id, part_etags):
+        key, content_type, parts = self.uploads.pop(upload_id)
+        assert all(hashlib.md5(parts[n]).hexdigest() == etag for n, etag in part_etags)
+        self.objects[key] = b''.join(parts[n] for n, _ in part_etags)
+        self.content_types[key] = content_type
+
+    def _abort(self, upload_id):
+        self.uploads.pop(upload_id)
+        self.aborted.append(upload_id)
+
+
+class FakeOssBucket(FakeMultipart):
+
+    def init_multipart_upload(self, key, headers):
+        return SimpleNamespace(upload_id=self._init(key, headers['Content-Type']))
+
+    def upload_part(self, key, upload_id, part_number, data):
+        return SimpleNamespace(etag=self._part(upload_id, part_number, data))
+
+    def list_parts(self, key, upload_id, marker, max_parts, headers):
+        parts = [SimpleNamespace(part_number=n, etag=etag, size=size) for n, etag, size in self._parts(upload_id)]
+        return SimpleNamespace(parts=parts, is_truncated=False, next_marker='')
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        self._complete(upload_id, [(part.part_number, part.etag) for part in parts])
+        return SimpleNamespace(status=200)
+
+    def abort_multipart_upload(self, key, upload_id):
+        self._abort(upload_id)
+
+
+class FakeObsClient(FakeMultipart):
+
+    @staticmethod
+    def _resp(**body):
+        return SimpleNamespace(status=200, body=SimpleNamespace(**body))
+
+    def initiateMultipartUpload(self, bucket_name, key, contentType):
+        return self._resp(uploadId=self._init(key, contentType))
+
+    def uploadPart(self, bucket_name, key, part_number, upload_id, content):
+        return self._resp(etag=self._part(upload_id, part_number, content))
+
+    def listParts(self, bucket_name, key, upload_id, partNumberMarker=None):
+        parts = [SimpleNamespace(partNumber=n, etag=etag, size=size) for n, etag, size in self._parts(upload_id)]
+        return self._resp(parts=parts, isTruncated=False)
+
+    def completeMultipartUpload(self, bucket_name, key, upload_id, request):
+        self._complete(upload_id, [(part.partNum, part.etag) for part in request.parts])
+        return self._resp()
+
+    def abortMultipartUpload(self, bucket_name, key, upload_id):
+        self._abort(upload_id)
+        return self._resp()
+
+
+class FakeMinioClient(FakeMultipart):
+
+    def _create_multipart_upload(self, bucket_name, key, headers):
+        return self._init(key, headers['Content-Type'])
+
+    def _upload_part(self, bucket_name, key, data, headers, upload_id, part_number):
+        return self._part(upload_id, part_number, data)
+
+    def _list_parts(self, bucket_name, key, upload_id, part_number_marker=None):
+        parts = [SimpleNamespace(part_number=n, etag=etag, size=size) for n, etag, size in self._parts(upload_id)]
+        return SimpleNamespace(parts=parts, is_truncated=False)
+
+    def _complete_multipart_upload(self, bucket_name, key, upload_id, parts):
+        self._complete(upload_id, [(part.part_number, part.etag) for part in parts])
+
+    def _abort_multipart_upload(self, bucket_name, key, upload_id):
+        self._abort(upload_id)
+
+
+class FakeAzureContainer(object):
+    """azure按blob保存未提交的block，提交时按block_id组装"""
+
+    def __init__(self):
+        self.blocks = {}  # key -> {block_id: data}
+        self.objects = {}
+        self.content_types = {}
+
+    def get_blob_client(self, blob):
+        container = self
+
+        class BlobClient(object):
+
+            def stage_block(self, block_id, data, length):
+                container.blocks.setdefault(blob, {})[block_id] = data
+
+            def get_block_list(self, block_list_type):
+                blocks = container.blocks.get(blob, {})
+                return [], [SimpleNamespace(id=block_id, size=len(data)) for block_id, data in blocks.items()]
+
+            def commit_block_list(self, blocks, content_settings):
+                staged = container.blocks.pop(blob)
+                container.objects[blob] = b''.join(staged[block.id] for block in blocks)
+                container.content_types[blob] = content_settings.content_type
+        return BlobClient()
+
+
+def _check_multipart(storage, fake, complete_storage=None):
+    """complete_storage: 完成上传的控制器，用于模拟由另一个进程完成上传"""
+    upload_id = storage.init_multipart_upload(KEY, content_type=CONTENT_TYPE)
+    etags = [storage.upload_part(KEY, upload_id, n, data) for n, data in ((2, b'cd'), (1, b'ab'))]
+    parts = (complete_storage or storage).list_parts(KEY, upload_id)
+    assert [(part['part_number'], part['etag'], part['size']) for part in parts] == [
+        (1, etags[1], 2), (2, etags[0], 2)]
+    (complete_storage or storage).complete_multipart_upload(KEY, upload_id, parts)
+    assert fake.objects[KEY] == b'abcd' and fake.content_types[KEY] == CONTENT_TYPE
+
+    # 不指定content_type时按后缀判断
+    upload_id = storage.init_multipart_upload('c.json')
+    assert storage.abort_multipart_upload('c.json', upload_id)
+    return upload_id
+
+
+def test_oss_multipart():
+    storage = OssManager(OssConfig(mode='oss', **CONF))
+    storage.bucket = fake = FakeOssBucket()
+    upload_id = _check_multipart(storage, fake)
+    assert fake.aborted == [upload_id]
+
+
+def test_obs_multipart():
+    storage = ObsManager(ObsConfig(mode='obs', **CONF))
+    storage.obsClient = fake = FakeObsClient()
+    upload_id = _check_multipart(storage, fake)
+    assert fake.aborted == [upload_id]
+
+
+def test_minio_multipart():
+    storage = MinioManager(MinioConfig(mode='minio', **CONF))
+    storage.minioClient = fake = FakeMinioClient()
+    upload_id = _check_multipart(storage, fake)
+    assert fake.aborted == [upload_id]
+
+
+def test_azure_multipart_across_instances():
+    storage = AzureManager(AzureConfig(mode='azure', **AZURE_CONF))
+    other = AzureManager(AzureConfig(mode='azure', **AZURE_CONF))
+    storage.container_client = other.container_client = fake = FakeAzureContainer()
+    _check_multipart(storage, fake, complete_storage=other)
+    # 同一个blob的block_id长度一致，与content_type无关
+    first = storage.init_multipart_upload(KEY, content_type=CONTENT_TYPE)
+    second = storage.init_multipart_upload(KEY)
+    assert len(storage._block_id(first, 1)) == len(storage._block_id(second, 1))
+    storage.upload_part(KEY, first, 1, b'a')
+    storage.upload_part(KEY, second, 1, b'b')
+    assert [part['size'] for part in storage.list_parts(KEY, second)] == [1]
+    assert storage.list_parts(KEY, second)[0]['etag'] == storage._block_id(second, 1)
+
+
+def test_s3_multipart():
+    storage = S3Manager(S3Config(mode='s3', **CONF))
+    params = {'Bucket': 'bucket', 'Key': KEY}
+    with Stubber(storage.client) as stubber:
+        stubber.add_response('create_multipart_upload', {'UploadId': 'u1'}, dict(params, ContentType=CONTENT_TYPE))
+        for n in (2, 1):
+            stubber.add_response('upload_part', {'ETag': f'"e{n}"'}, dict(params, UploadId='u1', PartNumber=n, Body=ANY))
+        stubber.add_response('list_parts', {'IsTruncated': False, 'Parts': [
+            {'PartNumber': 1, 'ETag': '"e1"', 'Size': 2}, {'PartNumber': 2, 'ETag': '"e2"', 'Size': 2}]},
+            dict(params, UploadId='u1'))
+        stubber.add_response('complete_multipart_upload', {}, dict(params, UploadId='u1', MultipartUpload={'Parts': [
+            {'PartNumber': 1, 'ETag': '"e1"'}, {'PartNumber': 2, 'ETag': '"e2"'}]}))
+        stubber.add_response('create_multipart_upload', {'UploadId': 'u2'},
+                             {'Bucket': 'bucket', 'Key': 'c.json', 'ContentType': storage.parse_content_type('c.json')})
+        stubber.add_response('abort_multipart_upload', {}, {'Bucket': 'bucket', 'Key': 'c.json', 'UploadId': 'u2'})
+
+        fake = SimpleNamespace(objects={KEY: b'abcd'}, content_types={KEY: CONTENT_TYPE})
+        assert _check_multipart(storage, fake) == 'u2'
+        stubber.assert_no_pending_responses()
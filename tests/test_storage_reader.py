@@ -0,0 +1,41 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: StorageObjectReader的测试
+"""
+import pytest
+
+from yzcore.extensions.storage.reader import StorageObjectReader
+
+
+class RangeStorage(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+
+    def read_range(self, key, start, end):
+        self.calls += 1
+        return self.data[start:end + 1]
+
+
+def test_read_blocks():
+    storage = RangeStorage(bytes(range(100)))
+    reader = StorageObjectReader(storage, 'a', size=100, block_size=16)
+    reader.seek(10)
+    assert reader.read(30) == bytes(range(10, 40))
+    assert reader.read() == bytes(range(40, 100))
+    assert reader.read(1) == b''
+
+
+def test_short_object():
+    """文件比声明的size短时抛出IOError而不是死循环"""
+    reader = StorageObjectReader(RangeStorage(b'abcdef'), 'a', size=10, block_size=4, read_ahead=0)
+    assert reader.read(4) == b'abcd'
+    with pytest.raises(IOError):
+        reader.read()
+    reader = StorageObjectReader(RangeStorage(b''), 'a', size=10, block_size=4)
+    with pytest.raises(IOError):
+        reader.read(1)
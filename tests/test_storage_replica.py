@@ -0,0 +1,87 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: ReplicatedStorageManager选择副本的测试
+"""
+from yzcore.extensions.storage.replica import ReplicatedStorageManager
+from tests.memory_storage import MemoryStorage
+
+
+class FakeStorage(object):
+
+    def __init__(self, name):
+        self.mode, self.endpoint, self.bucket_name = 'minio', name, 'bucket'
+        self.available = True
+
+    def is_exist_bucket(self):
+        if not self.available:
+            raise ConnectionError('unreachable')
+        return True
+
+    def file_exists(self, key):
+        return True
+
+    def get_sign_url(self, key):
+        return f'{self.endpoint}/{key}'
+
+
+class StrictStorage(MemoryStorage):
+    """upload_file只接受关键字参数，与OssManager一致"""
+
+    def upload_file(self, filepath, key, *, num_threads=2, multipart_threshold=None):
+        return super().upload_file(filepath, key)
+
+
+def get_storage():
+    storage = ReplicatedStorageManager(FakeStorage('primary'), [FakeStorage('replica')], probe_interval=3600)
+    storage._last_probe = float('inf')  # 不在后台测量
+    return storage
+
+
+def test_failed_probe_recovers():
+    storage = get_storage()
+    primary, replica = storage.primary, storage.replicas[0]
+    primary.record(0.2)
+    replica.record(0.05)
+    replica.storage_manage.available = False
+    storage.probe()
+    assert replica.latency < primary.latency and not replica.healthy
+    assert storage.get_sign_url('a') == 'primary/a'
+    assert storage.latency()[replica.name] is None
+
+    replica.storage_manage.available = True
+    storage.probe()
+    primary.latency, replica.latency = 0.2, 0.05
+    assert replica.healthy and storage.get_sign_url('a') == 'replica/a'
+
+
+def test_unmeasured_or_failed_primary():
+    storage = get_storage()
+    assert storage.get_sign_url('a') == 'primary/a'  # 都未测量
+    storage.replicas[0].record(0.05)
+    assert storage.get_sign_url('a') == 'replica/a'
+    storage.primary.record(0.01)
+    assert storage.get_sign_url('a') == 'primary/a'
+    storage.primary.record_failure()
+    assert storage.get_sign_url('a') == 'replica/a'
+
+
+def test_replicate_drops_upload_kwargs(tmpdir):
+    filepath = tmpdir.join('a.glb')
+    filepath.write(b'model')
+    primary, replica = MemoryStorage(cache_path=str(tmpdir)), StrictStorage()
+    storage = ReplicatedStorageManager(primary, [replica], probe_interval=3600)
+    storage._last_probe = float('inf')
+    try:
+        storage.upload(str(filepath), 'a.glb', content_type='model/gltf-binary')
+        assert storage.wait_replicated('a.glb', timeout=5)
+        storage.upload_obj(b'plain', 'b.txt')
+        storage.upload_file(str(filepath), 'c.glb')
+        assert storage.wait_replicated('b.txt', timeout=5) and storage.wait_replicated('c.glb', timeout=5)
+    finally:
+        storage.shutdown()
+    assert replica.objects == {'a.glb': b'model', 'b.txt': b'plain', 'c.glb': b'model'}
+    assert replica.headers['a.glb'] == {'content_type': 'model/gltf-binary'}
+    assert replica.calls['upload_file'] == 1  # 没有content_type时仍然走upload_file
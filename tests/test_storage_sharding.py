@@ -0,0 +1,99 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: ShardedStorageManager的翻页和兼容未分片文件的测试
+"""
+from types import SimpleNamespace
+
+from botocore.stub import Stubber
+
+from yzcore.exceptions import NotFoundObject
+from yzcore.extensions.storage.amazon import S3Manager
+from yzcore.extensions.storage.minio import MinioManager
+from yzcore.extensions.storage.schemas import MinioConfig, S3Config
+from yzcore.extensions.storage.sharding import ShardedKeyLayout, ShardedStorageManager
+from tests.memory_storage import CONF, MemoryStorage
+
+
+def get_storage():
+    storage = ShardedStorageManager(MemoryStorage({}), ShardedKeyLayout(['hot/'], shards=4))
+    keys = [f'hot/{i:02d}.txt' for i in range(20)] + ['hot/sub/a.txt']
+    for key in keys:
+        storage.upload_obj(key.encode(), key)
+    # 分片之前写入的文件
+    storage.storage_manage.objects.update({'hot/legacy.txt': b'legacy', 'other/a.txt': b'a'})
+    return storage, sorted(keys + ['hot/legacy.txt'])
+
+
+def test_iter_objects_pages():
+    storage, keys = get_storage()
+    assert all(key not in storage.storage_manage.objects for key in keys[:-2])
+    result, marker = [], None
+    while True:
+        page = storage.iter_objects('hot/', marker=marker, max_keys=4)
+        if not page:
+            break
+        result.extend(obj['key'] for obj in page)
+        marker = page[-1]['key']
+    assert result == keys
+    assert [obj['key'] for obj in storage.walk_objects('hot/', start_after='hot/17.txt')] == keys[18:]
+    assert [obj['key'] for obj in storage.iter_objects('hot/', delimiter='/', max_keys=100)] == \
+        [key for key in keys if key != 'hot/sub/a.txt']
+    assert storage.iter_objects('hot/', marker='hz') == []
+
+
+def test_listing_cost_and_parent_prefix():
+    storage, keys = get_storage()
+    listed = []
+    iter_objects = storage.storage_manage.iter_objects
+
+    def _iter_objects(*args, **kwargs):
+        page = iter_objects(*args, **kwargs)
+        listed.extend(obj['key'] for obj in page)
+        return page
+    storage.storage_manage.iter_objects = _iter_objects
+    assert [obj['key'] for obj in storage.walk_objects('hot/')] == keys
+    # 兼容未分片文件的列出跳过分片目录，每个分片目录最多多取一页
+    assert len(listed) <= len(keys) + storage.layout.shards * MemoryStorage.page_limit
+
+    # 前缀比热点前缀短时同样按原始key排序
+    assert [obj['key'] for obj in storage.walk_objects('')] == keys + ['other/a.txt']
+    assert [obj['key'] for obj in storage.iter_objects('', marker='hot/05.txt', max_keys=3)] == keys[6:9]
+    assert [obj['key'] for obj in storage.iter_objects('h', marker='hot/sub/a.txt')] == []
+
+
+def test_fallback_unsharded():
+    storage, _ = get_storage()
+    assert storage.download_stream('hot/00.txt').read() == b'hot/00.txt'
+    assert storage.download_stream('hot/legacy.txt').read() == b'legacy'
+    assert storage.get_sign_url('hot/legacy.txt') == '//bucket/hot/legacy.txt'
+    assert storage.get_sign_url('hot/00.txt') == f'//bucket/{storage.layout.shard_key("hot/00.txt")}'
+    assert storage.file_exists('hot/legacy.txt')
+    storage.delete_object('hot/legacy.txt')
+    assert not storage.file_exists('hot/legacy.txt')
+    try:
+        storage.download_stream('hot/legacy.txt')
+    except NotFoundObject:
+        pass
+    else:
+        raise AssertionError('NotFoundObject not raised')
+
+
+def test_backend_marker():
+    s3 = S3Manager(S3Config(mode='s3', **CONF))
+    with Stubber(s3.client) as stubber:
+        stubber.add_response('list_objects_v2', {'Contents': [{'Key': 'p/b', 'Size': 1}]},
+                             {'Bucket': 'bucket', 'Prefix': 'p/', 'Delimiter': '', 'MaxKeys': 2, 'StartAfter': 'p/a'})
+        assert [obj['key'] for obj in s3.iter_objects('p/', marker='p/a', max_keys=2)] == ['p/b']
+
+    minio = MinioManager(MinioConfig(mode='minio', **CONF))
+    calls = []
+
+    def list_objects(bucket_name, **kwargs):
+        calls.append(kwargs)
+        return (SimpleNamespace(object_name=f'p/{i}', size=1) for i in range(10))
+    minio.minioClient = SimpleNamespace(list_objects=list_objects)
+    assert [obj['key'] for obj in minio.iter_objects('p/', marker='p/a', max_keys=2)] == ['p/0', 'p/1']
+    assert calls == [{'prefix': 'p/', 'start_after': 'p/a'}]
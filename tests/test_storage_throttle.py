@@ -0,0 +1,92 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: 对象存储传输限速的测试
+"""
+import time
+import threading
+
+from yzcore.extensions.storage.oss import OssManager
+from yzcore.extensions.storage.schemas import OssConfig
+from yzcore.extensions.storage.throttle import BandwidthLimiter, ThrottledProgress, BULK, INTERACTIVE, \
+    set_bandwidth_limit
+from tests.memory_storage import CONF, MemoryStorage
+
+
+def test_token_bucket():
+    limiter = BandwidthLimiter()
+    start = time.monotonic()
+    limiter.consume(10 ** 9)  # 未开启限速
+    assert time.monotonic() - start < 0.05
+
+    limiter.configure(rate=100000, burst=10000)
+    start = time.monotonic()
+    limiter.consume(10000)  # 桶内的令牌
+    assert time.monotonic() - start < 0.05
+    limiter.consume(20000)
+    assert 0.15 < time.monotonic() - start < 1
+
+    # bulk单独限速
+    limiter.configure(rate=1000000, bulk_rate=50000)
+    start = time.monotonic()
+    limiter.consume(100000, BULK)
+    assert 0.8 < time.monotonic() - start < 2
+
+
+def test_bulk_yields_to_interactive():
+    limiter = BandwidthLimiter(rate=100000, burst=10000)
+    limiter.consume(10000)
+    finished = []
+
+    def _consume(priority):
+        limiter.consume(10000, priority)
+        finished.append(priority)
+    bulk = threading.Thread(target=_consume, args=(BULK,))
+    bulk.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=_consume, args=(INTERACTIVE,))
+    interactive.start()
+    bulk.join()
+    interactive.join()
+    assert finished == [INTERACTIVE, BULK]
+
+
+def test_progress():
+    consumed = []
+    limiter = BandwidthLimiter(rate=1)
+    limiter.consume = lambda nbytes, priority: consumed.append((nbytes, priority))
+    progress = ThrottledProgress(limiter=limiter, priority=BULK)
+    for amount in (10, 30, 20, 50):  # 多线程上传时累计值乱序
+        progress(amount, 50)
+    assert [nbytes for nbytes, _ in consumed if nbytes > 0] == [10, 20, 20]
+    assert {priority for _, priority in consumed} == {BULK}
+
+
+def test_upload_keeps_resumable_path(tmpdir, monkeypatch):
+    """限速时仍然走各SDK的分片/断点续传上传，在进度回调中限速"""
+    import oss2
+    filepath = tmpdir.join('a.txt')
+    filepath.write(b'data')
+    calls = []
+
+    def resumable_upload(bucket, key, filename, **kwargs):
+        calls.append(kwargs)
+        if kwargs['progress_callback']:
+            kwargs['progress_callback'](4, 4)
+        return type('Result', (), {'status': 200})()
+    monkeypatch.setattr(oss2, 'resumable_upload', resumable_upload)
+    oss = OssManager(OssConfig(mode='oss', **CONF))
+    memory = MemoryStorage()
+    set_bandwidth_limit(rate=1024 * 1024)
+    try:
+        oss.upload(str(filepath), 'a.txt')
+        memory.upload(str(filepath), 'a.txt')
+    finally:
+        set_bandwidth_limit(0)
+    assert isinstance(calls[0]['progress_callback'], ThrottledProgress)
+    assert memory.calls['upload_file'] == 1 and not memory.calls['upload_obj']
+
+    oss.upload(str(filepath), 'a.txt')
+    assert calls[1]['progress_callback'] is None
@@ -0,0 +1,113 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: StorageManagerBase.upload_from_url的测试，源文件由本地的aiohttp服务提供
+"""
+import os
+import asyncio
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from yzcore.exceptions import StorageRequestError
+from yzcore.extensions.storage.const import MULTIPART_MIN_PART_SIZE
+from yzcore.request import AioHTTP
+from tests.memory_storage import MemoryStorage
+
+BIG = os.urandom(2 * MULTIPART_MIN_PART_SIZE + 1024)
+
+
+async def _stream(request):
+    """不返回Content-Length，分块发送"""
+    response = web.StreamResponse(headers={'Content-Type': 'model/gltf-binary'})
+    await response.prepare(request)
+    for i in range(0, len(BIG), 1024 * 1024):
+        await response.write(BIG[i:i + 1024 * 1024])
+    await response.write_eof()
+    return response
+
+
+async def _stall(request):
+    """发送超过一个分片的数据后停止响应"""
+    response = web.StreamResponse()
+    await response.prepare(request)
+    await response.write(BIG[:MULTIPART_MIN_PART_SIZE + 1])
+    await asyncio.sleep(5)
+    return response
+
+
+async def _small(request):
+    return web.Response(body=b'small')
+
+
+async def _missing(request):
+    return web.Response(status=404)
+
+
+def run(func):
+    """每个测试使用新的事件循环，不设置为当前事件循环"""
+    async def _run():
+        app = web.Application()
+        app.router.add_get('/big', _stream)
+        app.router.add_get('/small', _small)
+        app.router.add_get('/missing', _missing)
+        app.router.add_get('/stall', _stall)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            return await func(lambda path: str(server.make_url(path)))
+        finally:
+            await AioHTTP.close()
+            await server.close()
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(_run())
+    finally:
+        loop.close()
+
+
+def test_stream_multipart():
+    storage = MemoryStorage()
+
+    async def _test(url):
+        await storage.upload_from_url(url('/big'), 'a/big.glb', part_size=MULTIPART_MIN_PART_SIZE)
+        await storage.upload_from_url(url('/small'), 'a/small.txt')
+    run(_test)
+    assert storage.objects['a/big.glb'] == BIG
+    assert storage.calls['upload_part'] == 3 and storage.calls['complete_multipart_upload'] == 1
+    assert storage.objects['a/small.txt'] == b'small'
+    assert storage.calls['upload_obj'] == 1 and storage.headers['a/small.txt']['content_type']
+
+
+def test_errors():
+    storage = MemoryStorage()
+
+    async def _test(url):
+        with pytest.raises(ValueError):
+            await storage.upload_from_url(url('/big'), 'a', part_size=MULTIPART_MIN_PART_SIZE - 1)
+        with pytest.raises(StorageRequestError):
+            await storage.upload_from_url(url('/missing'), 'a')
+        # 读取超时时取消已经开始的分片上传
+        with pytest.raises(asyncio.TimeoutError):
+            await storage.upload_from_url(url('/stall'), 'b', part_size=MULTIPART_MIN_PART_SIZE, timeout=1)
+    run(_test)
+    assert storage.calls['upload_part'] == 1 and storage.calls['abort_multipart_upload'] == 1
+    assert not storage.uploads and not storage.objects
+
+
+def test_semaphore_per_loop():
+    async def _get(url):
+        return MemoryStorage._get_url_upload_semaphore(asyncio.get_event_loop())
+    first, second = run(_get), run(_get)
+    assert first is not second
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert MemoryStorage._get_url_upload_semaphore(loop) is MemoryStorage._get_url_upload_semaphore(loop)
+    finally:
+        loop.close()
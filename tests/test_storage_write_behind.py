@@ -0,0 +1,102 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: WriteBehindUploader的崩溃恢复和重试测试，使用内存中的存储
+"""
+import os
+import json
+
+import pytest
+
+from yzcore.exceptions import StorageRequestError
+from yzcore.extensions.storage.utils import FileLock
+from yzcore.extensions.storage.write_behind import WriteBehindUploader, UploadStatus
+from tests.memory_storage import MemoryStorage
+
+
+class FlakyStorage(MemoryStorage):
+    """前failures次上传失败"""
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def upload_obj(self, file_obj, key, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            self._count('upload_failed')
+            raise StorageRequestError('upload failed')
+        return super().upload_obj(file_obj, key, **kwargs)
+
+
+def _write_task(path, task_id, key, data=b'data', meta=True):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, f'{task_id}.data'), 'wb') as f:
+        f.write(data)
+    if meta:
+        with open(os.path.join(path, f'{task_id}.json'), 'w') as f:
+            json.dump({'task_id': task_id, 'key': key, 'created': 1, 'status': UploadStatus.pending}, f)
+
+
+def test_recover_orphan_only(tmpdir):
+    root = str(tmpdir)
+    # 已退出进程的子目录：锁文件没有被持有
+    orphan = os.path.join(root, '1-dead')
+    _write_task(orphan, 't1', 'a.txt', b'orphan')
+    _write_task(orphan, 't2', 'b.txt', meta=False)  # 数据写完但元数据没有落地
+    open(os.path.join(orphan, 't3.data.tmp'), 'w').close()
+    # 仍在运行的进程的子目录
+    live = WriteBehindUploader(MemoryStorage(), spool_dir=root)
+    _write_task(live.spool_dir, 't4', 'c.txt')
+
+    storage = MemoryStorage()
+    uploader = WriteBehindUploader(storage, spool_dir=root, retry_delay=0)
+    uploader.start()
+    try:
+        assert uploader.wait('a.txt', timeout=5)
+    finally:
+        uploader.stop()
+    assert storage.objects == {'a.txt': b'orphan'}
+    assert not os.path.exists(orphan) and not os.path.exists(f'{orphan}.lock')
+    assert os.listdir(uploader.spool_dir) == []
+    assert sorted(os.listdir(live.spool_dir)) == ['t4.data', 't4.json']
+    assert not FileLock(f'{live.spool_dir}.lock').acquire(blocking=False)
+
+
+def test_retry_and_prune(tmpdir):
+    storage = FlakyStorage(2)
+    uploader = WriteBehindUploader(storage, spool_dir=str(tmpdir), retry_delay=0, max_finished=1)
+    uploader.start()
+    try:
+        uploader.submit(b'1', 'a.txt')
+        assert uploader.wait('a.txt', timeout=5)
+        assert storage.calls['upload_failed'] == 2 and storage.objects['a.txt'] == b'1'
+        assert uploader.status('a.txt') == UploadStatus.done
+
+        uploader.submit(b'2', 'b.txt')
+        uploader.wait('b.txt', timeout=5)
+        assert not uploader._tasks and list(uploader._finished) == ['b.txt']
+        assert uploader.status('a.txt') is None
+    finally:
+        uploader.stop()
+    assert os.listdir(uploader.spool_dir) == []
+
+
+def test_retry_exhausted(tmpdir):
+    storage = FlakyStorage(3)
+    uploader = WriteBehindUploader(storage, spool_dir=str(tmpdir), max_retries=2, retry_delay=0)
+    uploader.start()
+    try:
+        uploader.submit(b'1', 'a.txt')
+        with pytest.raises(StorageRequestError):
+            uploader.wait('a.txt', timeout=5)
+    finally:
+        uploader.stop()
+    assert uploader.status('a.txt') == UploadStatus.failed and 'a.txt' not in storage.objects
+    # 失败的任务保留数据文件，重启后不会自动重传
+    filenames = sorted(os.listdir(uploader.spool_dir))
+    assert len(filenames) == 2 and filenames[0].endswith('.data')
+    with open(os.path.join(uploader.spool_dir, filenames[1])) as f:
+        assert json.load(f)['status'] == UploadStatus.failed
@@ -1,3 +1,4 @@
+import asyncio
 from yzcore.extensions.storage import StorageManage, StorageRequestError
 from yzcore.default_settings import default_setting as settings
 from abc import ABCMeta, abstractmethod
@@ -84,12 +85,19 @@ class StorageController(metaclass=ABCMeta):
         return self._init_private_storage_manage(self.storage_conf)
 
     @classmethod
-    async def check_organiz_conf(cls, organiz_conf: dict):
-        """检查自定义对象存储配置是否有效"""
+    async def check_organiz_conf(cls, organiz_conf: dict, mode: str = 'concurrent', ttl: float = 0):
+        """
+        检查自定义对象存储配置是否有效，加密桶和非加密桶并行检查
+        :param mode: full / concurrent / liveness，见 StorageManagerBase.check
+        :param ttl: 检查结果的缓存时间(秒)
+        """
         public_storage = cls._init_public_storage_manage(organiz_conf)
         private_storage = cls._init_private_storage_manage(organiz_conf)
-        public_storage.check()
-        private_storage.check()
+        loop = asyncio.get_event_loop()
+        await asyncio.gather(
+            loop.run_in_executor(None, public_storage.check, mode, ttl),
+            loop.run_in_executor(None, private_storage.check, mode, ttl),
+        )
 
     @classmethod
     def _init_public_storage_manage(cls, storage_conf: dict):
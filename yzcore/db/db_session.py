@@ -19,40 +19,402 @@
 #     id: Any
 #     __name__: str
 
+import time
+import itertools
+import threading
 from urllib.parse import splittype
-from typing import Generator
-from sqlalchemy import create_engine
+from typing import Generator, AsyncGenerator, Callable, Optional
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.sql.selectable import Select
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+except ImportError:  # sqlalchemy < 1.4
+    create_async_engine = AsyncSession = AsyncAdaptedQueuePool = None
 
 from yzcore.default_settings import default_setting as settings
+from yzcore.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 同步驱动 -> 异步驱动
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'mysql+mysqldb': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+class PoolMetrics(object):
+    """
+    单个引擎连接池的统计，累计值由连接池事件更新，当前值从连接池实时读取
+    主库、副本、异步引擎各自一份，按名称区分: primary / replica-0 / async
+    >>> get_pool_metrics()  # 主库
+    >>> get_pool_metrics(None)  # 全部连接池 {name: metrics}
+    >>> add_pool_listener(lambda event_name, data: statsd.timing(f"db.pool.{data['pool']}.wait", data['wait']) if event_name == 'checkout' else None)
+    """
+
+    def __init__(self, name: str = 'primary', listeners: list = None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._listeners = [] if listeners is None else listeners
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_total = 0.0  # 获取连接的总等待时间(秒)
+        self.wait_max = 0.0
+
+    def emit(self, event_name: str, **data):
+        for callback in self._listeners:
+            try:
+                callback(event_name, dict(data, pool=self.name))
+            except Exception as e:
+                logger.error(f'pool metrics listener error: {e}')
+
+    def record_wait(self, wait: float, timeout: bool = False):
+        with self._lock:
+            if timeout:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+        self.emit('timeout' if timeout else 'checkout', wait=wait)
+
+    def snapshot(self, pool=None):
+        data = {
+            'checkouts': self.checkouts,
+            'connects': self.connects,
+            'invalidations': self.invalidations,
+            'timeouts': self.timeouts,
+            'wait_total': round(self.wait_total, 6),
+            'wait_avg': round(self.wait_total / self.checkouts, 6) if self.checkouts else 0,
+            'wait_max': round(self.wait_max, 6),
+        }
+        if isinstance(pool, QueuePool):
+            data.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+            })
+        return data
+
+
+_pool_listeners = []  # add_pool_listener() 注册的回调，所有连接池共用
+_pool_metrics = {}  # name -> (engine, PoolMetrics)
+
+
+class _InstrumentedPoolMixin(object):
+    """
+    获取连接时记录等待时间，新建连接的耗时不计入等待时间(由connect事件统计次数)
+    metrics 由 _instrument() 设置，engine.dispose() 重建连接池时保留
+    """
+    metrics = None
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        record = super()._create_connection()
+        record._yzcore_connect_time = time.perf_counter() - start
+        return record
+
+    def _do_get(self):
+        if self.metrics is None:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_wait(time.perf_counter() - start, timeout=True)
+            raise
+        # 本次新建的连接，扣除建立连接的时间
+        connect_time = record.__dict__.pop('_yzcore_connect_time', 0)
+        self.metrics.record_wait(max(time.perf_counter() - start - connect_time, 0))
+        return record
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+if AsyncAdaptedQueuePool is not None:
+    class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+        pass
+else:
+    InstrumentedAsyncQueuePool = None
+
+
+def _instrument(engine, name: str = 'primary'):
+    """为引擎的连接池单独统计，同名的引擎(例如重新调用get_db_engine())覆盖之前的统计"""
+    sync_engine = getattr(engine, 'sync_engine', engine)
+    pool = sync_engine.pool
+    metrics = PoolMetrics(name, _pool_listeners)
+    if isinstance(pool, _InstrumentedPoolMixin):
+        pool.metrics = metrics
+    _pool_metrics[name] = (sync_engine, metrics)
+
+    @event.listens_for(pool, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        with metrics._lock:
+            metrics.connects += 1
+        metrics.emit('connect')
+
+    @event.listens_for(pool, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        with metrics._lock:
+            metrics.invalidations += 1
+        metrics.emit('invalidate', exception=exception)
+
+    if settings.DB_PROFILE:
+        from yzcore.db.profiler import profiler
+        profiler.install(engine)
+    return engine
+
+
+def _engine_options(uri: str, pool_cls):
+    """从配置中读取连接池参数，sqlite不使用连接池参数"""
+    _typ, _ = splittype(uri)
+    if _typ.startswith('sqlite'):
+        # 只有SQLite才需要，其他数据库不需要。SQLite 只允许一个线程与其通信
+        return {'connect_args': {"check_same_thread": False}}
+    return {
+        'poolclass': pool_cls,
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': settings.DB_POOL_PRE_PING,
+    }
 
 
 def get_db_engine():
+    """根据配置创建新的引擎，一般使用 get_engine() 获取共享的引擎"""
     if settings.DB_URI is None:
         raise EnvironmentError('需要配置"DB_URI"变量！')
-    _typ, _ = splittype(settings.DB_URI)
-    if _typ.startswith('sqlite'):
-        return create_engine(
-            settings.DB_URI,
-            connect_args={"check_same_thread": False}
-            # 只有SQLite才需要，其他数据库不需要。SQLite 只允许一个线程与其通信
-        )
-    else:
-        return create_engine(
-            settings.DB_URI,
-        )
+    return _instrument(create_engine(settings.DB_URI, **_engine_options(settings.DB_URI, InstrumentedQueuePool)))
+
+
+class ReplicaSet(object):
+    """
+    只读副本，按策略选择健康的副本
+    round_robin: 轮询 / least_latency: 选择健康检查延迟最低的副本
+    """
+
+    def __init__(self, engines: list, strategy: str = 'round_robin', check_interval: float = 10):
+        if strategy not in ('round_robin', 'least_latency'):
+            raise ValueError('replica strategy must be one of [round_robin|least_latency]')
+        self.engines = engines
+        self.strategy = strategy
+        self.check_interval = check_interval
+        self.healthy = {id(engine): True for engine in engines}
+        self.latency = {id(engine): 0.0 for engine in engines}
+        self._counter = itertools.count()
+        self._last_check = time.monotonic()
+        self._checking = False
+        self._lock = threading.Lock()
+        for engine in engines:
+            event.listen(engine, 'handle_error', self._on_error)
+
+    def _on_error(self, context):
+        # 连接失败的副本立即摘除，等待下次健康检查恢复
+        if context.is_disconnect:
+            engine = context.engine
+            self.healthy[id(engine)] = False
+            logger.warning(f'db replica {engine.url!r} is disconnected')
 
+    def check(self):
+        """对全部副本执行 SELECT 1，更新健康状态和延迟"""
+        try:
+            for engine in self.engines:
+                start = time.perf_counter()
+                try:
+                    with engine.connect() as connection:
+                        connection.execute(text('SELECT 1'))
+                except Exception as e:
+                    if self.healthy[id(engine)]:
+                        logger.warning(f'db replica {engine.url!r} health check failed: {e}')
+                    self.healthy[id(engine)] = False
+                else:
+                    self.healthy[id(engine)] = True
+                    self.latency[id(engine)] = time.perf_counter() - start
+        finally:
+            self._last_check = time.monotonic()
+            self._checking = False
+
+    def _maybe_check(self):
+        if self._checking or time.monotonic() - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if self._checking:
+                return
+            self._checking = True
+        threading.Thread(target=self.check, name='db-replica-check', daemon=True).start()
+
+    def choose(self):
+        """选择一个健康的副本，全部不可用时返回None"""
+        self._maybe_check()
+        engines = [engine for engine in self.engines if self.healthy[id(engine)]]
+        if not engines:
+            return None
+        if self.strategy == 'least_latency':
+            return min(engines, key=lambda engine: self.latency[id(engine)])
+        return engines[next(self._counter) % len(engines)]
+
+
+class RoutingSession(Session):
+    """
+    读写分离的Session
+    只读的SELECT发送到副本；写操作、SELECT ... FOR UPDATE、原生SQL发送到主库，
+    Session一旦有写操作，之后的读取(包括提交后的refresh和重新加载)都使用主库，避免副本同步延迟读到旧数据
+    >>> db.use_primary()  # 强制使用主库，例如需要读取其他Session刚写入的数据的场景
+    """
+
+    def __init__(self, *args, replicas: ReplicaSet = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+        self._stick_to_primary = False
+
+    def use_primary(self):
+        self._stick_to_primary = True
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.replicas and not self._stick_to_primary and not self._flushing \
+                and isinstance(clause, Select) and clause._for_update_arg is None:
+            engine = self.replicas.choose()
+            if engine is not None:
+                return engine
+        elif self.replicas:
+            self._stick_to_primary = True
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+_lock = threading.RLock()  # get_session_local() 持有锁时会调用 get_engine() 和 get_replica_set()
+_engine = None
+_session_local = None
+_replica_set = None
+
+
+def get_engine():
+    """第一次使用时才根据配置创建引擎，导入模块时不需要配置DB_URI"""
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = get_db_engine()
+    return _engine
+
+
+def get_replica_set():
+    """根据 DB_REPLICA_URIS 创建只读副本，未配置时返回None"""
+    global _replica_set
+    if _replica_set is None and settings.DB_REPLICA_URIS:
+        with _lock:
+            if _replica_set is None:
+                engines = [
+                    _instrument(create_engine(uri, **_engine_options(uri, InstrumentedQueuePool)), f'replica-{i}')
+                    for i, uri in enumerate(settings.DB_REPLICA_URIS)
+                ]
+                _replica_set = ReplicaSet(engines, settings.DB_REPLICA_STRATEGY, settings.DB_REPLICA_CHECK_INTERVAL)
+    return _replica_set
+
+
+def get_session_local():
+    global _session_local
+    if _session_local is None:
+        with _lock:
+            if _session_local is None:
+                _session_local = sessionmaker(
+                    class_=RoutingSession, autocommit=False, autoflush=False,
+                    bind=get_engine(), replicas=get_replica_set(),
+                )
+    return _session_local
+
+
+def get_pool_metrics(name: Optional[str] = 'primary'):
+    """
+    连接池的统计数据
+    :param name: primary(主库) / replica-N(第N个副本) / async(异步引擎)，为None时返回全部 {name: metrics}
+    """
+    if name is None:
+        return {name: metrics.snapshot(engine.pool) for name, (engine, metrics) in _pool_metrics.items()}
+    if name not in _pool_metrics:
+        return PoolMetrics(name).snapshot()
+    engine, metrics = _pool_metrics[name]
+    return metrics.snapshot(engine.pool)
+
+
+def add_pool_listener(callback: Callable[[str, dict], None]):
+    """
+    注册连接池事件回调 callback(event_name, data)，所有连接池共用，data['pool']为连接池名称
+    event_name: checkout(data含wait) / timeout(data含wait) / connect / invalidate(data含exception)
+    """
+    _pool_listeners.append(callback)
+
+
+def __getattr__(name):
+    # 兼容 from yzcore.db.db_session import engine, SessionLocal
+    if name == 'engine':
+        return get_engine()
+    if name == 'SessionLocal':
+        return get_session_local()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-engine = get_db_engine()
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
 def get_db() -> Generator:
+    db = get_session_local()()
     try:
-        db = SessionLocal()
         yield db
     finally:
         db.close()
+
+
+def get_async_db_uri():
+    """ASYNC_DB_URI未配置时，将DB_URI的驱动替换为对应的异步驱动"""
+    if settings.ASYNC_DB_URI:
+        return settings.ASYNC_DB_URI
+    if settings.DB_URI is None:
+        raise EnvironmentError('需要配置"DB_URI"或"ASYNC_DB_URI"变量！')
+    _typ, rest = splittype(settings.DB_URI)
+    return f'{ASYNC_DRIVERS.get(_typ, _typ)}:{rest}'
+
+
+def get_async_db_engine():
+    if create_async_engine is None:
+        raise ImportError("'sqlalchemy>=1.4' must be installed to use async engine")
+    uri = get_async_db_uri()
+    return _instrument(create_async_engine(uri, **_engine_options(uri, InstrumentedAsyncQueuePool)), 'async')
+
+
+_async_session_local = None
+
+
+def get_async_session_local():
+    """异步的sessionmaker，第一次使用时才创建引擎，未使用异步时不需要安装异步驱动"""
+    global _async_session_local
+    if _async_session_local is None:
+        _async_session_local = sessionmaker(
+            bind=get_async_db_engine(), class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    return _async_session_local
+
+
+async def async_get_db() -> AsyncGenerator:
+    async with get_async_session_local()() as db:
+        yield db
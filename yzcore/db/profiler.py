@@ -0,0 +1,268 @@
+#!/usr/bin/python3.6+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: 基于SQLAlchemy事件的SQL分析
+
+记录每个请求执行的语句数、数据库总耗时、最慢的语句及参数，
+同一请求内相同形状的语句重复执行多次时判断为N+1查询，通过yzcore.logger输出；
+全局按语句形状汇总次数和耗时，stats() 可以直接作为调试接口返回。
+>>> profiler.install(engine)  # 配置 DB_PROFILE=True 时 get_engine() 创建的引擎会自动安装
+>>> app.add_middleware(SQLProfilerMiddleware)
+>>> app.include_router(get_profiler_router(), prefix='/debug')
+>>> with profiler.profile('job') as p:  # 非请求场景
+...     crud.list(db)
+"""
+import re
+import time
+import heapq
+import threading
+import contextlib
+from collections import Counter, OrderedDict, deque
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from yzcore.default_settings import default_setting as settings
+from yzcore.logger import get_logger
+
+logger = get_logger(__name__)
+
+__all__ = ['QueryProfile', 'SQLProfiler', 'SQLProfilerMiddleware', 'profiler', 'get_profiler_router']
+
+_PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)'
+_IN_LIST = re.compile(rf'\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def statement_shape(statement: str):
+    """语句形状：合并空白，IN (?, ?, ...) 合并为 IN (?)，参数个数不同的同一语句视为相同"""
+    return _IN_LIST.sub('(?)', _SPACES.sub(' ', statement).strip())
+
+
+def _truncate(value, length=200):
+    text = repr(value)
+    return text if len(text) <= length else text[:length] + '...'
+
+
+class QueryProfile(object):
+    """一个请求(或一段代码)中执行的SQL"""
+
+    def __init__(self, name: str = None, slowest: int = 5):
+        self.name = name
+        self.count = 0
+        self.total = 0.0  # 秒
+        self.shapes = Counter()
+        self._slowest_size = slowest
+        self._slowest = []  # 小顶堆 [(耗时, 序号, 语句, 参数)]
+        self._lock = threading.Lock()
+
+    def record(self, statement, parameters, elapsed):
+        with self._lock:
+            self.count += 1
+            self.total += elapsed
+            self.shapes[statement_shape(statement)] += 1
+            item = (elapsed, self.count, statement, parameters)
+            if len(self._slowest) < self._slowest_size:
+                heapq.heappush(self._slowest, item)
+            elif elapsed > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+
+    def slowest(self):
+        return [
+            {'statement': statement, 'parameters': _truncate(parameters), 'ms': round(elapsed * 1000, 2)}
+            for elapsed, _, statement, parameters in sorted(self._slowest, reverse=True)
+        ]
+
+    def repeated(self, threshold: int):
+        """重复执行不少于threshold次的语句形状，疑似N+1查询"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def summary(self, threshold: int):
+        return {
+            'name': self.name,
+            'queries': self.count,
+            'ms': round(self.total * 1000, 2),
+            'slowest': self.slowest(),
+            'n_plus_one': [{'statement': shape, 'count': count} for shape, count in self.repeated(threshold)],
+        }
+
+
+class SQLProfiler(object):
+    """
+    SQL分析器，install后引擎上执行的语句都会计入全局统计，
+    在 profile() 内(或经过 SQLProfilerMiddleware 的请求中)执行的语句同时计入当前QueryProfile
+    """
+
+    def __init__(self, slow_ms: float = None, n_plus_one: int = None,
+                 max_statements: int = 500, max_recent: int = 50):
+        """
+        :param slow_ms: 慢查询阈值(毫秒)，默认为 DB_SLOW_QUERY_MS
+        :param n_plus_one: 同一请求内相同形状的语句执行多少次判断为N+1，默认为 DB_N_PLUS_ONE_THRESHOLD
+        :param max_statements: 全局统计最多保留的语句形状数
+        :param max_recent: 保留最近多少个请求的分析结果
+        """
+        self._slow_ms = slow_ms
+        self._n_plus_one = n_plus_one
+        self.max_statements = max_statements
+        self._current = ContextVar('yzcore_sql_profile', default=None)
+        self._statements = OrderedDict()  # 语句形状 -> [次数, 总耗时, 最大耗时]
+        self._recent = deque(maxlen=max_recent)
+        self._engines = set()
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.slow_queries = 0
+        self.n_plus_one = 0
+
+    @property
+    def slow_ms(self):
+        return self._slow_ms if self._slow_ms is not None else settings.DB_SLOW_QUERY_MS
+
+    @property
+    def n_plus_one_threshold(self):
+        return self._n_plus_one if self._n_plus_one is not None else settings.DB_N_PLUS_ONE_THRESHOLD
+
+    def install(self, engine):
+        """在引擎上注册事件，异步引擎注册在sync_engine上，重复调用无影响"""
+        engine = getattr(engine, 'sync_engine', engine)
+        with self._lock:
+            if engine in self._engines:
+                return engine
+            self._engines.add(engine)
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        return engine
+
+    def uninstall(self, engine):
+        engine = getattr(engine, 'sync_engine', engine)
+        with self._lock:
+            if engine not in self._engines:
+                return
+            self._engines.discard(engine)
+        event.remove(engine, 'before_cursor_execute', self._before_execute)
+        event.remove(engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # 开始时间记录在本次执行的context上，执行出错时随context一起释放
+        if context is not None:
+            context._yzcore_query_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_yzcore_query_start', None)
+        if start is None:
+            return
+        self.record(statement, parameters, time.perf_counter() - start)
+
+    def record(self, statement, parameters, elapsed):
+        shape = statement_shape(statement)
+        with self._lock:
+            self.queries += 1
+            stat = self._statements.get(shape)
+            if stat is None:
+                stat = self._statements[shape] = [0, 0.0, 0.0]
+                while len(self._statements) > self.max_statements:
+                    self._statements.popitem(last=False)
+            else:
+                self._statements.move_to_end(shape)
+            stat[0] += 1
+            stat[1] += elapsed
+            stat[2] = max(stat[2], elapsed)
+            slow = elapsed * 1000 >= self.slow_ms
+            if slow:
+                self.slow_queries += 1
+
+        current = self._current.get()
+        if current is not None:
+            current.record(statement, parameters, elapsed)
+        if slow:
+            logger.warning(f'sql: slow query {elapsed * 1000:.1f}ms '
+                           f'[{current.name if current else "-"}] {statement} {_truncate(parameters)}')
+
+    def current(self):
+        """当前请求的QueryProfile，不在profile()内时为None"""
+        return self._current.get()
+
+    @contextlib.contextmanager
+    def profile(self, name: str = None):
+        """分析一段代码执行的SQL，结束时输出日志并计入最近的请求"""
+        query_profile = QueryProfile(name)
+        token = self._current.set(query_profile)
+        try:
+            yield query_profile
+        finally:
+            self._current.reset(token)
+            self.report(query_profile)
+
+    def report(self, query_profile: QueryProfile):
+        if not query_profile.count:
+            return
+        summary = query_profile.summary(self.n_plus_one_threshold)
+        self._recent.append(summary)
+        logger.info(f'sql: [{query_profile.name or "-"}] queries={summary["queries"]} time={summary["ms"]}ms')
+        for item in summary['n_plus_one']:
+            self.n_plus_one += 1
+            logger.warning(f'sql: possible N+1 [{query_profile.name or "-"}] '
+                           f'executed {item["count"]} times: {item["statement"]}')
+
+    def stats(self, top: int = 20):
+        """全局统计：按总耗时排序的语句、最近请求的分析结果"""
+        with self._lock:
+            statements = sorted(self._statements.items(), key=lambda item: item[1][1], reverse=True)[:top]
+            recent = list(self._recent)
+        return {
+            'queries': self.queries,
+            'slow_queries': self.slow_queries,
+            'n_plus_one': self.n_plus_one,
+            'slow_ms': self.slow_ms,
+            'statements': [
+                {'statement': shape, 'count': count, 'total_ms': round(total * 1000, 2),
+                 'avg_ms': round(total * 1000 / count, 2), 'max_ms': round(max_elapsed * 1000, 2)}
+                for shape, (count, total, max_elapsed) in statements
+            ],
+            'recent': recent,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._recent.clear()
+            self.queries = self.slow_queries = self.n_plus_one = 0
+
+
+profiler = SQLProfiler()
+
+
+class SQLProfilerMiddleware(object):
+    """
+    ASGI中间件，为每个HTTP请求创建QueryProfile
+    >>> app.add_middleware(SQLProfilerMiddleware)
+    """
+
+    def __init__(self, app, sql_profiler: SQLProfiler = None):
+        self.app = app
+        self.profiler = sql_profiler or profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        with self.profiler.profile(f'{scope["method"]} {scope["path"]}'):
+            await self.app(scope, receive, send)
+
+
+def get_profiler_router(path: str = '/sql-stats', sql_profiler: SQLProfiler = None):
+    """返回SQL统计的接口，GET返回统计数据，DELETE清空统计"""
+    from fastapi import APIRouter
+
+    sql_profiler = sql_profiler or profiler
+    router = APIRouter()
+
+    @router.get(path)
+    def sql_stats(top: int = 20):
+        return sql_profiler.stats(top)
+
+    @router.delete(path)
+    def reset_sql_stats():
+        sql_profiler.reset()
+        return {}
+    return router
@@ -0,0 +1,169 @@
+#!/usr/bin/python3.6+
+# -*- coding:utf-8 -*-
+"""
+@auth: zhouwei
+@date: 2026-10-19
+@desc: OrmCRUDBase读取结果的进程内缓存
+
+缓存的是字段值而不是ORM对象，命中时优先返回当前Session中已有的对象(保留未提交的修改)，
+没有时重新构造对象并以 merge(load=False) 的方式放入当前Session，不会产生查询，也不会出现跨Session使用同一个对象的问题。
+同一个模型的写操作会清空该模型的全部缓存，事务结束后再清空一次，避免提交前读到旧数据并写入缓存。
+清空缓存后 DB_REPLICA_MAX_LAG 秒内从只读副本读取的结果不写入缓存，避免缓存副本同步前的旧数据。
+"""
+import time
+import threading
+from collections import OrderedDict
+
+from yzcore.default_settings import default_setting as settings
+
+try:
+    from sqlalchemy import event, inspect
+    from sqlalchemy.orm import make_transient_to_detached
+except ImportError:
+    pass
+
+
+__all__ = ['QueryCache']
+
+_SESSION_CACHES = 'yzcore_query_caches'  # Session.info中记录当前事务写入过的缓存
+
+
+def _invalidate_after_transaction(session, transaction):
+    if transaction.parent is not None:
+        return
+    caches = session.info.get(_SESSION_CACHES)
+    while caches:
+        caches.pop().invalidate()
+
+
+def _copy(value):
+    """dict/list结果返回副本，调用方修改后不影响缓存"""
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+def _reads_from_replica(db):
+    return bool(getattr(db, 'replicas', None)) and not getattr(db, '_stick_to_primary', False)
+
+
+class QueryCache(object):
+    """
+    一个模型的读取结果缓存，LRU淘汰
+    同一个模型的多个CRUD对象共用，各自按自己的ttl判断条目是否过期，max_size取其中的最大值
+    """
+    _caches = {}  # model -> QueryCache，写操作可以互相失效
+    _caches_lock = threading.Lock()
+
+    def __init__(self, model, max_size: int):
+        self.model = model
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._generation = 0  # 每次清空加1，加载期间被清空的结果不写入缓存
+        self._invalidated_at = float('-inf')
+        self._mapper = inspect(model)
+        self._columns = [attr.key for attr in self._mapper.column_attrs]
+        self._primary_keys = [self._mapper.get_property_by_column(column).key for column in self._mapper.primary_key]
+
+    @classmethod
+    def for_model(cls, model, max_size: int = 1024):
+        with cls._caches_lock:
+            cache = cls._caches.get(model)
+            if cache is None:
+                cache = cls._caches[model] = cls(model, max_size)
+            else:
+                cache.max_size = max(cache.max_size, max_size)
+            return cache
+
+    @classmethod
+    def get(cls, model):
+        """模型已开启的缓存，没有时返回None"""
+        return cls._caches.get(model)
+
+    def _get(self, key, ttl):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] + ttl < time.monotonic():
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, item[1]
+
+    def _set(self, key, value, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def _cacheable(self, db):
+        """刚清空缓存时副本可能还没有同步写入的数据"""
+        return not (_reads_from_replica(db) and
+                    time.monotonic() - self._invalidated_at < (settings.DB_REPLICA_MAX_LAG or 0))
+
+    def _dump(self, obj):
+        return {key: getattr(obj, key) for key in self._columns}
+
+    def _load(self, db, data):
+        identity_key = self._mapper.identity_key_from_primary_key([data[key] for key in self._primary_keys])
+        obj = db.identity_map.get(identity_key)
+        if obj is not None:  # 直接使用Session中的对象，merge会覆盖未提交的修改
+            return obj
+        obj = self.model(**data)
+        make_transient_to_detached(obj)
+        return db.merge(obj, load=False)
+
+    def get_or_load(self, db, key, loader, kind: str = 'one', ttl: float = 60):
+        """
+        :param key: 查询的唯一标识
+        :param loader: 缓存未命中时执行的查询
+        :param kind: one: 单个对象或None / many: 对象列表 / scalar: 标量值
+        :param ttl: 缓存条目的有效时间(秒)
+        """
+        try:
+            hash(key)
+        except TypeError:  # 查询条件中有不可哈希的值，不缓存
+            return loader()
+        hit, value = self._get(key, ttl)
+        if not hit:
+            generation = self._generation
+            result = loader()
+            if not self._cacheable(db):
+                return result
+            if kind == 'one':
+                value = None if result is None else self._dump(result)
+            elif kind == 'many':
+                value = [self._dump(obj) for obj in result]
+            else:
+                value = _copy(result)
+            self._set(key, value, generation)
+            return result
+        if kind == 'one':
+            return None if value is None else self._load(db, value)
+        if kind == 'many':
+            return [self._load(db, data) for data in value]
+        return _copy(value)
+
+    def invalidate(self, db=None):
+        """清空缓存；传入db时在该Session的事务结束后再清空一次，每个Session只注册一次事件"""
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+            self._invalidated_at = time.monotonic()
+        if db is not None:
+            caches = db.info.get(_SESSION_CACHES)
+            if caches is None:
+                caches = db.info[_SESSION_CACHES] = set()
+                event.listen(db, 'after_transaction_end', _invalidate_after_transaction)
+            caches.add(self)
+
+    def stats(self):
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
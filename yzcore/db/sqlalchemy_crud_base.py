@@ -5,18 +5,30 @@
 @date: 2020-6-30
 @desc: ...
 """
+import json
+import base64
+import datetime
+from decimal import Decimal
 from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
 
 try:
     from pydantic import BaseModel
     import sqlalchemy
-    from sqlalchemy import text
-    from sqlalchemy.orm import Session
+    from sqlalchemy import text, and_, or_, insert, bindparam, tuple_, literal_column
+    from sqlalchemy import update as sa_update
+    from sqlalchemy.orm import Session, load_only, make_transient_to_detached
     from sqlalchemy.ext.declarative import as_declarative, declared_attr
 except ImportError:
     pass
 
+try:
+    from sqlalchemy import select, func, delete as sa_delete
+    from sqlalchemy.ext.asyncio import AsyncSession
+except ImportError:  # sqlalchemy < 1.4
+    AsyncSession = None
+
 from yzcore.core.encoders import jsonable_encoder
+from yzcore.db.query_cache import QueryCache
 
 
 @as_declarative()
@@ -35,16 +47,270 @@ CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
 
+def _row_dict(row, exclude_unset=False):
+    """pydantic模型直接转为dict，不经过jsonable_encoder，保留datetime等原始类型"""
+    if isinstance(row, BaseModel):
+        return row.dict(exclude_unset=exclude_unset)
+    return row
+
+
+def _chunk_rows(rows, chunk_size):
+    """
+    按字段集合分组后分块，executemany要求同一批数据的字段相同
+    :return: 每块为[(原始位置, 数据)]
+    """
+    groups = {}
+    for index, row in enumerate(rows):
+        groups.setdefault(frozenset(row), []).append((index, row))
+    for group in groups.values():
+        for i in range(0, len(group), chunk_size):
+            yield group[i:i + chunk_size]
+
+
+def _get_dialect(db):
+    return getattr(db, 'sync_session', db).get_bind().dialect
+
+
+def _bulk_update_stmt(table, keys):
+    """按id更新的语句，绑定参数加上前缀以免与字段名冲突"""
+    return sa_update(table).where(table.c.id == bindparam('_id')).values(
+        {key: bindparam(f'_{key}') for key in keys})
+
+
+def _rowcount(result, default):
+    """executemany的影响行数，驱动不支持时返回-1，按提交的行数计算"""
+    rowcount = result.rowcount
+    return default if rowcount is None or rowcount < 0 else rowcount
+
+
+def _upsert_stmt(dialect_name, table, values, conflict_columns, update_columns):
+    """
+    生成各数据库的 INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE 语句
+    PostgreSQL返回每行是否为新插入(xmax = 0)
+    """
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect_name == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+    else:
+        raise NotImplementedError(f'upsert is not supported for {dialect_name}')
+
+    stmt = dialect_insert(table).values(values)
+    if dialect_name == 'mysql':
+        # 没有需要更新的字段时把冲突字段更新为自身，相当于忽略
+        columns = update_columns or conflict_columns[:1]
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in columns})
+    if update_columns:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_columns, set_={c: stmt.excluded[c] for c in update_columns})
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+    if dialect_name == 'postgresql':
+        stmt = stmt.returning(literal_column('(xmax = 0)'))
+    return stmt
+
+
+def _update_returning_stmt(model, model_id, update_data):
+    """按id更新并返回更新后的整行，字段顺序与 _detached_obj 的keys一致"""
+    attrs = sqlalchemy.inspect(model).column_attrs
+    stmt = sa_update(model).where(model.id == model_id).values(**update_data)
+    stmt = stmt.returning(*[attr.columns[0] for attr in attrs]).execution_options(synchronize_session=False)
+    return stmt, [attr.key for attr in attrs]
+
+
+def _detached_obj(model, data):
+    """用查询到的字段值构造detached状态的对象，merge(load=False)后不需要再查询"""
+    obj = model(**data)
+    make_transient_to_detached(obj)
+    return obj
+
+
+def _column_keys(model):
+    return {attr.key for attr in sqlalchemy.inspect(model).column_attrs}
+
+
+def _existing_keys_stmt(table, conflict_columns, values):
+    """查询一批数据中已存在的冲突键，用于不支持RETURNING的数据库统计插入/更新的行数"""
+    columns = [table.c[c] for c in conflict_columns]
+    if len(columns) == 1:
+        condition = columns[0].in_([row[conflict_columns[0]] for row in values])
+    else:
+        condition = tuple_(*columns).in_([tuple(row[c] for c in conflict_columns) for row in values])
+    return select(*columns).where(condition)
+
+
+def _upsert_update_columns(row, conflict_columns, update_columns):
+    if update_columns is not None:
+        return list(update_columns)
+    return [key for key in row if key not in conflict_columns and key != 'id']
+
+
+def _supports_window(dialect):
+    """是否支持窗口函数：SQLite 3.25+，MySQL 8.0+，MariaDB 10.2+"""
+    if dialect.name == 'sqlite':
+        return getattr(dialect.dbapi, 'sqlite_version_info', (0,)) >= (3, 25)
+    if dialect.name == 'mysql':
+        version = dialect.server_version_info or (0,)
+        return version >= ((10, 2) if getattr(dialect, 'is_mariadb', False) else (8,))
+    return True
+
+
+ROW_TYPES = ('model', 'tuple', 'dict')
+
+
+def _select_stmt(model, kwargs, row_type='model', columns=None, with_total=False):
+    """
+    按条件查询的语句
+    :param row_type: model返回ORM对象，tuple/dict直接查询表的字段，不经过ORM和identity map
+    :param columns: 只查询的字段，model时其余字段延迟加载(load_only)
+    :param with_total: 每行附带 COUNT(*) OVER() 总数
+    """
+    if row_type not in ROW_TYPES:
+        raise ValueError(f'row_type must be one of {ROW_TYPES}')
+    if row_type == 'model':
+        entities = [model]
+    else:
+        table = model.__table__
+        entities = [table.c[c] for c in columns] if columns else list(table.columns)
+    if with_total:
+        entities.append(func.count().over().label('_total'))
+    stmt = select(*entities)
+    if row_type == 'model' and columns:
+        stmt = stmt.options(load_only(*[getattr(model, c) for c in columns]))
+    if kwargs:
+        stmt = stmt.filter_by(**kwargs)
+    return stmt
+
+
+def _convert_row(row, row_type='model', with_total=False):
+    if row_type == 'model':
+        return row[0]
+    values = tuple(row)[:-1] if with_total else tuple(row)
+    if row_type == 'tuple':
+        return values
+    return dict(zip(row._fields, values))
+
+
+def _convert_rows(result, row_type='model'):
+    if row_type == 'model':
+        return result.scalars()
+    return (_convert_row(row, row_type) for row in result)
+
+
+def _list_stmt(model, sort, offset, limit, kwargs, with_total=False, row_type='model', columns=None):
+    """list使用的查询"""
+    stmt = _select_stmt(model, kwargs, row_type, columns, with_total)
+    if sort:
+        stmt = stmt.order_by(text(','.join(sort)))
+    return stmt.offset(offset).limit(limit)
+
+
+def _estimate_count_stmt(dialect_name, table_name):
+    """从统计信息读取表的估计行数，不扫描表；不支持的数据库返回None"""
+    if dialect_name == 'postgresql':
+        # 从未ANALYZE的表reltuples为-1
+        return text('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)').bindparams(
+            name=table_name)
+    if dialect_name == 'mysql':
+        return text('SELECT TABLE_ROWS FROM information_schema.TABLES '
+                    'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name').bindparams(name=table_name)
+    return None
+
+
+def _parse_sort(model, sort: List[str] = None):
+    """
+    解析排序字段，并追加主键保证顺序唯一
+    :return: [(字段名, 字段, 是否降序)]
+    """
+    columns = []
+    for field in sort or []:
+        desc = field.startswith('-')
+        name = field.lstrip('-+').strip()
+        columns.append((name, getattr(model, name), desc))
+    if 'id' not in [name for name, _, _ in columns]:
+        columns.append(('id', model.id, False))
+    return columns
+
+
+def _keyset_condition(columns, values):
+    """(c1, c2, ...) 在排序方向上大于 (v1, v2, ...) 的条件，兼容升降序混合的排序"""
+    conditions = []
+    for i, (_, column, desc) in enumerate(columns):
+        equals = [columns[j][1] == values[j] for j in range(i)]
+        compare = column < values[i] if desc else column > values[i]
+        conditions.append(and_(*equals, compare))
+    return or_(*conditions)
+
+
+def _cursor_value(column, value):
+    """游标中的值还原为字段对应的python类型"""
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is datetime.datetime:
+        return datetime.datetime.fromisoformat(value)
+    if python_type is datetime.date:
+        return datetime.date.fromisoformat(value)
+    if python_type is Decimal:
+        return Decimal(value)
+    return value
+
+
+def encode_cursor(columns, obj) -> str:
+    """根据最后一条数据生成游标"""
+    data = {
+        's': [('-' if desc else '') + name for name, _, desc in columns],
+        'v': jsonable_encoder([getattr(obj, name) for name, _, _ in columns]),
+    }
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(columns, cursor: str):
+    """解析游标，返回排序字段对应的值；游标与排序字段不一致时抛出ValueError"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        sort, values = data['s'], data['v']
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('invalid cursor')
+    if sort != [('-' if desc else '') + name for name, _, desc in columns] or len(values) != len(columns):
+        raise ValueError('cursor does not match sort')
+    return [_cursor_value(column, value) for (_, column, _), value in zip(columns, values)]
+
+
 class OrmCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
-    def __init__(self, model: Type[ModelType]):
+    def __init__(self, model: Type[ModelType], cache_ttl: float = 0, cache_size: int = 1024):
         """
         CRUD object with default methods to Create, Read, Update, Delete (CRUD).
         **Parameters**
         * `model`: A SQLAlchemy model class
         * `schema`: A Pydantic model (schema) class
+        * `cache_ttl`: get/get_one/count/list结果的缓存时间(秒)，0为不缓存；
+          同一模型的缓存由全部CRUD对象共用，任一CRUD对象写入该模型时清空，读取时按各自的cache_ttl判断是否过期
+        * `cache_size`: 该模型最多缓存的查询数，多个CRUD对象取最大值
         """
         assert sqlalchemy is not None, "'sqlalchemy' must be installed to use OrmCRUDBase"
         self.model = model
+        self.cache_ttl = cache_ttl
+        self.cache = QueryCache.for_model(model, cache_size) if cache_ttl > 0 else None
+
+    def _cached(self, db: Session, key, loader, kind='one', row_type='model', columns=None):
+        # 只加载了部分字段的ORM对象不缓存，tuple/dict结果原样缓存
+        if self.cache is None or (row_type == 'model' and columns):
+            return loader()
+        if row_type != 'model':
+            kind = 'scalar'
+            key += (row_type, tuple(columns or ()))
+        return self.cache.get_or_load(db, key, loader, kind, self.cache_ttl)
+
+    def _invalidate(self, db: Session):
+        cache = self.cache or QueryCache.get(self.model)
+        if cache is not None:
+            cache.invalidate(db)
 
     def count(self, db: Session, **kwargs):
         """
@@ -54,33 +320,49 @@ class OrmCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         :param kwargs:
         :return:
         """
-        if kwargs:
-            return db.query(self.model).filter_by(**kwargs).count()
-        return db.query(self.model).count()
+        def _count():
+            if kwargs:
+                return db.query(self.model).filter_by(**kwargs).count()
+            return db.query(self.model).count()
+        return self._cached(db, ('count', tuple(sorted(kwargs.items()))), _count, 'scalar')
 
-    def get(self, db: Session, model_id: Any) -> Optional[ModelType]:
+    def get(
+            self, db: Session, model_id: Any, *,
+            columns: List[str] = None, row_type: str = 'model'
+    ) -> Optional[ModelType]:
         """
         根据id获取数据
 
         :param db:
         :param model_id:
+        :param columns: 只查询的字段
+        :param row_type: model: ORM对象 / tuple: 元组 / dict: 字典，tuple和dict不经过ORM，适用于只读接口
         :return:
         """
-        return db.query(self.model).get(model_id)
-    
-    def get_one(self, db: Session, **kwargs):
+        if row_type == 'model' and not columns:
+            return self._cached(db, ('get', model_id), lambda: db.query(self.model).get(model_id))
+        return self.get_one(db, columns=columns, row_type=row_type, id=model_id)
+
+    def get_one(self, db: Session, *, columns: List[str] = None, row_type: str = 'model', **kwargs):
         """
         根据查询条件获取一个数据
-        
-        :param db: 
-        :param kwargs: 
-        :return: 
+
+        :param db:
+        :param columns: 只查询的字段
+        :param row_type: model: ORM对象 / tuple: 元组 / dict: 字典
+        :param kwargs:
+        :return:
         """
-        return db.query(self.model).filter_by(**kwargs).one_or_none()
-    
+        def _get_one():
+            if row_type == 'model' and not columns:
+                return db.query(self.model).filter_by(**kwargs).one_or_none()
+            row = db.execute(_select_stmt(self.model, kwargs, row_type, columns)).one_or_none()
+            return None if row is None else _convert_row(row, row_type)
+        return self._cached(db, ('get_one', tuple(sorted(kwargs.items()))), _get_one, 'one', row_type, columns)
+
     def list(
             self, db: Session, *, sort: List[str] = None, offset: int = 0,
-            limit: int = 100, **kwargs
+            limit: int = 100, columns: List[str] = None, row_type: str = 'model', **kwargs
     ) -> List[ModelType]:
         """
         根据查询条件获取数据列表
@@ -89,17 +371,119 @@ class OrmCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         :param sort: 需要排序的字段 ['-create_time', 'update_time'] (负号为降序)
         :param offset:
         :param limit:
+        :param columns: 只查询的字段
+        :param row_type: model: ORM对象 / tuple: 元组 / dict: 字典
         :param kwargs:
         :return:
         """
+        key = ('list', tuple(sort or ()), offset, limit, tuple(sorted(kwargs.items())))
+        if row_type != 'model' or columns:
+            stmt = _list_stmt(self.model, sort, offset, limit, kwargs, row_type=row_type, columns=columns)
+            return self._cached(db, key, lambda: list(_convert_rows(db.execute(stmt), row_type)),
+                                'many', row_type, columns)
         if sort:
             sort = text(','.join(sort))
+
+        def _list():
+            if kwargs:
+                return db.query(self.model).filter_by(
+                    **kwargs).order_by(sort).offset(offset).limit(limit).all()
+            else:
+                return db.query(self.model).order_by(sort).offset(
+                    offset).limit(limit).all()
+        return self._cached(db, key, _list, 'many')
+
+    def list_with_total(
+            self, db: Session, *, sort: List[str] = None, offset: int = 0,
+            limit: int = 100, approximate_threshold: int = None,
+            columns: List[str] = None, row_type: str = 'model', **kwargs
+    ):
+        """
+        一次查询同时获取数据列表和总数，代替先count再list
+        >>> items, total = crud.list_with_total(db, sort=['-create_time'], offset=20, limit=10)
+        >>> return render_data(items, limit=10, offset=20, total=total)
+
+        :param db:
+        :param sort: 需要排序的字段，与list相同
+        :param offset:
+        :param limit:
+        :param approximate_threshold: 没有查询条件时，统计信息中的估计行数不小于该值则直接使用估计值作为总数
+                                      (PostgreSQL/MySQL)，None为总是精确计数
+        :param columns: 只查询的字段
+        :param row_type: model: ORM对象 / tuple: 元组 / dict: 字典
+        :param kwargs: 查询条件
+        :return: (数据列表, 总数)
+        """
+        dialect = _get_dialect(db)
+        if approximate_threshold is not None and not kwargs:
+            estimate_stmt = _estimate_count_stmt(dialect.name, self.model.__table__.name)
+            estimate = db.execute(estimate_stmt).scalar() if estimate_stmt is not None else None
+            if estimate is not None and estimate >= approximate_threshold:
+                stmt = _list_stmt(self.model, sort, offset, limit, kwargs, row_type=row_type, columns=columns)
+                return list(_convert_rows(db.execute(stmt), row_type)), estimate
+        if not _supports_window(dialect):
+            items = self.list(db, sort=sort, offset=offset, limit=limit, columns=columns, row_type=row_type, **kwargs)
+            return items, self.count(db, **kwargs)
+        stmt = _list_stmt(self.model, sort, offset, limit, kwargs, True, row_type, columns)
+        rows = db.execute(stmt).all()
+        if rows:
+            return [_convert_row(row, row_type, True) for row in rows], rows[0][-1]
+        # 超出最后一页时窗口函数没有结果行，需要单独计数
+        return [], self.count(db, **kwargs) if offset else 0
+
+    def iter_list(
+            self, db: Session, *, sort: List[str] = None, batch_size: int = 1000,
+            columns: List[str] = None, row_type: str = 'model', **kwargs
+    ):
+        """
+        流式读取查询结果，使用服务端游标每次取batch_size行，内存占用与结果总数无关，用于导出和批处理
+        迭代结束前db不能关闭，也不要在同一个db上执行其他查询
+        >>> for row in crud.iter_list(db, sort=['id'], row_type='dict'):
+        ...     writer.writerow(row)
+        >>> return stream_csv(crud.iter_list(db, row_type='dict'), filename='items.csv')
+
+        :param db:
+        :param sort: 需要排序的字段，与list相同
+        :param batch_size: 每批从数据库读取的行数
+        :param columns: 只查询的字段
+        :param row_type: model: ORM对象 / tuple: 元组 / dict: 字典，tuple和dict不经过ORM，开销更小
+        :param kwargs: 查询条件
+        :return: 生成器
+        """
+        stmt = _list_stmt(self.model, sort, 0, None, kwargs, row_type=row_type, columns=columns)
+        result = db.execute(stmt.execution_options(stream_results=True, yield_per=batch_size))
+        try:
+            yield from _convert_rows(result, row_type)
+        finally:
+            result.close()
+
+    def list_by_cursor(
+            self, db: Session, *, sort: List[str] = None, cursor: str = None,
+            limit: int = 100, **kwargs
+    ):
+        """
+        游标(keyset)分页，翻页的耗时与页数无关，适用于数据量大的表
+        >>> items, next_cursor = crud.list_by_cursor(db, sort=['-create_time'], limit=20)
+        >>> items, next_cursor = crud.list_by_cursor(db, sort=['-create_time'], cursor=next_cursor, limit=20)
+        >>> return render_data(items, limit=20, cursor=cursor, next_cursor=next_cursor)
+
+        :param db:
+        :param sort: 排序字段，与list相同，会自动追加id保证顺序唯一；排序字段不能为NULL
+        :param cursor: 上一页返回的next_cursor，为空时查询第一页
+        :param limit:
+        :param kwargs: 查询条件
+        :return: (数据列表, 下一页的游标)，没有下一页时游标为None
+        """
+        columns = _parse_sort(self.model, sort)
+        query = db.query(self.model)
         if kwargs:
-            return db.query(self.model).filter_by(
-                **kwargs).order_by(sort).offset(offset).limit(limit).all()
-        else:
-            return db.query(self.model).order_by(sort).offset(
-                offset).limit(limit).all()
+            query = query.filter_by(**kwargs)
+        if cursor:
+            query = query.filter(_keyset_condition(columns, decode_cursor(columns, cursor)))
+        query = query.order_by(*[column.desc() if desc else column.asc() for _, column, desc in columns])
+        items = query.limit(limit + 1).all()
+        next_cursor = encode_cursor(columns, items[limit - 1]) if len(items) > limit else None
+        return items[:limit], next_cursor
 
     def create(
             self, db: Session, *,
@@ -118,11 +502,112 @@ class OrmCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             data = jsonable_encoder(data)
         db_obj = self.model(**data)  # type: ignore
         db.add(db_obj)
+        self._invalidate(db)
         if not is_transaction:
             db.commit()
             db.refresh(db_obj)
         return db_obj
 
+    def bulk_create(
+            self, db: Session, rows: List[Union[Dict[str, Any], CreateSchemaType]], *,
+            chunk_size: int = 1000, returning: bool = False, is_transaction: bool = False
+    ):
+        """
+        批量插入，每块数据一条executemany语句，不逐条refresh
+
+        :param db:
+        :param rows: dict或pydantic模型的列表
+        :param chunk_size: 每批插入的数量
+        :param returning: 是否返回主键；支持RETURNING的数据库(PostgreSQL)使用多行INSERT ... RETURNING，其他数据库逐条插入
+        :param is_transaction: 是否开启事务功能
+        :return: 主键列表(与rows顺序一致) 或 插入的行数
+        """
+        table = self.model.__table__
+        rows = [_row_dict(row) for row in rows]
+        ids = [None] * len(rows)
+        full_returning = returning and _get_dialect(db).full_returning
+        self._invalidate(db)
+        for chunk in _chunk_rows(rows, chunk_size):
+            indexes = [index for index, _ in chunk]
+            values = [row for _, row in chunk]
+            if full_returning:
+                result = db.execute(insert(table).values(values).returning(table.c.id))
+                for index, row in zip(indexes, result):
+                    ids[index] = row[0]
+            elif returning:
+                for index, row in chunk:
+                    ids[index] = db.execute(insert(table).values(row)).inserted_primary_key[0]
+            else:
+                db.execute(insert(table), values)
+        if not is_transaction:
+            db.commit()
+        return ids if returning else len(rows)
+
+    def bulk_update(
+            self, db: Session, rows: List[Union[Dict[str, Any], UpdateSchemaType]], *,
+            chunk_size: int = 1000, is_transaction: bool = False
+    ):
+        """
+        按id批量更新，字段相同的数据合并为一条executemany语句
+
+        :param db:
+        :param rows: 包含id和需要更新字段的dict或pydantic模型(只更新设置了的字段)
+        :param chunk_size: 每批更新的数量
+        :param is_transaction: 是否开启事务功能
+        :return: 数据库返回的更新行数之和，id不存在的行不计入；MySQL默认只统计值有变化的行，
+            驱动不支持executemany的行数时按提交的行数计算
+        """
+        table = self.model.__table__
+        rows = [_row_dict(row, exclude_unset=True) for row in rows]
+        self._invalidate(db)
+        updated = 0
+        for chunk in _chunk_rows(rows, chunk_size):
+            keys = [key for key in chunk[0][1] if key != 'id']
+            if not keys:
+                continue
+            result = db.execute(_bulk_update_stmt(table, keys),
+                                [{f'_{k}': v for k, v in row.items()} for _, row in chunk])
+            updated += _rowcount(result, len(chunk))
+        if not is_transaction:
+            db.commit()
+        return updated
+
+    def upsert_many(
+            self, db: Session, rows: List[Union[Dict[str, Any], CreateSchemaType]], *,
+            conflict_columns: List[str], update_columns: List[str] = None,
+            chunk_size: int = 1000, is_transaction: bool = False
+    ):
+        """
+        批量插入或更新
+        PostgreSQL/SQLite: INSERT ... ON CONFLICT DO UPDATE，MySQL: INSERT ... ON DUPLICATE KEY UPDATE
+
+        :param db:
+        :param rows: dict或pydantic模型的列表
+        :param conflict_columns: 判断冲突的字段，需要有唯一索引
+        :param update_columns: 冲突时更新的字段，默认为除冲突字段和id外的全部字段，空列表表示冲突时不更新
+        :param chunk_size: 每批处理的数量
+        :param is_transaction: 是否开启事务功能
+        :return: {'inserted': 新插入的行数, 'updated': 冲突的行数}
+        """
+        table = self.model.__table__
+        dialect_name = _get_dialect(db).name
+        rows = [_row_dict(row) for row in rows]
+        inserted = 0
+        self._invalidate(db)
+        for chunk in _chunk_rows(rows, chunk_size):
+            values = [row for _, row in chunk]
+            columns = _upsert_update_columns(values[0], conflict_columns, update_columns)
+            stmt = _upsert_stmt(dialect_name, table, values, conflict_columns, columns)
+            if dialect_name == 'postgresql':
+                inserted += sum(1 for row in db.execute(stmt) if row[0])
+            else:
+                existing = {tuple(row) for row in db.execute(_existing_keys_stmt(table, conflict_columns, values))}
+                inserted += len({tuple(row[c] for c in conflict_columns) for row in values} - existing)
+                db.execute(stmt)
+        if not is_transaction:
+            db.commit()
+        return {'inserted': inserted, 'updated': len(rows) - inserted}
+
     def update(
             self,
             db: Session, *,
@@ -144,6 +629,7 @@ class OrmCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
                 传入id和更新的数据
         注意：
             如果传入模型来进行更新，则'is_return_obj=False'失效，返回更新后的模型
+            传入id且is_return_obj=True时不预先加载对象，PostgreSQL使用 UPDATE ... RETURNING 一条语句完成
 
         :param db:
         :param model_id:    模型ID
@@ -162,6 +648,7 @@ class OrmCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             update_data = data
         else:
             update_data = data.dict(exclude_unset=True)
+        self._invalidate(db)
 
         if not is_return_obj and not obj:
             if model_id:
@@ -174,24 +661,74 @@ class OrmCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             if not is_transaction:
                 db.commit()
             return update_count
+        elif model_id and not obj:
+            return self._update_by_id(db, model_id, update_data, is_transaction)
         else:
             if not obj:
-                if model_id:
-                    obj = self.get(db, model_id)
-                else:
-                    obj = self.get_one(db, **query)
+                obj = self.get_one(db, **query)
             if obj:
-                obj_data = jsonable_encoder(obj)
-
-                for field in obj_data:
-                    if field in update_data:
-                        setattr(obj, field, update_data[field])
+                columns = _column_keys(self.model)
+                for field, value in update_data.items():
+                    if field in columns:
+                        setattr(obj, field, value)
                 db.add(obj)
                 if not is_transaction:
                     db.commit()
                     db.refresh(obj)
                 return obj
 
+    def _update_by_id(self, db: Session, model_id, update_data, is_transaction):
+        """
+        按id更新并返回更新后的对象，不预先加载对象
+        支持RETURNING的数据库(PostgreSQL)一条 UPDATE ... RETURNING 完成，其他数据库更新后按id查询一次
+        """
+        columns = _column_keys(self.model)
+        update_data = {k: v for k, v in update_data.items() if k in columns}
+        if not update_data:
+            return self.get(db, model_id)
+        if _get_dialect(db).full_returning:
+            stmt, keys = _update_returning_stmt(self.model, model_id, update_data)
+            row = db.execute(stmt).one_or_none()
+            if not is_transaction:
+                db.commit()
+            # 提交后再merge，对象不会因expire_on_commit而过期
+            return None if row is None else db.merge(_detached_obj(self.model, dict(zip(keys, row))), load=False)
+        stmt = sa_update(self.model).where(self.model.id == model_id).values(**update_data)
+        if not db.execute(stmt.execution_options(synchronize_session=False)).rowcount:
+            return None
+        if not is_transaction:
+            db.commit()
+        return db.get(self.model, model_id, populate_existing=True)
+
+    def update_by_query(
+            self, db: Session, data: Union[UpdateSchemaType, Dict[str, Any]],
+            ids: List[int] = None, is_transaction: bool = False, **kwargs
+    ):
+        """
+        按条件批量更新，一条UPDATE语句，不加载对象，也不同步Session中已加载的对象
+        >>> crud.update_by_query(db, {'status': 0}, group='g1')
+
+        :param db:
+        :param data: 需要更新的数据
+        :param ids: 按id更新，传入时忽略kwargs
+        :param is_transaction: 是否开启事务功能
+        :param kwargs: 查询条件
+        :return: 更新的行数
+        """
+        update_data = _row_dict(data, exclude_unset=True)
+        if not update_data:
+            return 0
+        self._invalidate(db)
+        stmt = sa_update(self.model).values(**update_data).execution_options(synchronize_session=False)
+        if ids:
+            stmt = stmt.where(self.model.id.in_(ids))
+        else:
+            stmt = stmt.filter_by(**kwargs)
+        update_count = db.execute(stmt).rowcount
+        if not is_transaction:
+            db.commit()
+        return update_count
+
     def delete(
             self, db: Session, *,
             model_id: int,
@@ -206,6 +743,7 @@ class OrmCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         :param is_transaction:  是否开启事务功能
         :return:
         """
+        self._invalidate(db)
         if is_return_obj:
             obj = db.query(self.model).get(model_id)
             db.delete(obj)
@@ -226,6 +764,7 @@ class OrmCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         :param kwargs:
         :return:
         """
+        self._invalidate(db)
         if ids:
             del_count = db.query(self.model).filter(
                 self.model.id.in_(ids)).delete(synchronize_session=False)
@@ -233,3 +772,321 @@ class OrmCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             del_count = db.query(self.model).filter_by(
                 **kwargs).delete(synchronize_session=False)
         return del_count
+
+
+class AsyncOrmCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    """
+    OrmCRUDBase的异步版本，基于SQLAlchemy的asyncio扩展，接口与OrmCRUDBase一致
+    >>> async def list_users(db: AsyncSession = Depends(async_get_db)):
+    ...     return await user_crud.list(db, sort=['-create_time'], limit=10)
+    """
+    def __init__(self, model: Type[ModelType]):
+        assert AsyncSession is not None, "'sqlalchemy>=1.4' must be installed to use AsyncOrmCRUDBase"
+        self.model = model
+
+    async def count(self, db: AsyncSession, **kwargs):
+        """根据条件获取总数量"""
+        stmt = select(func.count()).select_from(self.model)
+        if kwargs:
+            stmt = stmt.filter_by(**kwargs)
+        return (await db.execute(stmt)).scalar()
+
+    async def get(
+            self, db: AsyncSession, model_id: Any, *,
+            columns: List[str] = None, row_type: str = 'model'
+    ) -> Optional[ModelType]:
+        """根据id获取数据，columns/row_type与OrmCRUDBase.get相同"""
+        if row_type == 'model' and not columns:
+            return await db.get(self.model, model_id)
+        return await self.get_one(db, columns=columns, row_type=row_type, id=model_id)
+
+    async def get_one(self, db: AsyncSession, *, columns: List[str] = None, row_type: str = 'model', **kwargs):
+        """根据查询条件获取一个数据"""
+        row = (await db.execute(_select_stmt(self.model, kwargs, row_type, columns))).one_or_none()
+        return None if row is None else _convert_row(row, row_type)
+
+    async def list(
+            self, db: AsyncSession, *, sort: List[str] = None, offset: int = 0,
+            limit: int = 100, columns: List[str] = None, row_type: str = 'model', **kwargs
+    ) -> List[ModelType]:
+        """
+        根据查询条件获取数据列表
+
+        :param db:
+        :param sort: 需要排序的字段 ['-create_time', 'update_time'] (负号为降序)
+        :param offset:
+        :param limit:
+        :param columns: 只查询的字段
+        :param row_type: model: ORM对象 / tuple: 元组 / dict: 字典
+        :param kwargs:
+        :return:
+        """
+        stmt = _list_stmt(self.model, sort, offset, limit, kwargs, row_type=row_type, columns=columns)
+        return list(_convert_rows(await db.execute(stmt), row_type))
+
+    async def list_with_total(
+            self, db: AsyncSession, *, sort: List[str] = None, offset: int = 0,
+            limit: int = 100, approximate_threshold: int = None,
+            columns: List[str] = None, row_type: str = 'model', **kwargs
+    ):
+        """一次查询同时获取数据列表和总数，参数与OrmCRUDBase.list_with_total相同"""
+        dialect = _get_dialect(db)
+        if approximate_threshold is not None and not kwargs:
+            estimate_stmt = _estimate_count_stmt(dialect.name, self.model.__table__.name)
+            estimate = (await db.execute(estimate_stmt)).scalar() if estimate_stmt is not None else None
+            if estimate is not None and estimate >= approximate_threshold:
+                stmt = _list_stmt(self.model, sort, offset, limit, kwargs, row_type=row_type, columns=columns)
+                return list(_convert_rows(await db.execute(stmt), row_type)), estimate
+        if not _supports_window(dialect):
+            items = await self.list(
+                db, sort=sort, offset=offset, limit=limit, columns=columns, row_type=row_type, **kwargs)
+            return items, await self.count(db, **kwargs)
+        stmt = _list_stmt(self.model, sort, offset, limit, kwargs, True, row_type, columns)
+        rows = (await db.execute(stmt)).all()
+        if rows:
+            return [_convert_row(row, row_type, True) for row in rows], rows[0][-1]
+        return [], await self.count(db, **kwargs) if offset else 0
+
+    async def iter_list(
+            self, db: AsyncSession, *, sort: List[str] = None, batch_size: int = 1000,
+            columns: List[str] = None, row_type: str = 'model', **kwargs
+    ):
+        """
+        流式读取查询结果的异步生成器，参数与OrmCRUDBase.iter_list相同
+        >>> async for row in async_crud.iter_list(db, row_type='dict'):
+        ...     ...
+        """
+        stmt = _list_stmt(self.model, sort, 0, None, kwargs, row_type=row_type, columns=columns)
+        result = await db.stream(stmt.execution_options(yield_per=batch_size))
+        try:
+            if row_type == 'model':
+                async for obj in result.scalars():
+                    yield obj
+            else:
+                async for row in result:
+                    yield _convert_row(row, row_type)
+        finally:
+            await result.close()
+
+    async def list_by_cursor(
+            self, db: AsyncSession, *, sort: List[str] = None, cursor: str = None,
+            limit: int = 100, **kwargs
+    ):
+        """游标(keyset)分页，参数与 OrmCRUDBase.list_by_cursor 相同"""
+        columns = _parse_sort(self.model, sort)
+        stmt = select(self.model)
+        if kwargs:
+            stmt = stmt.filter_by(**kwargs)
+        if cursor:
+            stmt = stmt.where(_keyset_condition(columns, decode_cursor(columns, cursor)))
+        stmt = stmt.order_by(*[column.desc() if desc else column.asc() for _, column, desc in columns])
+        items = (await db.execute(stmt.limit(limit + 1))).scalars().all()
+        next_cursor = encode_cursor(columns, items[limit - 1]) if len(items) > limit else None
+        return items[:limit], next_cursor
+
+    async def create(
+            self, db: AsyncSession, *,
+            data: Union[Dict[str, Any], CreateSchemaType],
+            is_transaction: bool = False
+    ) -> ModelType:
+        """插入操作，返回创建的模型"""
+        if isinstance(data, BaseModel):
+            data = jsonable_encoder(data)
+        db_obj = self.model(**data)  # type: ignore
+        db.add(db_obj)
+        if not is_transaction:
+            await db.commit()
+            await db.refresh(db_obj)
+        return db_obj
+
+    async def bulk_create(
+            self, db: AsyncSession, rows: List[Union[Dict[str, Any], CreateSchemaType]], *,
+            chunk_size: int = 1000, returning: bool = False, is_transaction: bool = False
+    ):
+        """批量插入，参数与 OrmCRUDBase.bulk_create 相同"""
+        table = self.model.__table__
+        rows = [_row_dict(row) for row in rows]
+        ids = [None] * len(rows)
+        full_returning = returning and _get_dialect(db).full_returning
+        for chunk in _chunk_rows(rows, chunk_size):
+            indexes = [index for index, _ in chunk]
+            values = [row for _, row in chunk]
+            if full_returning:
+                result = await db.execute(insert(table).values(values).returning(table.c.id))
+                for index, row in zip(indexes, result):
+                    ids[index] = row[0]
+            elif returning:
+                for index, row in chunk:
+                    ids[index] = (await db.execute(insert(table).values(row))).inserted_primary_key[0]
+            else:
+                await db.execute(insert(table), values)
+        if not is_transaction:
+            await db.commit()
+        return ids if returning else len(rows)
+
+    async def bulk_update(
+            self, db: AsyncSession, rows: List[Union[Dict[str, Any], UpdateSchemaType]], *,
+            chunk_size: int = 1000, is_transaction: bool = False
+    ):
+        """按id批量更新，参数与 OrmCRUDBase.bulk_update 相同"""
+        table = self.model.__table__
+        rows = [_row_dict(row, exclude_unset=True) for row in rows]
+        updated = 0
+        for chunk in _chunk_rows(rows, chunk_size):
+            keys = [key for key in chunk[0][1] if key != 'id']
+            if not keys:
+                continue
+            result = await db.execute(_bulk_update_stmt(table, keys),
+                                      [{f'_{k}': v for k, v in row.items()} for _, row in chunk])
+            updated += _rowcount(result, len(chunk))
+        if not is_transaction:
+            await db.commit()
+        return updated
+
+    async def upsert_many(
+            self, db: AsyncSession, rows: List[Union[Dict[str, Any], CreateSchemaType]], *,
+            conflict_columns: List[str], update_columns: List[str] = None,
+            chunk_size: int = 1000, is_transaction: bool = False
+    ):
+        """批量插入或更新，参数与 OrmCRUDBase.upsert_many 相同"""
+        table = self.model.__table__
+        dialect_name = _get_dialect(db).name
+        rows = [_row_dict(row) for row in rows]
+        inserted = 0
+        for chunk in _chunk_rows(rows, chunk_size):
+            values = [row for _, row in chunk]
+            columns = _upsert_update_columns(values[0], conflict_columns, update_columns)
+            stmt = _upsert_stmt(dialect_name, table, values, conflict_columns, columns)
+            if dialect_name == 'postgresql':
+                inserted += sum(1 for row in await db.execute(stmt) if row[0])
+            else:
+                result = await db.execute(_existing_keys_stmt(table, conflict_columns, values))
+                existing = {tuple(row) for row in result}
+                inserted += len({tuple(row[c] for c in conflict_columns) for row in values} - existing)
+                await db.execute(stmt)
+        if not is_transaction:
+            await db.commit()
+        return {'inserted': inserted, 'updated': len(rows) - inserted}
+
+    async def update(
+            self,
+            db: AsyncSession, *,
+            model_id: int = None,
+            obj: ModelType = None,
+            query: Dict[str, Any] = None,
+            data: Union[UpdateSchemaType, Dict[str, Any]],
+            is_return_obj: bool = False,
+            is_transaction: bool = False
+    ) -> ModelType:
+        """
+        单个对象更新，参数与 OrmCRUDBase.update 相同
+
+        :return: update_count or obj or None
+        """
+        if not any((model_id, obj, query)):
+            raise ValueError('At least one of [model_id、query、obj] exists')
+
+        if isinstance(data, dict):
+            update_data = data
+        else:
+            update_data = data.dict(exclude_unset=True)
+
+        if not is_return_obj and not obj:
+            stmt = sa_update(self.model).values(**update_data).execution_options(synchronize_session=False)
+            if model_id:
+                stmt = stmt.where(self.model.id == model_id)
+            else:
+                stmt = stmt.filter_by(**query)
+            update_count = (await db.execute(stmt)).rowcount
+
+            if not is_transaction:
+                await db.commit()
+            return update_count
+        elif model_id and not obj:
+            return await self._update_by_id(db, model_id, update_data, is_transaction)
+        else:
+            if not obj:
+                obj = await self.get_one(db, **query)
+            if obj:
+                columns = _column_keys(self.model)
+                for field, value in update_data.items():
+                    if field in columns:
+                        setattr(obj, field, value)
+                db.add(obj)
+                if not is_transaction:
+                    await db.commit()
+                    await db.refresh(obj)
+                return obj
+
+    async def _update_by_id(self, db: AsyncSession, model_id, update_data, is_transaction):
+        """按id更新并返回更新后的对象，与 OrmCRUDBase._update_by_id 相同"""
+        columns = _column_keys(self.model)
+        update_data = {k: v for k, v in update_data.items() if k in columns}
+        if not update_data:
+            return await self.get(db, model_id)
+        if _get_dialect(db).full_returning:
+            stmt, keys = _update_returning_stmt(self.model, model_id, update_data)
+            row = (await db.execute(stmt)).one_or_none()
+            if not is_transaction:
+                await db.commit()
+            return None if row is None else await db.merge(
+                _detached_obj(self.model, dict(zip(keys, row))), load=False)
+        stmt = sa_update(self.model).where(self.model.id == model_id).values(**update_data)
+        if not (await db.execute(stmt.execution_options(synchronize_session=False))).rowcount:
+            return None
+        if not is_transaction:
+            await db.commit()
+        return await db.get(self.model, model_id, populate_existing=True)
+
+    async def update_by_query(
+            self, db: AsyncSession, data: Union[UpdateSchemaType, Dict[str, Any]],
+            ids: List[int] = None, is_transaction: bool = False, **kwargs
+    ):
+        """按条件批量更新，参数与 OrmCRUDBase.update_by_query 相同"""
+        update_data = _row_dict(data, exclude_unset=True)
+        if not update_data:
+            return 0
+        stmt = sa_update(self.model).values(**update_data).execution_options(synchronize_session=False)
+        if ids:
+            stmt = stmt.where(self.model.id.in_(ids))
+        else:
+            stmt = stmt.filter_by(**kwargs)
+        update_count = (await db.execute(stmt)).rowcount
+        if not is_transaction:
+            await db.commit()
+        return update_count
+
+    async def delete(
+            self, db: AsyncSession, *,
+            model_id: int,
+            is_return_obj: bool = False,
+            is_transaction: bool = False
+    ) -> ModelType:
+        """
+        :param db:
+        :param model_id:      模型ID
+        :param is_return_obj: 是否需要返回模型数据，默认为False，只返回删除成功的行数
+        :param is_transaction:  是否开启事务功能
+        :return:
+        """
+        if is_return_obj:
+            obj = await db.get(self.model, model_id)
+            await db.delete(obj)
+            if not is_transaction:
+                await db.commit()
+            return obj
+        else:
+            stmt = sa_delete(self.model).where(self.model.id == model_id).execution_options(synchronize_session=False)
+            del_count = (await db.execute(stmt)).rowcount
+            if not is_transaction:
+                await db.commit()
+            return del_count
+
+    async def bulk_delete(self, db: AsyncSession, ids: List[int] = None, **kwargs):
+        """与 OrmCRUDBase.bulk_delete 相同，不提交事务"""
+        stmt = sa_delete(self.model).execution_options(synchronize_session=False)
+        if ids:
+            stmt = stmt.where(self.model.id.in_(ids))
+        else:
+            stmt = stmt.filter_by(**kwargs)
+        return (await db.execute(stmt)).rowcount
@@ -6,6 +6,7 @@
 @desc: ...
 """
 import os
+from typing import List
 
 try:
     import yaml
@@ -32,6 +33,19 @@ class DefaultSetting(BaseSettings):
     SECRET_KEY: str = get_random_secret_key()
 
     DB_URI: str = None
+    ASYNC_DB_URI: str = None  # 异步数据库的URI，不配置则根据DB_URI替换为异步驱动
+    DB_POOL_SIZE: int = 5  # 连接池保持的连接数
+    DB_MAX_OVERFLOW: int = 10  # 连接池满时最多额外创建的连接数
+    DB_POOL_TIMEOUT: int = 30  # 获取连接的超时时间(秒)
+    DB_POOL_RECYCLE: int = 3600  # 连接的最长使用时间(秒)，应小于数据库的空闲断开时间，-1为不回收
+    DB_POOL_PRE_PING: bool = True  # 使用连接前检测连接是否可用
+    DB_REPLICA_URIS: List[str] = None  # 只读副本的URI，配置后get_db的读取发送到副本
+    DB_REPLICA_STRATEGY: str = 'round_robin'  # round_robin / least_latency
+    DB_REPLICA_CHECK_INTERVAL: int = 10  # 副本健康检查的间隔(秒)
+    DB_REPLICA_MAX_LAG: float = 1  # 副本的最大同步延迟(秒)，模型缓存清空后这段时间内从副本读取的结果不缓存
+    DB_PROFILE: bool = False  # 是否在get_engine()创建的引擎上启用SQL分析，见 yzcore.db.profiler
+    DB_SLOW_QUERY_MS: int = 200  # 慢查询阈值(毫秒)
+    DB_N_PLUS_ONE_THRESHOLD: int = 5  # 同一请求内相同语句执行多少次判断为N+1查询
     ID_URL: AnyUrl = None
     GENERATE_UUID_PATH: str = '/uuid/generate/'
     EXPLAIN_UUID_PATH: str = '/uuid/explain/'
@@ -1,19 +1,39 @@
-from yzcore.extensions.storage.oss import OssManager
-from yzcore.extensions.storage.obs import ObsManager
-from yzcore.extensions.storage.minio import MinioManager
-from yzcore.extensions.storage.amazon import S3Manager
-from yzcore.extensions.storage.azure import AzureManager
 from yzcore.extensions.storage.base import StorageRequestError
 from yzcore.extensions.storage.const import IMAGE_FORMAT_SET, StorageMode
-from yzcore.extensions.storage.schemas import OssConfig, ObsConfig, MinioConfig, S3Config, AzureConfig
+from yzcore.extensions.storage.registry import register_backend, get_backend, available_backends
 
 
 __all__ = [
     'IMAGE_FORMAT_SET',
     'StorageManage',
     'StorageRequestError',
+    'register_backend',
 ]
 
+# 兼容 from yzcore.extensions.storage import OssManager 的用法，访问时才导入对应的SDK
+_lazy_attrs = {
+    'OssManager': 'oss',
+    'ObsManager': 'obs',
+    'MinioManager': 'minio',
+    'S3Manager': 's3',
+    'AzureManager': 'azure',
+}
+
+
+def __getattr__(name):
+    if name in _lazy_attrs:
+        return get_backend(_lazy_attrs[name])[0]
+    if name == 'AsyncStorageManager':
+        from yzcore.extensions.storage.async_manager import AsyncStorageManager
+        return AsyncStorageManager
+    if name == 'AioS3Manager':
+        from yzcore.extensions.storage.aio_s3 import AioS3Manager
+        return AioS3Manager
+    if name in ('OssConfig', 'ObsConfig', 'MinioConfig', 'S3Config', 'AzureConfig', 'AioS3Config'):
+        from yzcore.extensions.storage import schemas
+        return getattr(schemas, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class StorageManage(object):
     """
@@ -28,25 +48,15 @@ class StorageManage(object):
     private_expire_time=30,  # 上传签名有效时间
     private_expire_time=30,  # 加签URl有效时间
 
+    mode对应的后端在第一次使用时才导入，第三方后端通过 register_backend 或 entry point 注册
     """
 
     def __new__(cls, storage_conf: dict):
+        mode = str(storage_conf['mode']).lower()
         try:
-            mode = StorageMode.__getitem__(storage_conf['mode'].lower()).value
-            storage_conf['mode'] = mode
+            manager_cls, config_cls = get_backend(mode)
         except KeyError:
-            raise KeyError(f'storage mode must be one of [oss|obs|minio|s3|azure], current is "{storage_conf["mode"]}"')
-
-        if mode == 'obs':
-            storage_manage = ObsManager(ObsConfig(**storage_conf))
-        elif mode == 'oss':
-            storage_manage = OssManager(OssConfig(**storage_conf))
-        elif mode == 'minio':
-            storage_manage = MinioManager(MinioConfig(**storage_conf))
-        elif mode == 's3':
-            storage_manage = S3Manager(S3Config(**storage_conf))
-        elif mode == 'azure':
-            storage_manage = AzureManager(AzureConfig(**storage_conf))
-        else:
-            storage_manage = None
-        return storage_manage
+            raise KeyError(
+                f'storage mode must be one of [{"|".join(available_backends())}], current is "{storage_conf["mode"]}"')
+        storage_conf['mode'] = mode
+        return manager_cls(config_cls(**storage_conf))
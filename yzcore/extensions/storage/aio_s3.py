@@ -0,0 +1,479 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@author: zhouwei
+@date: 2026/10/19
+@desc: 基于aiohttp的S3协议对象存储封装
+
+minio/s3/obs/oss都兼容S3协议，这里直接按AWS Signature V4签名发起请求，所有IO都在事件循环中完成，
+适合在FastAPI的 async def 视图中使用，不占用线程池。
+>>> storage = AioS3Manager(AioS3Config(mode='minio', endpoint='minio.local:9000', ...))
+>>> await storage.upload_obj(b'...', 'a/b.txt')
+>>> data = await storage.get_object('a/b.txt')
+"""
+import io
+import hmac
+import asyncio
+import hashlib
+import datetime
+from email.utils import parsedate_to_datetime
+from typing import Union, IO, AnyStr, AsyncIterator
+from urllib.parse import quote
+from xml.etree import ElementTree
+
+from yzcore.exceptions import NotFoundObject
+from yzcore.extensions.storage.base import StorageManagerBase, StorageRequestError
+from yzcore.extensions.storage.const import IMAGE_FORMAT_SET
+from yzcore.extensions.storage.schemas import AioS3Config
+from yzcore.utils import datetime2str
+
+try:
+    import aiohttp
+    from yarl import URL
+    from yzcore.request.aio_http import AioHTTP
+except ImportError:
+    aiohttp = None
+
+
+__all__ = ['AioS3Manager']
+
+UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+_S3_NS = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+
+
+def _sha256(data: bytes):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _hmac(key: bytes, msg: str):
+    return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
+
+def _quote(value, safe='-_.~'):
+    return quote(str(value), safe=safe)
+
+
+def _find(element, tag):
+    """兼容带命名空间和不带命名空间的XML响应"""
+    node = element.find(_S3_NS + tag)
+    if node is None:
+        node = element.find(tag)
+    return node
+
+
+def _findtext(element, tag, default=None):
+    node = _find(element, tag)
+    return default if node is None else node.text
+
+
+def _findall(element, tag):
+    return element.findall(_S3_NS + tag) or element.findall(tag)
+
+
+class AioS3Manager(object):
+    """异步S3协议对象存储控制器，接口与同步的StorageManager保持一致，方法均为协程（签名类方法除外）"""
+
+    def __init__(self, conf: AioS3Config):
+        if aiohttp is None:
+            raise ImportError("'aiohttp' must be installed to use AioS3Manager")
+        self.mode = conf.mode
+        self.access_key_id = conf.access_key_id
+        self.access_key_secret = conf.access_key_secret
+        self.scheme = conf.scheme.value
+        self.bucket_name = conf.bucket_name
+        self.endpoint = conf.endpoint
+        self.image_domain = conf.image_domain
+        self.asset_domain = conf.asset_domain
+        self.policy_expire_time = conf.policy_expire_time
+        self.private_expire_time = conf.private_expire_time
+        self.region = conf.region
+        self.addressing_style = conf.addressing_style
+        self.timeout = conf.timeout
+
+    # ---------------- 签名 ----------------
+
+    @property
+    def _host(self):
+        if self.addressing_style == 'virtual':
+            return f'{self.bucket_name}.{self.endpoint}'
+        return self.endpoint
+
+    def _path(self, key: str = ''):
+        path = '/' + _quote(key, safe='/-_.~') if key else '/'
+        if self.addressing_style == 'virtual':
+            return path
+        return f'/{self.bucket_name}{path}' if key else f'/{self.bucket_name}'
+
+    def _url(self, key: str = ''):
+        return f'{self.scheme}://{self._host}{self._path(key)}'
+
+    @staticmethod
+    def _canonical_query(query: dict):
+        return '&'.join(f'{_quote(k)}={_quote(v)}' for k, v in sorted(query.items()))
+
+    def _signing_key(self, date_stamp: str):
+        key = _hmac(f'AWS4{self.access_key_secret}'.encode(), date_stamp)
+        for msg in (self.region, 's3', 'aws4_request'):
+            key = _hmac(key, msg)
+        return key
+
+    def _signature(self, method, path, query: dict, headers: dict, payload_hash, amz_date):
+        """
+        计算 AWS Signature V4
+        :return: (signature, signed_headers, credential_scope)
+        """
+        canonical_query = self._canonical_query(query)
+        lower_headers = {k.lower(): str(v).strip() for k, v in headers.items()}
+        signed_headers = ';'.join(sorted(lower_headers))
+        canonical_headers = ''.join(f'{k}:{lower_headers[k]}\n' for k in sorted(lower_headers))
+        canonical_request = '\n'.join(
+            (method, path, canonical_query, canonical_headers, signed_headers, payload_hash))
+
+        scope = f'{amz_date[:8]}/{self.region}/s3/aws4_request'
+        string_to_sign = '\n'.join(
+            ('AWS4-HMAC-SHA256', amz_date, scope, _sha256(canonical_request.encode())))
+        signature = hmac.new(
+            self._signing_key(amz_date[:8]), string_to_sign.encode(), hashlib.sha256).hexdigest()
+        return signature, signed_headers, scope
+
+    @staticmethod
+    def _amz_date():
+        return datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+    def _sign_headers(self, method, key, query: dict, headers: dict, payload_hash):
+        amz_date = self._amz_date()
+        sign_headers = {
+            'host': self._host,
+            'x-amz-date': amz_date,
+            'x-amz-content-sha256': payload_hash,
+        }
+        # 只签名 host 和 x-amz-* 头，content-type/range 等不参与签名
+        sign_headers.update({k: v for k, v in headers.items() if k.lower().startswith('x-amz-')})
+        signature, signed_headers, scope = self._signature(
+            method, self._path(key), query, sign_headers, payload_hash, amz_date)
+        headers = dict(headers, **sign_headers)
+        headers.pop('host')
+        headers['Authorization'] = (
+            f'AWS4-HMAC-SHA256 Credential={self.access_key_id}/{scope}, '
+            f'SignedHeaders={signed_headers}, Signature={signature}'
+        )
+        return headers
+
+    def presign(self, method: str, key: str, expire: int = 0, query: dict = None):
+        """
+        生成预签名URL
+        :param method: GET/PUT/...
+        :param key: 对象存储中的key
+        :param expire: 有效时间(秒)
+        :param query: 需要一起签名的查询参数，如分片上传的 uploadId/partNumber
+        """
+        amz_date = self._amz_date()
+        query = dict(query or {})
+        query.update({
+            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+            'X-Amz-Credential': f'{self.access_key_id}/{amz_date[:8]}/{self.region}/s3/aws4_request',
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(expire or self.private_expire_time),
+            'X-Amz-SignedHeaders': 'host',
+        })
+        signature, _, _ = self._signature(
+            method.upper(), self._path(key), query, {'host': self._host}, UNSIGNED_PAYLOAD, amz_date)
+        query['X-Amz-Signature'] = signature
+        return f'{self._url(key)}?{self._canonical_query(query)}'
+
+    def get_sign_url(self, key, expire=0):
+        url = self.presign('GET', key, expire)
+        return '//' + url.split('//', 1)[-1]
+
+    def put_sign_url(self, key):
+        return self.presign('PUT', key, self.policy_expire_time)
+
+    def sign_part_urls(self, key: str, upload_id: str, part_numbers: list, expire=0):
+        """生成分片上传的签名URL，前端直接PUT分片数据"""
+        return {
+            n: self.presign('PUT', key, expire or self.private_expire_time,
+                            {'partNumber': str(n), 'uploadId': upload_id})
+            for n in part_numbers
+        }
+
+    # ---------------- 请求 ----------------
+
+    def _client_timeout(self, timeout: float = None, stream: bool = False):
+        """流式上传下载的耗时与文件大小有关，不限制总时长，只限制建立连接和两次读取之间的时间"""
+        if stream:
+            return aiohttp.ClientTimeout(total=None, sock_connect=timeout or self.timeout,
+                                         sock_read=timeout or self.timeout)
+        return aiohttp.ClientTimeout(total=timeout or self.timeout)
+
+    async def _request(self, method: str, key: str = '', query: dict = None, headers: dict = None,
+                       data: Union[bytes, AsyncIterator[bytes]] = None, timeout: float = None,
+                       stream: bool = False):
+        """
+        发起签名请求，返回 aiohttp 的响应对象，调用方负责 release
+        data 为bytes时对内容签名，为异步迭代器时使用 UNSIGNED-PAYLOAD 流式上传
+        stream 为True时用于传输文件内容的请求，不限制请求的总时长
+        """
+        query = {k: '' if v is None else str(v) for k, v in (query or {}).items()}
+        if data is None:
+            payload_hash = EMPTY_SHA256
+        elif isinstance(data, (bytes, bytearray)):
+            payload_hash = _sha256(data)
+        else:
+            payload_hash = UNSIGNED_PAYLOAD
+        headers = self._sign_headers(method, key, query, headers or {}, payload_hash)
+        url = self._url(key)
+        if query:
+            url = f'{url}?{self._canonical_query(query)}'
+        session = AioHTTP.get_session()
+        async with AioHTTP.semaphore:
+            # URL已按签名时的规则编码，不再让aiohttp重新编码
+            response = await session.request(
+                method, URL(url, encoded=True), headers=headers, data=data,
+                timeout=self._client_timeout(timeout, stream),
+            )
+        if response.status == 404:
+            response.release()
+            raise NotFoundObject()
+        if response.status >= 300:
+            body = await response.read()
+            response.release()
+            code, message = response.reason, body[:200]
+            try:
+                root = ElementTree.fromstring(body)
+                code, message = _findtext(root, 'Code', code), _findtext(root, 'Message', message)
+            except ElementTree.ParseError:
+                pass
+            raise StorageRequestError(f'{self.mode}: {method} {key} error {response.status} {code}: {message}')
+        return response
+
+    async def _request_xml(self, method, key='', query=None, headers=None, data=None):
+        response = await self._request(method, key, query, headers, data)
+        try:
+            body = await response.read()
+        finally:
+            response.release()
+        return ElementTree.fromstring(body) if body else None
+
+    async def is_exist_bucket(self, bucket_name=None):
+        try:
+            response = await self._request('HEAD')
+        except NotFoundObject:
+            return False
+        response.release()
+        return True
+
+    async def get_object_meta(self, key: str):
+        response = await self._request('HEAD', key)
+        response.release()
+        headers = response.headers
+        last_modified = headers.get('Last-Modified')
+        return {
+            'etag': headers.get('ETag', '').strip('"').lower(),
+            'size': int(headers.get('Content-Length', 0)),
+            'last_modified': datetime2str(parsedate_to_datetime(last_modified)) if last_modified else None,
+            'content_type': headers.get('Content-Type'),
+        }
+
+    async def file_exists(self, key):
+        try:
+            await self.get_object_meta(key)
+        except NotFoundObject:
+            return False
+        return True
+
+    async def get_object(self, key: str):
+        """读取整个文件的内容"""
+        response = await self._request('GET', key, stream=True)
+        try:
+            return await response.read()
+        finally:
+            response.release()
+
+    async def read_range(self, key: str, start: int, end: int):
+        """读取[start, end]之间的数据（包含end）"""
+        response = await self._request('GET', key, headers={'Range': f'bytes={start}-{end}'})
+        try:
+            return await response.read()
+        finally:
+            response.release()
+
+    async def download_stream(self, key: str, chunk_size: int = 64 * 1024):
+        """按块异步迭代文件内容"""
+        response = await self._request('GET', key, stream=True)
+        try:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+        finally:
+            response.release()
+
+    async def download_file(self, key: str, local_name: str, chunk_size: int = 64 * 1024):
+        """下载到本地文件，写文件的操作很快，直接在事件循环中进行"""
+        with open(local_name, 'wb') as f:
+            async for chunk in self.download_stream(key, chunk_size):
+                f.write(chunk)
+        return local_name
+
+    async def upload_obj(self, file_obj: Union[IO, AnyStr, AsyncIterator[bytes]], key: str, **kwargs):
+        """
+        上传文件
+        :param file_obj: bytes/str/文件对象，或者产出bytes的异步迭代器（流式上传，不计算内容的哈希）
+        :param key: 对象存储中的key
+        :param content_type: 不传则根据key的后缀判断
+        :param content_length: 异步迭代器上传时的文件大小，S3不支持chunked编码的上传
+        """
+        content_length = kwargs.get('content_length')
+        if isinstance(file_obj, str):
+            file_obj = file_obj.encode()
+        elif hasattr(file_obj, 'read'):
+            # 文件对象在线程池中分块读取，不阻塞事件循环
+            if content_length is None:
+                content_length = self._remaining_size(file_obj)
+            if content_length is None:
+                file_obj = await asyncio.get_event_loop().run_in_executor(None, file_obj.read)
+                if isinstance(file_obj, str):
+                    file_obj = file_obj.encode()
+            else:
+                file_obj = self._iter_file(file_obj)
+        headers = {'Content-Type': kwargs.get('content_type') or StorageManagerBase.parse_content_type(key)}
+        if not isinstance(file_obj, (bytes, bytearray)) and content_length is not None:
+            headers['Content-Length'] = str(content_length)
+        response = await self._request('PUT', key, headers=headers, data=file_obj, stream=True)
+        response.release()
+        return self.get_file_url(key)
+
+    @staticmethod
+    def _remaining_size(file_obj):
+        """文件对象从当前位置到末尾的大小，不支持seek时返回None"""
+        try:
+            position = file_obj.tell()
+            end = file_obj.seek(0, io.SEEK_END)
+            file_obj.seek(position)
+        except (AttributeError, OSError, ValueError):
+            return None
+        return end - position
+
+    @staticmethod
+    async def _iter_file(file_obj, chunk_size: int = 1024 * 1024):
+        loop = asyncio.get_event_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, file_obj.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk.encode() if isinstance(chunk, str) else chunk
+
+    async def delete_object(self, key: str):
+        response = await self._request('DELETE', key)
+        response.release()
+        return True
+
+    async def iter_objects(self, prefix='', marker=None, delimiter=None, max_keys=100):
+        """
+        列出一页文件
+        :param marker: 从该key之后开始列出
+        :return: [{'key':'', 'url':'', 'size':''}]
+        """
+        query = {'list-type': '2', 'prefix': prefix, 'max-keys': max_keys}
+        if marker:
+            query['start-after'] = marker
+        if delimiter:
+            query['delimiter'] = delimiter
+        root = await self._request_xml('GET', query=query)
+        return [
+            {
+                'key': _findtext(obj, 'Key'),
+                'url': self.get_file_url(_findtext(obj, 'Key')),
+                'size': int(_findtext(obj, 'Size', 0)),
+            }
+            for obj in _findall(root, 'Contents')
+        ]
+
+    async def list_objects(self, prefix='', delimiter=None, page_size=1000):
+        """异步迭代前缀下的全部文件，自动翻页"""
+        query = {'list-type': '2', 'prefix': prefix, 'max-keys': page_size}
+        if delimiter:
+            query['delimiter'] = delimiter
+        while True:
+            root = await self._request_xml('GET', query=query)
+            for obj in _findall(root, 'Contents'):
+                key = _findtext(obj, 'Key')
+                yield {'key': key, 'url': self.get_file_url(key), 'size': int(_findtext(obj, 'Size', 0))}
+            token = _findtext(root, 'NextContinuationToken')
+            if _findtext(root, 'IsTruncated') != 'true' or not token:
+                break
+            query['continuation-token'] = token
+
+    # ---------------- 分片上传 ----------------
+
+    async def init_multipart_upload(self, key: str, content_type: str = None):
+        headers = {'Content-Type': content_type or StorageManagerBase.parse_content_type(key)}
+        root = await self._request_xml('POST', key, {'uploads': ''}, headers)
+        return _findtext(root, 'UploadId')
+
+    async def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes):
+        response = await self._request(
+            'PUT', key, {'partNumber': part_number, 'uploadId': upload_id}, data=data, stream=True)
+        response.release()
+        return response.headers.get('ETag', '').strip('"')
+
+    async def complete_multipart_upload(self, key: str, upload_id: str, parts: list):
+        """
+        :param parts: [{'part_number': 1, 'etag': ''}]
+        """
+        body = ''.join(
+            f'<Part><PartNumber>{p["part_number"]}</PartNumber><ETag>"{p["etag"].strip(chr(34))}"</ETag></Part>'
+            for p in sorted(parts, key=lambda p: p['part_number'])
+        )
+        data = f'<CompleteMultipartUpload>{body}</CompleteMultipartUpload>'.encode()
+        root = await self._request_xml(
+            'POST', key, {'uploadId': upload_id}, {'Content-Type': 'application/xml'}, data)
+        # S3在200响应中也可能返回错误
+        if root is not None and root.tag.endswith('Error'):
+            raise StorageRequestError(
+                f'{self.mode}: complete multipart {key} error: {_findtext(root, "Message")}')
+        return self.get_file_url(key)
+
+    async def abort_multipart_upload(self, key: str, upload_id: str):
+        try:
+            response = await self._request('DELETE', key, {'uploadId': upload_id})
+        except NotFoundObject:
+            return True
+        response.release()
+        return True
+
+    async def list_parts(self, key: str, upload_id: str):
+        """:return: [{'part_number': 1, 'etag': '', 'size': 0}]"""
+        parts = []
+        query = {'uploadId': upload_id}
+        while True:
+            root = await self._request_xml('GET', key, query)
+            for part in _findall(root, 'Part'):
+                parts.append({
+                    'part_number': int(_findtext(part, 'PartNumber')),
+                    'etag': _findtext(part, 'ETag', '').strip('"'),
+                    'size': int(_findtext(part, 'Size', 0)),
+                })
+            marker = _findtext(root, 'NextPartNumberMarker')
+            if _findtext(root, 'IsTruncated') != 'true' or not marker:
+                break
+            query['part-number-marker'] = marker
+        return parts
+
+    # ---------------- URL ----------------
+
+    def get_file_url(self, key, with_scheme=False):
+        if self.addressing_style == 'virtual':
+            host = f'//{self.bucket_name}.{self.endpoint}'
+            bucket_path = ''
+        else:
+            host = f'//{self.endpoint}/{self.bucket_name}'
+            bucket_path = f'/{self.bucket_name}'
+        if not any((self.image_domain, self.asset_domain)):
+            resource_url = f'{host}/{key}'
+        elif key.split('.')[-1].lower() in IMAGE_FORMAT_SET:
+            resource_url = f'//{self.image_domain}{bucket_path}/{key}'
+        else:
+            resource_url = f'//{self.asset_domain}{bucket_path}/{key}'
+        if with_scheme:
+            resource_url = self.scheme + ':' + resource_url
+        return resource_url
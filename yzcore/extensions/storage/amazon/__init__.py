@@ -11,6 +11,7 @@ from os import PathLike
 
 from yzcore.extensions.storage.base import StorageManagerBase, StorageRequestError, logger
 from yzcore.extensions.storage.schemas import S3Config
+from yzcore.extensions.storage.throttle import throttle_stream, throttle_progress
 from yzcore.extensions.storage.utils import AnyStr2BytesIO
 from yzcore.extensions.storage.amazon.utils import wrap_request_return_bool, wrap_request_raise_404
 from yzcore.utils import datetime2str
@@ -93,9 +94,12 @@ class S3Manager(StorageManagerBase):
             HttpMethod='PUT',
         )
 
-    def iter_objects(self, prefix='', delimiter='', max_keys=100, **kwargs):
+    def iter_objects(self, prefix='', marker=None, delimiter='', max_keys=100):
+        params = {'Bucket': self.bucket_name, 'Prefix': prefix, 'Delimiter': delimiter or '', 'MaxKeys': max_keys}
+        if marker:
+            params['StartAfter'] = marker  # list_objects_v2没有Marker参数，从指定的key之后开始列出
         result = []
-        for obj in self.client.list_objects_v2(Bucket=self.bucket_name, Prefix=prefix, Delimiter=delimiter, MaxKeys=max_keys).get('Contents', []):
+        for obj in self.client.list_objects_v2(**params).get('Contents', []):
             result.append({
                 'key': obj.get('Key'),
                 'url': self.get_file_url(obj.get('Key')),
@@ -103,6 +107,14 @@ class S3Manager(StorageManagerBase):
             })
         return result
 
+    def walk_objects(self, prefix='', start_after=None, page_size=1000):
+        params = {'Bucket': self.bucket_name, 'Prefix': prefix, 'PaginationConfig': {'PageSize': page_size}}
+        if start_after:
+            params['StartAfter'] = start_after
+        for page in self.client.get_paginator('list_objects_v2').paginate(**params):
+            for obj in page.get('Contents', []):
+                yield {'key': obj.get('Key'), 'url': self.get_file_url(obj.get('Key')), 'size': obj.get('Size')}
+
     @wrap_request_raise_404
     def get_object_meta(self, key: str):
         response = self.client.head_object(Bucket=self.bucket_name, Key=key)
@@ -138,11 +150,16 @@ class S3Manager(StorageManagerBase):
     def download_file(self, key, local_name, **kwargs):
         self.client.download_file(Bucket=self.bucket_name, Key=key, Filename=local_name)
 
+    @wrap_request_raise_404
+    def read_range(self, key: str, start: int, end: int):
+        return self.client.get_object(Bucket=self.bucket_name, Key=key, Range=f'bytes={start}-{end}')['Body'].read()
+
     def upload_file(self, filepath: Union[str, PathLike], key: str, **kwargs):
         """上传文件"""
         extra_args = {'ContentType': self.parse_content_type(key)}
         try:
-            self.client.upload_file(Bucket=self.bucket_name, Key=key, Filename=filepath, ExtraArgs=extra_args)
+            self.client.upload_file(Bucket=self.bucket_name, Key=key, Filename=filepath, ExtraArgs=extra_args,
+                                    Callback=throttle_progress(cumulative=False))
             return self.get_file_url(key)
         except Exception:
             logger.error(f's3 upload error: {traceback.format_exc()}')
@@ -150,11 +167,12 @@ class S3Manager(StorageManagerBase):
 
     def upload_obj(self, file_obj: Union[IO, AnyStr], key: str, **kwargs):
         """上传文件流"""
-        extra_args = {'ContentType': self.parse_content_type(key)}
+        extra_args = {'ContentType': kwargs.get('content_type') or self.parse_content_type(key)}
         try:
             if isinstance(file_obj, (str, bytes)):
                 file_obj = AnyStr2BytesIO(file_obj)
-            self.client.upload_fileobj(Bucket=self.bucket_name, Key=key, Fileobj=file_obj, ExtraArgs=extra_args)
+            self.client.upload_fileobj(
+                Bucket=self.bucket_name, Key=key, Fileobj=throttle_stream(file_obj), ExtraArgs=extra_args)
             return self.get_file_url(key)
         except Exception:
             logger.error(f's3 upload error: {traceback.format_exc()}')
@@ -165,6 +183,53 @@ class S3Manager(StorageManagerBase):
         self.client.delete_object(Bucket=self.bucket_name, Key=key)
         return True
 
+    def init_multipart_upload(self, key: str, content_type: str = None):
+        """初始化分片上传，返回upload_id"""
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=key, ContentType=content_type or self.parse_content_type(key))
+        return response['UploadId']
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes):
+        """上传一个分片，返回分片的etag"""
+        response = self.client.upload_part(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data)
+        return response['ETag']
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list):
+        """合并分片"""
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': part['part_number'], 'ETag': part['etag']} for part in parts]},
+        )
+        return self.get_file_url(key)
+
+    def abort_multipart_upload(self, key: str, upload_id: str):
+        """取消分片上传"""
+        self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+        return True
+
+    def sign_part_urls(self, key: str, upload_id: str, part_numbers: list, expire=0):
+        """生成PUT上传分片的带签名URL"""
+        return {
+            part_number: self.client.generate_presigned_url(
+                ClientMethod='upload_part',
+                Params={'Bucket': self.bucket_name, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+                ExpiresIn=expire or self.private_expire_time,
+                HttpMethod='PUT',
+            )
+            for part_number in part_numbers
+        }
+
+    @wrap_request_raise_404
+    def list_parts(self, key: str, upload_id: str):
+        """查询已上传的分片"""
+        parts = []
+        paginator = self.client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=self.bucket_name, Key=key, UploadId=upload_id):
+            for part in page.get('Parts', []):
+                parts.append({'part_number': part['PartNumber'], 'etag': part['ETag'], 'size': part['Size']})
+        return parts
+
     def get_policy(
             self,
             filepath: str,
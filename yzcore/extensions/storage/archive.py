@@ -0,0 +1,257 @@
+#!/usr/bin/python3.6+
+# -*- coding:utf-8 -*-
+"""
+@author: zhouwei
+@date: 2026/10/19
+@desc: 将对象存储中的文件流式打包成 zip/tar
+
+边下载边打包边输出，不落地临时文件；多个文件并发下载，每个文件预读的数据块数量有上限，
+内存占用约为 concurrency * read_ahead * chunk_size。
+"""
+import time
+import tarfile
+import zipfile
+import threading
+from queue import Queue, Full
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from yzcore.extensions.storage.base import StorageManagerBase, StorageRequestError
+from yzcore.extensions.storage.throttle import BULK, throttle_stream
+
+
+__all__ = ['ArchiveStreamer']
+
+
+class _StreamBuffer(object):
+    """zipfile的输出对象，不可seek，写入的数据由迭代器取走"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _Entry(object):
+    """一个待打包的文件，下载线程把数据块放入队列，打包时从队列中读取"""
+    _eof = object()
+
+    def __init__(self, key, arcname, size=None, read_ahead=8):
+        self.key = key
+        self.arcname = arcname
+        self.size = size
+        self.queue = Queue(maxsize=read_ahead)
+        self._buffer = b''
+        self._finished = False
+
+    def read(self, size=-1):
+        while not self._finished and (size < 0 or len(self._buffer) < size):
+            chunk = self.queue.get()
+            if chunk is self._eof:
+                self._finished = True
+            elif isinstance(chunk, BaseException):
+                raise StorageRequestError(f'archive: download {self.key} error: {chunk}')
+            else:
+                self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class ArchiveStreamer(object):
+    """
+    对象存储文件流式打包，本身是迭代器(只能迭代一次)，可以直接作为StreamingResponse的内容
+    >>> streamer = ArchiveStreamer(storage_manage, prefix='projects/1/', fmt='zip')
+    >>> return response(
+    ...     streamer, mtype='stream', media_type=streamer.media_type,
+    ...     headers={'Content-Disposition': 'attachment; filename="project.zip"'},
+    ... )
+    """
+    media_types = {
+        'zip': 'application/zip',
+        'tar': 'application/x-tar',
+    }
+
+    def __init__(
+            self,
+            storage_manage: StorageManagerBase,
+            keys: List[str] = None,
+            prefix: str = None,
+            fmt: str = 'zip',
+            concurrency: int = 4,
+            read_ahead: int = 8,
+            chunk_size: int = 256 * 1024,
+            compression: int = zipfile.ZIP_STORED,
+            priority: str = BULK,
+    ):
+        """
+        :param storage_manage: 对象存储控制器
+        :param keys: 需要打包的key列表，与prefix二选一
+        :param prefix: 打包该前缀下的所有文件，压缩包内的路径为去掉前缀后的相对路径
+        :param fmt: zip / tar
+        :param concurrency: 同时下载的文件数量
+        :param read_ahead: 每个文件最多预读的数据块数量
+        :param chunk_size: 数据块大小
+        :param compression: zip的压缩方式，模型、图片等文件本身已压缩，默认只存储不压缩
+        :param priority: 传输优先级，打包属于后台任务，默认为bulk
+        """
+        if fmt not in self.media_types:
+            raise ValueError(f'archive format must be one of {list(self.media_types)}')
+        if keys is None and prefix is None:
+            raise ValueError('At least one of [keys、prefix] exists')
+        self.storage_manage = storage_manage
+        self.keys = keys
+        self.prefix = prefix
+        self.fmt = fmt
+        self.concurrency = concurrency
+        self.read_ahead = read_ahead
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.priority = priority
+        self._closed = threading.Event()
+        self._generator = None
+
+    @property
+    def media_type(self):
+        return self.media_types[self.fmt]
+
+    def _iter_entries(self):
+        if self.keys is not None:
+            for key in self.keys:
+                yield _Entry(key, key, read_ahead=self.read_ahead)
+        else:
+            for obj in self.storage_manage.walk_objects(prefix=self.prefix):
+                if obj['key'].endswith('/'):
+                    continue
+                arcname = obj['key'][len(self.prefix):].lstrip('/') or obj['key']
+                yield _Entry(obj['key'], arcname, obj.get('size'), read_ahead=self.read_ahead)
+
+    def _put(self, entry: _Entry, item):
+        """队列满时阻塞，打包端关闭后放弃"""
+        while not self._closed.is_set():
+            try:
+                entry.queue.put(item, timeout=0.5)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _produce(self, entry: _Entry):
+        stream = None
+        try:
+            if entry.size is None and self.fmt == 'tar':
+                entry.size = self.storage_manage.get_object_meta(entry.key)['size']
+            stream = throttle_stream(self.storage_manage.download_stream(entry.key), self.priority)
+            while True:
+                chunk = stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                if not self._put(entry, chunk):
+                    return
+            self._put(entry, entry._eof)
+        except Exception as e:
+            self._put(entry, e)
+        finally:
+            for method in ('close', 'release_conn'):
+                if stream is not None and hasattr(stream, method):
+                    getattr(stream, method)()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        # StreamingResponse在线程池中对同步迭代器逐次调用next()
+        if self._generator is None:
+            self._generator = self._generate()
+        return next(self._generator)
+
+    def close(self):
+        """提前结束打包，停止下载线程"""
+        if self._generator is not None:
+            self._generator.close()
+        self._closed.set()
+
+    def _generate(self):
+        buffer = _StreamBuffer()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        pending = []  # 已开始下载的文件，最多concurrency个
+        entries = self._iter_entries()
+        try:
+            if self.fmt == 'zip':
+                archive = zipfile.ZipFile(buffer, mode='w', compression=self.compression, allowZip64=True)
+            else:
+                archive = None
+
+            while True:
+                while len(pending) < self.concurrency:
+                    entry = next(entries, None)
+                    if entry is None:
+                        break
+                    pending.append((entry, executor.submit(self._produce, entry)))
+                if not pending:
+                    break
+                entry, future = pending.pop(0)
+                yield from self._write_entry(archive, buffer, entry, future)
+
+            if self.fmt == 'zip':
+                archive.close()
+                data = buffer.drain()
+            else:
+                # tar以两个空块结尾
+                data = tarfile.NUL * tarfile.BLOCKSIZE * 2
+            if data:
+                yield data
+        finally:
+            self._closed.set()
+            executor.shutdown(wait=False)
+
+    def _write_entry(self, archive, buffer: _StreamBuffer, entry: _Entry, future):
+        if self.fmt == 'zip':
+            info = zipfile.ZipInfo(entry.arcname, date_time=time.localtime()[:6])
+            info.compress_type = self.compression
+            with archive.open(info, mode='w', force_zip64=True) as f:
+                while True:
+                    chunk = entry.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+        else:
+            # tar需要提前知道文件大小，在下载线程中获取；这里直接输出tar格式的头和数据，避免整个文件在内存中缓冲
+            while entry.size is None and not future.done():
+                time.sleep(0.01)
+            if entry.size is None:
+                entry.read()  # 抛出下载线程中的异常
+            info = tarfile.TarInfo(entry.arcname)
+            info.size = entry.size
+            info.mtime = int(time.time())
+            yield info.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, 'surrogateescape')
+            written = 0
+            while True:
+                chunk = entry.read(self.chunk_size)
+                if not chunk:
+                    break
+                written += len(chunk)
+                yield chunk
+            if written != entry.size:
+                raise StorageRequestError(f'archive: {entry.key} size changed while downloading')
+            remainder = entry.size % tarfile.BLOCKSIZE
+            if remainder:
+                yield tarfile.NUL * (tarfile.BLOCKSIZE - remainder)
+            return
+        data = buffer.drain()
+        if data:
+            yield data
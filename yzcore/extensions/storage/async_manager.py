@@ -0,0 +1,244 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@author: zhouwei
+@date: 2026/10/19
+@desc: 同步对象存储控制器的异步封装
+
+SDK调用放到每个存储类型独立的线程池中执行，不占用Starlette默认的线程池；
+线程池和等待队列都有上限，队列满时调用方在事件循环中等待，不会无限堆积线程任务。
+>>> storage = AsyncStorageManager(storage_manage)
+>>> await storage.upload_obj(b'...', 'a/b.txt')
+>>> await storage.get_object_meta('a/b.txt', timeout=5)
+>>> async for obj in storage.walk_objects('a/'):  # 返回迭代器的方法改为异步迭代
+...     pass
+>>> stream = await storage.download_stream('a/b.txt')  # 返回文件流的方法改为异步读取
+>>> data = await stream.read()
+>>> AsyncStorageManager.stats()  # 各线程池的使用情况，用于调整线程数
+"""
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from yzcore.extensions.storage.base import StorageManagerBase
+
+
+__all__ = ['AsyncStorageManager', 'AsyncStream']
+
+DEFAULT_MAX_WORKERS = 16  # 每种存储类型的线程数
+DEFAULT_MAX_QUEUE = 256  # 线程都在忙时最多排队的任务数
+_EOF = object()
+
+
+class _BackendPool(object):
+    """一个存储类型的线程池及统计信息"""
+
+    def __init__(self, mode, max_workers, max_queue):
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'storage-{mode}')
+        self.active = 0  # 正在执行的任务数
+        self.queued = 0  # 已提交、等待线程的任务数
+        self.waiting = 0  # 队列已满、在事件循环中等待提交的调用数
+        self.completed = 0
+        self.cancelled = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+        self._semaphore = None
+        self._loop = None
+
+    def semaphore(self):
+        """信号量绑定事件循环，循环变化时（如测试中多次asyncio.run）重新创建"""
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_workers + self.max_queue)
+        return self._semaphore
+
+    def _run(self, func, args, kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    async def run(self, func, args, kwargs, timeout=None):
+        loop = asyncio.get_event_loop()
+        semaphore = self.semaphore()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        with self._lock:
+            self.queued += 1
+        try:
+            future = self.executor.submit(self._run, func, args, kwargs)
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            semaphore.release()
+            raise
+
+        def _done(f):
+            if f.cancelled():
+                # 未开始执行就被取消，_run没有机会更新计数
+                with self._lock:
+                    self.queued -= 1
+                    self.cancelled += 1
+            # 线程中的任务真正结束后才释放名额，超时/取消的调用仍然占用线程时不会继续堆积新任务
+            if loop.is_closed():
+                return  # 事件循环已关闭，信号量随循环一起废弃
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                pass  # 检查之后事件循环被关闭
+        future.add_done_callback(_done)
+
+        # wrap_future在协程被取消时会一并取消尚未开始执行的线程任务
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'active': self.active,
+            'queued': self.queued,
+            'waiting': self.waiting,
+            'utilization': round(self.active / self.max_workers, 3),
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'timeouts': self.timeouts,
+        }
+
+
+class AsyncStream(object):
+    """同步文件流的异步封装，读取和关闭都在存储类型的线程池中执行"""
+
+    def __init__(self, manager, stream, chunk_size: int = 64 * 1024):
+        self._manager = manager
+        self._stream = stream
+        self.chunk_size = chunk_size
+
+    async def read(self, size: int = -1):
+        return await self._manager.run(self._stream.read, size)
+
+    async def seek(self, offset: int, whence: int = 0):
+        return await self._manager.run(self._stream.seek, offset, whence)
+
+    async def close(self):
+        for method in ('close', 'release_conn'):
+            if hasattr(self._stream, method):
+                await self._manager.run(getattr(self._stream, method))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self.read(self.chunk_size)
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+class AsyncStorageManager(object):
+    """
+    对象存储控制器的异步封装，StorageManagerBase的方法都可以直接await，属性原样透传
+    已经是协程的方法（如upload_from_url）直接调用，不经过线程池
+    返回迭代器的方法（walk_objects）改为异步迭代，返回文件流的方法（download_stream、open、
+    download(is_stream=True)）await后得到AsyncStream，避免在事件循环中读取
+    """
+    _pools = {}  # mode -> _BackendPool
+    _pools_lock = threading.Lock()
+    _iterator_methods = {'walk_objects'}
+    _stream_methods = {'download_stream', 'open'}
+
+    def __init__(self, storage_manage: StorageManagerBase, timeout: float = None,
+                 max_workers: int = DEFAULT_MAX_WORKERS, max_queue: int = DEFAULT_MAX_QUEUE):
+        """
+        :param storage_manage: 同步的对象存储控制器
+        :param timeout: 默认超时时间(秒)，None为不限制；超时后协程立即返回，已开始执行的SDK调用会在线程中继续执行完
+        :param max_workers: 该存储类型线程池的线程数，同一存储类型第一次创建时生效
+        :param max_queue: 该存储类型最多排队的任务数，同一存储类型第一次创建时生效
+        """
+        self.storage_manage = storage_manage
+        self.timeout = timeout
+        self._pool = self.get_pool(storage_manage.mode, max_workers, max_queue)
+
+    @classmethod
+    def get_pool(cls, mode, max_workers=DEFAULT_MAX_WORKERS, max_queue=DEFAULT_MAX_QUEUE):
+        with cls._pools_lock:
+            if mode not in cls._pools:
+                cls._pools[mode] = _BackendPool(mode, max_workers, max_queue)
+            return cls._pools[mode]
+
+    @classmethod
+    def stats(cls):
+        """各存储类型线程池的使用情况"""
+        return {mode: pool.stats() for mode, pool in cls._pools.items()}
+
+    @classmethod
+    def shutdown(cls, wait: bool = True):
+        """关闭全部线程池，一般在应用的 on_shutdown 中调用"""
+        with cls._pools_lock:
+            pools, cls._pools = cls._pools, {}
+        for pool in pools.values():
+            pool.executor.shutdown(wait=wait)
+
+    async def run(self, func, *args, timeout: float = None, **kwargs):
+        """在该存储类型的线程池中执行任意同步函数"""
+        return await self._pool.run(func, args, kwargs, timeout or self.timeout)
+
+    async def _iterate(self, func, args, kwargs, timeout=None):
+        """在线程池中逐个取出同步迭代器的元素"""
+        iterator = iter(await self.run(func, *args, timeout=timeout, **kwargs))
+        try:
+            while True:
+                item = await self.run(next, iterator, _EOF, timeout=timeout)
+                if item is _EOF:
+                    return
+                yield item
+        finally:
+            if hasattr(iterator, 'close'):
+                await self.run(iterator.close)
+
+    def __getattr__(self, item):
+        attr = getattr(self.storage_manage, item)
+        if not callable(attr) or inspect.iscoroutinefunction(attr):
+            return attr
+
+        if item in self._iterator_methods:
+            def iter_wrapper(*args, timeout: float = None, **kwargs):
+                return self._iterate(attr, args, kwargs, timeout)
+            iter_wrapper.__name__ = item
+            iter_wrapper.__doc__ = attr.__doc__
+            return iter_wrapper
+
+        async def wrapper(*args, timeout: float = None, **kwargs):
+            result = await self.run(attr, *args, timeout=timeout, **kwargs)
+            if item in self._stream_methods or (item == 'download' and kwargs.get('is_stream')):
+                return AsyncStream(self, result)
+            if inspect.isgenerator(result):
+                result.close()
+                raise TypeError(f'{item} returns a generator, add it to AsyncStorageManager._iterator_methods')
+            return result
+        wrapper.__name__ = item
+        wrapper.__doc__ = attr.__doc__
+        return wrapper
@@ -5,21 +5,26 @@
 @date: 2023/04/17
 @desc: azure blob对象存储封装
 """
+import base64
+import hashlib
 import traceback
+import uuid
 from datetime import datetime, timedelta
 from io import BytesIO
+from urllib.parse import quote
 from typing import Union, IO, AnyStr
 from os import PathLike
 
 from yzcore.extensions.storage.base import StorageManagerBase, StorageRequestError, logger
 from yzcore.extensions.storage.schemas import AzureConfig
+from yzcore.extensions.storage.throttle import throttle_stream
 from yzcore.extensions.storage.azure.utils import wrap_request_raise_404
 from yzcore.utils.time_utils import datetime2str
 
 
 try:
     from azure.storage.blob import BlobServiceClient, ContentSettings, ContainerClient, generate_blob_sas,\
-        BlobSasPermissions
+        BlobSasPermissions, BlobBlock
     from azure.core.exceptions import ResourceExistsError
 except:
     BlobServiceClient = None
@@ -47,6 +52,9 @@ class AzureManager(StorageManagerBase):
         self.blob_service_client = BlobServiceClient.from_connection_string(self.connection_string)
         self.container_client = self.blob_service_client.get_container_client(self.bucket_name)
 
+    def _credential_digest(self):
+        return hashlib.sha256(f'{self.connection_string}:{self.account_key}'.encode()).hexdigest()
+
     def create_bucket(self, bucket_name):
         try:
             self.blob_service_client.create_container(bucket_name)
@@ -129,6 +137,13 @@ class AzureManager(StorageManagerBase):
             })
         return _result
 
+    def walk_objects(self, prefix='', start_after=None, page_size=1000):
+        """list_blobs会自动翻页，但不支持从指定的key开始，start_after之前的结果在本地跳过"""
+        for obj in self.container_client.list_blobs(name_starts_with=prefix, results_per_page=page_size):
+            if start_after and obj.name <= start_after:
+                continue
+            yield {'key': obj.name, 'url': self.get_file_url(obj.name), 'size': obj.size}
+
     @wrap_request_raise_404
     def get_object_meta(self, key: str):
         """azure的etag不像 oss/obs/minio 是文件的md5，而content_md5需要在上传时指定"""
@@ -171,6 +186,11 @@ class AzureManager(StorageManagerBase):
         with open(local_name, 'wb') as f:
             f.write(blob_client.download_blob().readall())
 
+    @wrap_request_raise_404
+    def read_range(self, key: str, start: int, end: int):
+        blob_client = self.container_client.get_blob_client(blob=key)
+        return blob_client.download_blob(offset=start, length=end - start + 1).readall()
+
     def upload_file(self, filepath: Union[str, PathLike], key: str, **kwargs):
         """上传文件流"""
         with open(filepath, 'rb') as f:
@@ -179,9 +199,9 @@ class AzureManager(StorageManagerBase):
     def upload_obj(self, file_obj: Union[IO, AnyStr], key: str, **kwargs):
         """上传文件流"""
         try:
-            content_settings = ContentSettings(content_type=self.parse_content_type(key))
+            content_settings = ContentSettings(content_type=kwargs.get('content_type') or self.parse_content_type(key))
             blob_client = self.container_client.get_blob_client(blob=key)
-            blob_client.upload_blob(file_obj, overwrite=True, content_settings=content_settings)
+            blob_client.upload_blob(throttle_stream(file_obj), overwrite=True, content_settings=content_settings)
             return self.get_file_url(key)
         except Exception:
             logger.error(f'azure blob upload error: {traceback.format_exc()}')
@@ -193,6 +213,81 @@ class AzureManager(StorageManagerBase):
         blob_client.delete_blob(delete_snapshots='include')
         return True
 
+    def init_multipart_upload(self, key: str, content_type: str = None):
+        """
+        azure的块blob没有upload_id的概念，这里生成一个随机id作为block_id的前缀，
+        用于区分同一个blob上不同批次上传的block；
+        content_type编码在upload_id中，由任意进程完成上传时都能取到
+        """
+        upload_id = uuid.uuid4().hex
+        if content_type:
+            upload_id += '.' + base64.urlsafe_b64encode(content_type.encode()).decode().rstrip('=')
+        return upload_id
+
+    @staticmethod
+    def _parse_upload_id(upload_id: str):
+        """返回(block_id前缀, content_type)"""
+        prefix, _, encoded = upload_id.partition('.')
+        if not encoded:
+            return prefix, None
+        return prefix, base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode()
+
+    @classmethod
+    def _block_id(cls, upload_id: str, part_number: int):
+        """同一个blob的block_id长度必须一致，只使用upload_id中固定长度的随机id"""
+        prefix, _ = cls._parse_upload_id(upload_id)
+        return base64.b64encode(f'{prefix}-{part_number:06d}'.encode()).decode()
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes):
+        """上传一个block，返回block_id作为etag"""
+        blob_client = self.container_client.get_blob_client(blob=key)
+        block_id = self._block_id(upload_id, part_number)
+        blob_client.stage_block(block_id, data, length=len(data))
+        return block_id
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list):
+        """提交block列表"""
+        blob_client = self.container_client.get_blob_client(blob=key)
+        parts = sorted(parts, key=lambda part: part['part_number'])
+        content_type = self._parse_upload_id(upload_id)[1] or self.parse_content_type(key)
+        blob_client.commit_block_list(
+            [BlobBlock(block_id=self._block_id(upload_id, part['part_number'])) for part in parts],
+            content_settings=ContentSettings(content_type=content_type),
+        )
+        return self.get_file_url(key)
+
+    def abort_multipart_upload(self, key: str, upload_id: str):
+        """azure未提交的block会在7天后自动清理，无需处理"""
+        return True
+
+    def sign_part_urls(self, key: str, upload_id: str, part_numbers: list, expire=0):
+        """
+        生成Put Block的带签名URL，前端直接PUT分片数据即可
+        """
+        expire_time = datetime.utcnow() + timedelta(seconds=expire or self.private_expire_time)
+        blob_client = self.container_client.get_blob_client(blob=key)
+        sas_sign = generate_blob_sas(
+            account_name=self.account_name, container_name=self.bucket_name, blob_name=key, account_key=self.account_key,
+            expiry=expire_time, permission=BlobSasPermissions(write=True)
+        )
+        return {
+            part_number: f'{blob_client.url}?comp=block&blockid={quote(self._block_id(upload_id, part_number))}&{sas_sign}'
+            for part_number in part_numbers
+        }
+
+    @wrap_request_raise_404
+    def list_parts(self, key: str, upload_id: str):
+        """查询未提交的block中属于该upload_id的部分"""
+        blob_client = self.container_client.get_blob_client(blob=key)
+        _, uncommitted = blob_client.get_block_list('uncommitted')
+        prefix, _ = self._parse_upload_id(upload_id)
+        parts = []
+        for block in uncommitted:
+            block_prefix, _, part_number = base64.b64decode(block.id).decode().rpartition('-')
+            if block_prefix == prefix:
+                parts.append({'part_number': int(part_number), 'etag': block.id, 'size': block.size})
+        return sorted(parts, key=lambda part: part['part_number'])
+
     def get_policy(
             self,
             filepath: str,
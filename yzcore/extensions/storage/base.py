@@ -1,14 +1,26 @@
+import io
 import os
+import time
 import shutil
+import asyncio
+import hashlib
+import weakref
+import tempfile
+import threading
 from typing import Union, IO, AnyStr
+from collections import OrderedDict
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
 from urllib.request import urlopen
 from urllib.error import URLError
 from ssl import SSLCertVerificationError
 
-from yzcore.extensions.storage.utils import create_temp_file, get_filename, get_url_path
-from yzcore.extensions.storage.const import IMAGE_FORMAT_SET, CONTENT_TYPE, DEFAULT_CONTENT_TYPE
+from yzcore.extensions.storage.utils import create_temp_file, get_filename, get_url_path, key_lock, file_lock, \
+    file_signature
+from yzcore.extensions.storage.const import IMAGE_FORMAT_SET, CONTENT_TYPE, DEFAULT_CONTENT_TYPE, \
+    MULTIPART_PART_SIZE, MULTIPART_MIN_PART_SIZE, URL_UPLOAD_CONCURRENCY, URL_UPLOAD_CHUNK_SIZE
 from yzcore.extensions.storage.schemas import BaseConfig
+from yzcore.extensions.storage.throttle import bandwidth_limiter, throttle_stream, current_priority
 from yzcore.exceptions import StorageRequestError
 from yzcore.logger import get_logger
 from yzcore.utils.decorator import cached_property
@@ -20,6 +32,11 @@ __all__ = ['StorageManagerBase', 'logger', 'StorageRequestError']
 
 
 class StorageManagerBase(metaclass=ABCMeta):
+    _url_upload_semaphores = weakref.WeakKeyDictionary()  # 事件循环 -> 限制URL转存并发数量的信号量
+    _check_cache = OrderedDict()  # check()的结果缓存，(mode, endpoint, bucket, 密钥摘要, check_mode) -> (time, result)
+    _check_cache_size = 256
+    _check_cache_lock = threading.Lock()
+    _download_lock_count = 64  # 跨进程下载锁文件的数量，按本地路径哈希分配
 
     @abstractmethod
     def __init__(self, conf: BaseConfig):
@@ -89,6 +106,25 @@ class StorageManagerBase(metaclass=ABCMeta):
             }]
         """
 
+    def walk_objects(self, prefix='', start_after=None, page_size=1000):
+        """
+        遍历前缀下的全部文件(包括子目录中的文件)，自动翻页，按key的字典序逐个返回
+        默认通过 iter_objects 的marker翻页，各存储可以使用SDK的分页接口覆盖
+        :param prefix: key前缀
+        :param start_after: 从该key之后开始(不包含该key)
+        :param page_size: 每次请求的数量
+        :return: 生成器，元素格式与 iter_objects 相同
+        """
+        marker = start_after
+        while True:
+            page = self.iter_objects(prefix=prefix, marker=marker, max_keys=page_size)
+            if not page:
+                return
+            for obj in page:
+                yield obj
+            # 服务端单页的数量可能小于page_size，直到返回空页才结束
+            marker = page[-1]['key']
+
     @abstractmethod
     def get_object_meta(self, key: str):
         """获取文件基本元信息，包括该Object的ETag、Size（文件大小）、LastModified，Content-Type，并不返回其内容"""
@@ -126,7 +162,7 @@ class StorageManagerBase(metaclass=ABCMeta):
         :return: 文件对象或文件下载后的本地路径
         """
         if is_stream:
-            return self.download_stream(key, **kwargs)
+            return throttle_stream(self.download_stream(key, **kwargs))
         else:
             if not local_name:
                 if path:
@@ -134,9 +170,47 @@ class StorageManagerBase(metaclass=ABCMeta):
                 else:
                     local_name = os.path.abspath(os.path.join(self.cache_path, key))
             self.make_dir(os.path.dirname(local_name))
-            self.download_file(key, local_name)
+            self._single_flight_download(key, local_name)
             return local_name
 
+    def _single_flight_download(self, key, local_name):
+        """
+        同一个本地文件同时只有一个下载任务，其余调用方等待并复用下载结果
+        进程内通过线程锁，跨进程通过固定数量的文件锁协调；先下载到临时文件，再原子替换到目标路径
+        """
+        local_name = os.path.abspath(local_name)
+        lock_dir = os.path.join(self.cache_path or tempfile.gettempdir(), '.yzcore_download_locks')
+        self.make_dir(lock_dir)
+        stripe = int(hashlib.md5(local_name.encode()).hexdigest(), 16) % self._download_lock_count
+        lock_path = os.path.join(lock_dir, f'{stripe}.lock')
+
+        before = file_signature(local_name)
+        with key_lock(local_name), file_lock(lock_path):
+            after = file_signature(local_name)
+            if after is not None and after != before:
+                # 等待锁的期间其他调用方已经完成了下载
+                return local_name
+            temp_name = f'{local_name}.{os.getpid()}.{threading.get_ident()}.part'
+            try:
+                self._download_to_file(key, temp_name)
+                os.replace(temp_name, local_name)
+            finally:
+                if os.path.exists(temp_name):
+                    os.remove(temp_name)
+        return local_name
+
+    def _download_to_file(self, key, local_name):
+        """开启限速时改为通过文件流下载，以便按优先级限速"""
+        if not bandwidth_limiter.enabled:
+            return self.download_file(key, local_name)
+        stream = throttle_stream(self.download_stream(key))
+        try:
+            with open(local_name, 'wb') as f:
+                shutil.copyfileobj(stream, f, URL_UPLOAD_CHUNK_SIZE)
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+
     @abstractmethod
     def download_stream(self, key, **kwargs):
         """下载文件流"""
@@ -145,6 +219,26 @@ class StorageManagerBase(metaclass=ABCMeta):
     def download_file(self, key, local_name, **kwargs):
         """下载文件"""
 
+    def read_range(self, key: str, start: int, end: int):
+        """读取文件[start, end]范围内的数据（包含end），返回bytes"""
+        raise NotImplementedError(f'{self.mode} does not support this operation')
+
+    def open(self, key: str, block_size: int = 1024 * 1024, cache_blocks: int = 16, read_ahead: int = 1):
+        """
+        以只读、可seek的文件对象方式打开对象存储中的文件，按需发起Range请求
+        >>> with storage_manage.open('models/a.glb') as f:
+        ...     f.seek(-1024, os.SEEK_END)
+        ...     tail = f.read()
+
+        :param key: 对象存储中的key
+        :param block_size: 每次Range请求的最小单位
+        :param cache_blocks: 最多缓存的块数量
+        :param read_ahead: 读取未缓存的块时，额外读取的后续块数量
+        """
+        from yzcore.extensions.storage.reader import StorageObjectReader
+        reader = StorageObjectReader(self, key, block_size=block_size, cache_blocks=cache_blocks, read_ahead=read_ahead)
+        return io.BufferedReader(reader, buffer_size=block_size)
+
     def upload(self, filepath: Union[str, os.PathLike], key: str, **kwargs):
         """上传文件"""
         return self.upload_file(filepath, key, **kwargs)
@@ -161,6 +255,171 @@ class StorageManagerBase(metaclass=ABCMeta):
     def delete_object(self, key: str):
         """删除文件"""
 
+    def init_multipart_upload(self, key: str, content_type: str = None):
+        """初始化分片上传，返回upload_id"""
+        raise NotImplementedError(f'{self.mode} does not support this operation')
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes):
+        """上传一个分片，part_number从1开始，返回分片的etag"""
+        raise NotImplementedError(f'{self.mode} does not support this operation')
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list):
+        """
+        合并分片，完成分片上传
+        :param parts: [{'part_number': 1, 'etag': ''}, ...]
+        """
+        raise NotImplementedError(f'{self.mode} does not support this operation')
+
+    def abort_multipart_upload(self, key: str, upload_id: str):
+        """取消分片上传，清理已上传的分片"""
+        raise NotImplementedError(f'{self.mode} does not support this operation')
+
+    def sign_part_urls(self, key: str, upload_id: str, part_numbers: list, expire=0):
+        """
+        生成PUT上传分片的带签名URL
+        :return: {part_number: url}
+        """
+        raise NotImplementedError(f'{self.mode} does not support this operation')
+
+    def list_parts(self, key: str, upload_id: str):
+        """
+        查询已上传的分片，用于断点续传
+        :return: [{'part_number': 1, 'etag': '', 'size': 0}, ...]
+        """
+        raise NotImplementedError(f'{self.mode} does not support this operation')
+
+    def create_multipart_session(self, key: str, part_count: int, content_type: str = None, expire=0):
+        """
+        创建浏览器直传的分片上传会话
+        前端拿到各个分片的URL后并行PUT上传，全部完成后调用 complete_multipart_session 合并；
+        上传中断时可通过 list_parts 查询已上传的分片，再用 sign_part_urls 获取剩余分片的URL
+
+        >>> session = storage_manage.create_multipart_session('models/a.glb', part_count=100)
+        >>> session['part_urls'][1]  # 第1个分片的上传URL
+
+        :param key: 对象存储中的key
+        :param part_count: 分片数量
+        :param content_type: 不传则根据key的后缀判断
+        :param expire: 分片URL的有效时间(秒)，默认为private_expire_time
+        :return: {'mode': '', 'key': '', 'upload_id': '', 'part_urls': {part_number: url}}
+        """
+        upload_id = self.init_multipart_upload(key, content_type)
+        return {
+            'mode': self.mode,
+            'key': key,
+            'upload_id': upload_id,
+            'part_urls': self.sign_part_urls(key, upload_id, list(range(1, part_count + 1)), expire),
+        }
+
+    def complete_multipart_session(self, key: str, upload_id: str, parts: list = None):
+        """
+        完成浏览器直传的分片上传会话
+        :param parts: 前端上传分片后获得的etag列表，不传则查询已上传的全部分片
+        :return: 文件的访问链接
+        """
+        if not parts:
+            parts = self.list_parts(key, upload_id)
+        if not parts:
+            raise StorageRequestError(f'{self.bucket_name}: no uploaded parts for {key}')
+        parts = sorted(parts, key=lambda part: part['part_number'])
+        return self.complete_multipart_upload(key, upload_id, parts)
+
+    async def upload_from_url(self, url: str, key: str, part_size: int = MULTIPART_PART_SIZE,
+                              headers: dict = None, timeout: int = 60):
+        """
+        从第三方URL转存文件，边下载边以分片方式上传，不落地临时文件
+        每个任务最多占用两个分片大小的内存（一个在上传，一个在读取）
+
+        >>> file_url = await storage_manage.upload_from_url('https://example.com/a.glb', 'assets/a.glb')
+
+        :param url: 源文件地址
+        :param key: 对象存储中的key
+        :param part_size: 分片大小，不小于5MB
+        :param headers: 请求源文件时的请求头
+        :param timeout: 读取源文件时单次读操作的超时时间(秒)
+        :return: 文件的访问链接
+        """
+        import aiohttp
+        from yzcore.request import AioHTTP
+
+        if part_size < MULTIPART_MIN_PART_SIZE:
+            raise ValueError(f'part_size must be at least {MULTIPART_MIN_PART_SIZE} bytes')
+        loop = asyncio.get_event_loop()
+        semaphore = self._get_url_upload_semaphore(loop)
+        priority = current_priority()  # 线程池中无法获取当前上下文的优先级
+        client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        async with semaphore:
+            async with AioHTTP.get_session().get(url, headers=headers, timeout=client_timeout) as resp:
+                if resp.status >= 300:
+                    raise StorageRequestError(f'fetch {url} error: status {resp.status}')
+                content_type = resp.headers.get('Content-Type')
+                if not content_type or content_type == DEFAULT_CONTENT_TYPE:
+                    content_type = self.parse_content_type(key)
+
+                # 已知大小且不超过一个分片时直接上传
+                if resp.content_length is not None and resp.content_length <= part_size:
+                    data = await resp.read()
+                    await loop.run_in_executor(None, lambda: self.upload_obj(data, key, content_type=content_type))
+                    return self.get_file_url(key)
+
+                upload_id = None
+                parts = []
+                pending = None  # 正在上传的分片
+                buffer = bytearray()
+                try:
+                    async for chunk in resp.content.iter_chunked(URL_UPLOAD_CHUNK_SIZE):
+                        buffer.extend(chunk)
+                        while len(buffer) >= part_size:
+                            if upload_id is None:
+                                upload_id = await loop.run_in_executor(
+                                    None, self.init_multipart_upload, key, content_type)
+                            if pending is not None:
+                                parts.append(await pending)
+                                pending = None
+                            pending = self._submit_part(
+                                loop, key, upload_id, len(parts) + 1, bytes(buffer[:part_size]), priority)
+                            del buffer[:part_size]
+
+                    if upload_id is None:
+                        # 未知大小的小文件，读取完毕后直接上传
+                        await loop.run_in_executor(
+                            None, lambda: self.upload_obj(bytes(buffer), key, content_type=content_type))
+                        return self.get_file_url(key)
+
+                    if pending is not None:
+                        parts.append(await pending)
+                        pending = None
+                    if buffer:
+                        parts.append(await self._submit_part(
+                            loop, key, upload_id, len(parts) + 1, bytes(buffer), priority))
+                    await loop.run_in_executor(None, self.complete_multipart_upload, key, upload_id, parts)
+                except BaseException:
+                    if pending is not None:
+                        await asyncio.gather(pending, return_exceptions=True)
+                    if upload_id is not None:
+                        await loop.run_in_executor(None, self.abort_multipart_upload, key, upload_id)
+                    raise
+        return self.get_file_url(key)
+
+    @classmethod
+    def _get_url_upload_semaphore(cls, loop):
+        """信号量绑定事件循环，每个事件循环各自创建"""
+        semaphore = cls._url_upload_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = cls._url_upload_semaphores[loop] = asyncio.Semaphore(URL_UPLOAD_CONCURRENCY)
+        return semaphore
+
+    def _submit_part(self, loop, key, upload_id, part_number, data, priority=None):
+        """在线程池中上传分片，返回可等待的 {'part_number', 'etag'}"""
+        def _upload_part():
+            bandwidth_limiter.consume(len(data), priority)
+            return self.upload_part(key, upload_id, part_number, data)
+
+        async def _upload():
+            etag = await loop.run_in_executor(None, _upload_part)
+            return {'part_number': part_number, 'etag': etag}
+        return asyncio.ensure_future(_upload())
+
     @abstractmethod
     def get_policy(
             self,
@@ -244,7 +503,59 @@ class StorageManagerBase(metaclass=ABCMeta):
         cls.make_dir(dst_dir)
         shutil.copy(src, dst)
 
-    def check(self):
+    def check(self, mode: str = 'full', ttl: float = 0):
+        """
+        检查对象存储配置是否正确
+        :param mode:
+            full: 依次检查上传、加签URL、下载、元数据、遍历、删除、policy
+            concurrent: 检查项与full相同，互不依赖的检查项并行执行
+            liveness: 只检查存储桶是否存在和能否列出文件，适用于健康检查接口
+        :param ttl: 检查结果(包括失败)的缓存时间(秒)，0为不缓存
+        """
+        if mode not in ('full', 'concurrent', 'liveness'):
+            raise ValueError('check mode must be one of [full|concurrent|liveness]')
+        # 密钥不同的配置分别缓存，避免修改密钥后仍然返回旧密钥的检查结果
+        cache_key = (self.mode, self.endpoint, self.bucket_name, self.access_key_id, self._credential_digest(), mode)
+        if ttl:
+            with self._check_cache_lock:
+                cached = self._check_cache.get(cache_key)
+            if cached and time.monotonic() - cached[0] < ttl:
+                if isinstance(cached[1], Exception):
+                    raise cached[1]
+                return cached[1]
+        try:
+            result = getattr(self, f'_check_{mode}')()
+        except StorageRequestError as e:
+            if ttl:
+                self._set_check_cache(cache_key, e)
+            raise
+        if ttl:
+            self._set_check_cache(cache_key, result)
+        return result
+
+    def _credential_digest(self):
+        return hashlib.sha256(str(self.access_key_secret).encode()).hexdigest()
+
+    @classmethod
+    def _set_check_cache(cls, cache_key, result):
+        with cls._check_cache_lock:
+            cls._check_cache[cache_key] = (time.monotonic(), result)
+            cls._check_cache.move_to_end(cache_key)
+            while len(cls._check_cache) > cls._check_cache_size:
+                cls._check_cache.popitem(last=False)
+
+    def _check_liveness(self):
+        try:
+            assert self.is_exist_bucket(), f'{self.bucket_name}: No Such Bucket'
+            # 只取第一页的第一个文件，一次有上限的list请求，与存储桶中的文件数量无关
+            next(iter(self.walk_objects(page_size=1)), None)
+        except AssertionError as e:
+            raise StorageRequestError(e)
+        except Exception as e:
+            raise StorageRequestError(f'{self.bucket_name}: {e}')
+        return True
+
+    def _check_full(self):
         """通过上传和下载检查对象存储配置是否正确"""
         try:
             # 检查bucket是否正确
@@ -296,6 +607,55 @@ class StorageManagerBase(metaclass=ABCMeta):
         except AssertionError as e:
             raise StorageRequestError(e)
 
+    def _check_concurrent(self):
+        def _check_download(key, text):
+            download_text = self.download(key=key, is_stream=True).read().decode()
+            assert download_text == text, f'{self.bucket_name}: DownloadFailed'
+
+        def _check_meta(key):
+            assert self.get_object_meta(key), f'{self.bucket_name}: Get object metadata Failed'
+            assert self.update_file_headers(key, {'Content-Type': 'application/octet-stream'}), \
+                f'{self.bucket_name}: Update object metadata Failed'
+
+        def _check_iter(key):
+            assert self.iter_objects(key), f'{self.bucket_name} iter objects Failed'
+
+        def _check_policy():
+            policy = self.get_policy(filepath='upload_policy/', callback_url='https://hub.realibox.com/api/hub/v1/test',
+                                     callback_data={'a': 'b'})
+            assert isinstance(policy, dict), f'{self.bucket_name}: Get policy Failed'
+
+        def _wait(futures):
+            # 全部结束后再按提交顺序抛出第一个错误，避免删除测试文件时还有检查项在读取
+            wait(futures)
+            for future in futures:
+                future.result()
+
+        temp_file = create_temp_file(text_length=32)
+        text = temp_file.getvalue().decode()
+        key = f'storage_check_{text}.txt'
+        try:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                bucket_future = executor.submit(self.is_exist_bucket)
+                upload_future = executor.submit(self.upload_obj, temp_file, key=key)
+                policy_future = executor.submit(_check_policy)
+                assert bucket_future.result(), f'{self.bucket_name}: No Such Bucket'
+                assert upload_future.result(), f'{self.bucket_name}: Upload Failed'
+                try:
+                    _wait([
+                        executor.submit(self._check_sign_url, key),
+                        executor.submit(_check_download, key, text),
+                        executor.submit(_check_meta, key),
+                        executor.submit(_check_iter, key),
+                    ])
+                finally:
+                    self.delete_object(key)
+                assert not self.file_exists(key), f'{self.bucket_name} delete object Failed'
+                policy_future.result()
+            return True
+        except AssertionError as e:
+            raise StorageRequestError(e)
+
     def _cors_check(self):
         """检查存储桶的CORS配置是否设置正确"""
         allowed_methods = {'GET', 'PUT', 'POST', 'DELETE', 'HEAD'}
@@ -313,7 +673,7 @@ class StorageManagerBase(metaclass=ABCMeta):
         """判断加签url是否可以正常打开，并且配置了https"""
         try:
             sign_url = self.get_sign_url(key=key, expire=600)
-            resp = urlopen(self.scheme + ':' + sign_url)
+            resp = urlopen(self.scheme + ':' + sign_url, timeout=10)
             assert resp.status < 300, f'{self.bucket_name}: Sign Url Error, {sign_url}'
         except URLError as e:
             if isinstance(e.reason, SSLCertVerificationError):
@@ -8,6 +8,11 @@ IMAGE_FORMAT_SET = [
 
 DEFAULT_CONTENT_TYPE = 'application/octet-stream'
 
+MULTIPART_PART_SIZE = 8 * 1024 * 1024  # 分片上传的分片大小，S3协议要求除最后一片外不小于5MB
+MULTIPART_MIN_PART_SIZE = 5 * 1024 * 1024  # 分片的最小大小
+URL_UPLOAD_CONCURRENCY = 4  # 同时进行的URL转存任务数量
+URL_UPLOAD_CHUNK_SIZE = 64 * 1024  # 从URL读取数据的块大小
+
 CONTENT_TYPE = {
     'jpg': 'image/jpeg',
     'jpeg': 'image/jpeg',
@@ -7,12 +7,15 @@
 """
 import json
 import traceback
+from threading import Thread
+from itertools import islice
 from datetime import timedelta, datetime
 from os import PathLike
 from typing import Union, IO, AnyStr
 
 from yzcore.extensions.storage.base import StorageManagerBase, StorageRequestError, logger
 from yzcore.extensions.storage.schemas import MinioConfig
+from yzcore.extensions.storage.throttle import throttle_stream, throttle_progress
 from yzcore.extensions.storage.utils import AnyStr2BytesIO
 from yzcore.extensions.storage.minio.utils import wrap_request_return_bool, wrap_request_raise_404
 from yzcore.utils.time_utils import datetime2str
@@ -20,7 +23,7 @@ from yzcore.utils.time_utils import datetime2str
 
 try:
     from minio import Minio
-    from minio.datatypes import PostPolicy
+    from minio.datatypes import PostPolicy, Part
     from minio.commonconfig import CopySource
     from minio.deleteobjects import DeleteObject
     from minio.error import S3Error
@@ -28,6 +31,20 @@ except:
     Minio = None
 
 
+class _MinioProgress(Thread):
+    """minio要求progress是Thread的实例，这里只使用set_meta/update回调限速，不启动线程"""
+
+    def __init__(self, callback):
+        super(_MinioProgress, self).__init__(daemon=True)
+        self._callback = callback
+
+    def set_meta(self, object_name, total_length):
+        pass
+
+    def update(self, size):
+        self._callback(size)
+
+
 class MinioManager(StorageManagerBase):
 
     def __init__(self, conf: MinioConfig):
@@ -134,11 +151,13 @@ class MinioManager(StorageManagerBase):
     def put_sign_url(self, key):
         return self.minioClient.presigned_put_object(self.bucket_name, key)
 
-    def iter_objects(self, prefix='', **kwargs):
+    def iter_objects(self, prefix='', marker=None, delimiter=None, max_keys=100):
+        """minio只支持 / 作为分隔符，只列出当前目录下的文件，包括子目录的遍历使用walk_objects"""
         client = self._internal_minio_client_first()
-        objects = client.list_objects(self.bucket_name, prefix=prefix)
+        objects = client.list_objects(self.bucket_name, prefix=prefix, start_after=marker)
         _result = []
-        for obj in objects:
+        # list_objects是自动翻页的生成器，取够max_keys个后不再请求后续的页
+        for obj in islice(objects, max_keys):
             _result.append({
                 'key': obj.object_name,
                 'url': self.get_file_url(obj.object_name),
@@ -146,6 +165,12 @@ class MinioManager(StorageManagerBase):
             })
         return _result
 
+    def walk_objects(self, prefix='', start_after=None, page_size=1000):
+        """minio SDK的list_objects会自动翻页"""
+        client = self._internal_minio_client_first()
+        for obj in client.list_objects(self.bucket_name, prefix=prefix, recursive=True, start_after=start_after):
+            yield {'key': obj.object_name, 'url': self.get_file_url(obj.object_name), 'size': obj.size}
+
     @wrap_request_raise_404
     def get_object_meta(self, key: str):
         """获取文件基本元信息，包括该Object的ETag、Size（文件大小）、LastModified，Content-Type，并不返回其内容"""
@@ -180,12 +205,24 @@ class MinioManager(StorageManagerBase):
         client = self._internal_minio_client_first()
         client.fget_object(self.bucket_name, key, local_name)
 
+    @wrap_request_raise_404
+    def read_range(self, key: str, start: int, end: int):
+        client = self._internal_minio_client_first()
+        response = client.get_object(self.bucket_name, key, offset=start, length=end - start + 1)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
     def upload_file(self, filepath: Union[str, PathLike], key: str, **kwargs):
         """上传文件"""
         client = self._internal_minio_client_first()
         try:
             content_type = self.parse_content_type(key)
-            client.fput_object(self.bucket_name, key, filepath, content_type=content_type)
+            callback = throttle_progress(cumulative=False)
+            client.fput_object(self.bucket_name, key, filepath, content_type=content_type,
+                               progress=_MinioProgress(callback) if callback else None)
             return self.get_file_url(key)
         except Exception:
             logger.error(f'minio upload error: {traceback.format_exc()}')
@@ -197,8 +234,8 @@ class MinioManager(StorageManagerBase):
         try:
             if isinstance(file_obj, (str, bytes)):
                 file_obj = AnyStr2BytesIO(file_obj)
-            content_type = self.parse_content_type(key)
-            client.put_object(self.bucket_name, key, file_obj, length=-1, content_type=content_type,
+            content_type = kwargs.get('content_type') or self.parse_content_type(key)
+            client.put_object(self.bucket_name, key, throttle_stream(file_obj), length=-1, content_type=content_type,
                               part_size=1024 * 1024 * 5)
             return self.get_file_url(key)
         except Exception:
@@ -214,6 +251,55 @@ class MinioManager(StorageManagerBase):
             raise StorageRequestError('minio delete file error')
         return True
 
+    def init_multipart_upload(self, key: str, content_type: str = None):
+        """初始化分片上传，返回upload_id"""
+        client = self._internal_minio_client_first()
+        headers = {'Content-Type': content_type or self.parse_content_type(key)}
+        return client._create_multipart_upload(self.bucket_name, key, headers)
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes):
+        """上传一个分片，返回分片的etag"""
+        client = self._internal_minio_client_first()
+        return client._upload_part(self.bucket_name, key, data, None, upload_id, part_number)
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list):
+        """合并分片"""
+        client = self._internal_minio_client_first()
+        parts = [Part(part['part_number'], part['etag'].strip('"')) for part in parts]
+        client._complete_multipart_upload(self.bucket_name, key, upload_id, parts)
+        return self.get_file_url(key)
+
+    def abort_multipart_upload(self, key: str, upload_id: str):
+        """取消分片上传"""
+        client = self._internal_minio_client_first()
+        client._abort_multipart_upload(self.bucket_name, key, upload_id)
+        return True
+
+    def sign_part_urls(self, key: str, upload_id: str, part_numbers: list, expire=0):
+        """生成PUT上传分片的带签名URL，使用外网地址"""
+        expire_time = timedelta(seconds=expire or self.private_expire_time)
+        return {
+            part_number: self.minioClient.get_presigned_url(
+                'PUT', self.bucket_name, key, expires=expire_time,
+                extra_query_params={'partNumber': str(part_number), 'uploadId': upload_id},
+            )
+            for part_number in part_numbers
+        }
+
+    @wrap_request_raise_404
+    def list_parts(self, key: str, upload_id: str):
+        """查询已上传的分片"""
+        client = self._internal_minio_client_first()
+        parts = []
+        marker = None
+        while True:
+            result = client._list_parts(self.bucket_name, key, upload_id, part_number_marker=marker)
+            for part in result.parts:
+                parts.append({'part_number': part.part_number, 'etag': part.etag, 'size': part.size})
+            if not result.is_truncated:
+                return parts
+            marker = result.next_part_number_marker
+
     def get_policy(
             self,
             filepath: str,
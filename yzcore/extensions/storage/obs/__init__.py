@@ -13,6 +13,7 @@ from os import PathLike
 from yzcore.extensions.storage.base import StorageManagerBase, StorageRequestError
 from yzcore.extensions.storage.obs.utils import wrap_request_return_bool
 from yzcore.extensions.storage.schemas import ObsConfig
+from yzcore.extensions.storage.throttle import bandwidth_limiter, throttle_stream
 from yzcore.exceptions import NotFoundObject
 
 try:
@@ -112,6 +113,19 @@ class ObsManager(StorageManagerBase):
             })
         return _result
 
+    def walk_objects(self, prefix='', start_after=None, page_size=1000):
+        marker = start_after
+        while True:
+            resp = self.obsClient.listObjects(self.bucket_name, prefix=prefix, marker=marker, max_keys=page_size)
+            if resp.status >= 300:
+                raise StorageRequestError(
+                    f"static_code: {resp.status}, errorCode: {resp.errorCode}. Message: {resp.errorMessage}.")
+            for obj in resp.body.contents:
+                yield {'key': obj['key'], 'url': self.get_file_url(key=obj['key']), 'size': obj['size']}
+            if not resp.body.is_truncated or not resp.body.contents:
+                return
+            marker = resp.body.next_marker or resp.body.contents[-1]['key']
+
     def download_stream(self, key, **kwargs):
         resp = self.obsClient.getObject(self.bucket_name, key, loadStreamInMemory=False)
         if resp.status == 404:
@@ -127,8 +141,22 @@ class ObsManager(StorageManagerBase):
         if resp.status == 404:
             raise NotFoundObject()
 
+    def read_range(self, key: str, start: int, end: int):
+        resp = self.obsClient.getObject(
+            self.bucket_name, key, headers=obs.GetObjectHeader(range=f'{start}-{end}'), loadStreamInMemory=True)
+        if resp.status == 404:
+            raise NotFoundObject()
+        if resp.status >= 300:
+            raise StorageRequestError(
+                f"static_code: {resp.status}, errorCode: {resp.errorCode}. Message: {resp.errorMessage}.")
+        return resp.body.buffer
+
     def upload_file(self, filepath: Union[str, PathLike], key: str, **kwargs):
         """上传文件"""
+        if bandwidth_limiter.enabled:
+            # putFile的进度回调在单独的线程中执行，无法阻塞上传；putFile同样是单次PUT，改为读取限速的文件流上传
+            with open(filepath, 'rb') as f:
+                return self.upload_obj(f, key)
         headers = obs.PutObjectHeader(contentType=self.parse_content_type(key))
         resp = self.obsClient.putFile(
             self.bucket_name, key, filepath, headers=headers)
@@ -139,9 +167,9 @@ class ObsManager(StorageManagerBase):
 
     def upload_obj(self, file_obj: Union[IO, AnyStr], key: str, **kwargs):
         """上传文件流"""
-        headers = obs.PutObjectHeader(contentType=self.parse_content_type(key))
+        headers = obs.PutObjectHeader(contentType=kwargs.get('content_type') or self.parse_content_type(key))
         resp = self.obsClient.putContent(
-            self.bucket_name, key, content=file_obj, headers=headers)
+            self.bucket_name, key, content=throttle_stream(file_obj), headers=headers)
         if resp.status >= 300:
             msg = resp.errorMessage
             raise StorageRequestError(f'obs upload error: {msg}')
@@ -152,6 +180,62 @@ class ObsManager(StorageManagerBase):
         self.obsClient.deleteObject(self.bucket_name, key)
         return True
 
+    def init_multipart_upload(self, key: str, content_type: str = None):
+        """初始化分片上传，返回upload_id"""
+        resp = self.obsClient.initiateMultipartUpload(
+            self.bucket_name, key, contentType=content_type or self.parse_content_type(key))
+        if resp.status >= 300:
+            raise StorageRequestError(f'obs init multipart upload error: {resp.errorMessage}')
+        return resp.body.uploadId
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes):
+        """上传一个分片，返回分片的etag"""
+        resp = self.obsClient.uploadPart(self.bucket_name, key, part_number, upload_id, content=data)
+        if resp.status >= 300:
+            raise StorageRequestError(f'obs upload part error: {resp.errorMessage}')
+        return resp.body.etag
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list):
+        """合并分片"""
+        request = obs.CompleteMultipartUploadRequest(
+            parts=[obs.CompletePart(partNum=part['part_number'], etag=part['etag']) for part in parts])
+        resp = self.obsClient.completeMultipartUpload(self.bucket_name, key, upload_id, request)
+        if resp.status >= 300:
+            raise StorageRequestError(f'obs complete multipart upload error: {resp.errorMessage}')
+        return self.get_file_url(key)
+
+    def abort_multipart_upload(self, key: str, upload_id: str):
+        """取消分片上传"""
+        self.obsClient.abortMultipartUpload(self.bucket_name, key, upload_id)
+        return True
+
+    def sign_part_urls(self, key: str, upload_id: str, part_numbers: list, expire=0):
+        """生成PUT上传分片的带签名URL"""
+        return {
+            part_number: self.obsClient.createSignedUrl(
+                'PUT', self.bucket_name, objectKey=key, expires=expire or self.private_expire_time,
+                queryParams={'partNumber': part_number, 'uploadId': upload_id},
+            ).signedUrl
+            for part_number in part_numbers
+        }
+
+    def list_parts(self, key: str, upload_id: str):
+        """查询已上传的分片"""
+        parts = []
+        marker = None
+        while True:
+            resp = self.obsClient.listParts(self.bucket_name, key, upload_id, partNumberMarker=marker)
+            if resp.status == 404:
+                raise NotFoundObject()
+            if resp.status >= 300:
+                raise StorageRequestError(
+                    f"static_code: {resp.status}, errorCode: {resp.errorCode}. Message: {resp.errorMessage}.")
+            for part in resp.body.parts:
+                parts.append({'part_number': part.partNumber, 'etag': part.etag, 'size': part.size})
+            if not resp.body.isTruncated:
+                return parts
+            marker = resp.body.nextPartNumberMarker
+
     def get_policy(
             self,
             filepath: str,
@@ -19,6 +19,7 @@ from yzcore.extensions.storage.base import StorageManagerBase, StorageRequestErr
 from yzcore.extensions.storage.oss.const import *
 from yzcore.extensions.storage.oss.utils import wrap_request_return_bool, wrap_request_raise_404
 from yzcore.extensions.storage.schemas import OssConfig
+from yzcore.extensions.storage.throttle import throttle_stream, throttle_progress
 
 try:
     import oss2
@@ -176,6 +177,10 @@ class OssManager(StorageManagerBase):
             })
         return _result
 
+    def walk_objects(self, prefix='', start_after=None, page_size=1000):
+        for obj in oss2.ObjectIterator(self.bucket, prefix=prefix, marker=start_after or '', max_keys=page_size):
+            yield {'key': obj.key, 'url': self.get_file_url(key=obj.key), 'size': obj.size}
+
     @wrap_request_raise_404
     def download_stream(self, key, process=None):
         return self.bucket.get_object(key, process=process)
@@ -184,6 +189,10 @@ class OssManager(StorageManagerBase):
     def download_file(self, key, local_name, process=None):
         self.bucket.get_object_to_file(key, local_name, process=process)
 
+    @wrap_request_raise_404
+    def read_range(self, key: str, start: int, end: int):
+        return self.bucket.get_object(key, byte_range=(start, end)).read()
+
     def upload_file(self, filepath: Union[str, PathLike], key: str, *, num_threads=2, multipart_threshold=None):
         """
         上传文件流
@@ -198,6 +207,7 @@ class OssManager(StorageManagerBase):
             headers=headers,
             num_threads=num_threads,
             multipart_threshold=multipart_threshold,
+            progress_callback=throttle_progress(),
         )
         if result.status // 100 != 2:
             raise StorageRequestError(f'oss upload error: {result.resp}')
@@ -206,8 +216,8 @@ class OssManager(StorageManagerBase):
 
     def upload_obj(self, file_obj: Union[IO, AnyStr], key: str, **kwargs):
         """上传文件流"""
-        headers = CaseInsensitiveDict({'Content-Type': self.parse_content_type(key)})
-        result = self.bucket.put_object(key, file_obj, headers=headers)
+        headers = CaseInsensitiveDict({'Content-Type': kwargs.get('content_type') or self.parse_content_type(key)})
+        result = self.bucket.put_object(key, throttle_stream(file_obj), headers=headers)
         if result.status // 100 != 2:
             raise StorageRequestError(f'oss upload error: {result.resp}')
         # 返回下载链接
@@ -218,6 +228,45 @@ class OssManager(StorageManagerBase):
         self.bucket.delete_object(key)
         return True
 
+    def init_multipart_upload(self, key: str, content_type: str = None):
+        """初始化分片上传，返回upload_id"""
+        headers = CaseInsensitiveDict({'Content-Type': content_type or self.parse_content_type(key)})
+        return self.bucket.init_multipart_upload(key, headers=headers).upload_id
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes):
+        """上传一个分片，返回分片的etag"""
+        return self.bucket.upload_part(key, upload_id, part_number, data).etag
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list):
+        """合并分片"""
+        parts = [oss2.models.PartInfo(part['part_number'], part['etag']) for part in parts]
+        result = self.bucket.complete_multipart_upload(key, upload_id, parts)
+        if result.status // 100 != 2:
+            raise StorageRequestError(f'oss complete multipart upload error: {result.resp}')
+        return self.get_file_url(key)
+
+    def abort_multipart_upload(self, key: str, upload_id: str):
+        """取消分片上传"""
+        self.bucket.abort_multipart_upload(key, upload_id)
+        return True
+
+    def sign_part_urls(self, key: str, upload_id: str, part_numbers: list, expire=0):
+        """生成PUT上传分片的带签名URL"""
+        return {
+            part_number: self.bucket.sign_url(
+                'PUT', key, expire or self.private_expire_time,
+                params={'partNumber': str(part_number), 'uploadId': upload_id},
+            )
+            for part_number in part_numbers
+        }
+
+    def list_parts(self, key: str, upload_id: str):
+        """查询已上传的分片"""
+        return [
+            {'part_number': part.part_number, 'etag': part.etag, 'size': part.size}
+            for part in oss2.PartIterator(self.bucket, key, upload_id)
+        ]
+
     def get_policy(
             self,
             filepath: str,
@@ -0,0 +1,120 @@
+#!/usr/bin/python3.6+
+# -*- coding:utf-8 -*-
+"""
+@author: zhouwei
+@date: 2026/10/19
+@desc: 对象存储文件的随机读取
+
+按块发起Range请求读取文件的部分内容，读取时顺带预读后续的块，已读取的块按LRU缓存，
+适用于只需要读取大文件头部、索引表等少量数据的场景。
+"""
+import io
+import threading
+from collections import OrderedDict
+
+from yzcore.extensions.storage.throttle import bandwidth_limiter, current_priority
+
+
+__all__ = ['StorageObjectReader']
+
+
+class StorageObjectReader(io.RawIOBase):
+    """
+    可seek的对象存储文件读取器，一般通过 storage_manage.open(key) 获取
+    >>> with storage_manage.open('models/a.glb') as f:
+    ...     header = f.read(12)
+    ...     f.seek(1024)
+    ...     chunk = f.read(4096)
+    """
+
+    def __init__(self, storage_manage, key: str, size: int = None, block_size: int = 1024 * 1024,
+                 cache_blocks: int = 16, read_ahead: int = 1):
+        """
+        :param storage_manage: 对象存储控制器
+        :param key: 对象存储中的key
+        :param size: 文件大小，不传则通过get_object_meta查询
+        :param block_size: 每次Range请求的最小单位
+        :param cache_blocks: 最多缓存的块数量
+        :param read_ahead: 读取未缓存的块时，额外读取的后续块数量
+        """
+        super().__init__()
+        self.storage_manage = storage_manage
+        self.key = key
+        self.size = storage_manage.get_object_meta(key)['size'] if size is None else size
+        self.block_size = block_size
+        self.cache_blocks = max(cache_blocks, read_ahead + 1)
+        self.read_ahead = read_ahead
+        self._position = 0
+        self._cache = OrderedDict()  # block_index -> bytes
+        self._lock = threading.Lock()
+        self._priority = current_priority()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f'invalid whence ({whence})')
+        if position < 0:
+            raise ValueError(f'negative seek position {position}')
+        self._position = position
+        return self._position
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        view = memoryview(buffer).cast('B')
+        length = min(len(view), self.size - self._position)
+        written = 0
+        while written < length:
+            index, offset = divmod(self._position, self.block_size)
+            block = self._get_block(index)
+            chunk = block[offset:offset + length - written]
+            if not chunk:  # 文件实际比size短(读取期间被覆盖等)，避免死循环
+                raise IOError(f'{self.key}: unexpected end of object at {self._position}, expected size {self.size}')
+            view[written:written + len(chunk)] = chunk
+            written += len(chunk)
+            self._position += len(chunk)
+        return written
+
+    def read_range(self, start: int, end: int):
+        """读取[start, end]之间的数据（包含end），经过块缓存"""
+        self.seek(start)
+        return self.read(end - start + 1)
+
+    def _get_block(self, index):
+        with self._lock:
+            if index in self._cache:
+                self._cache.move_to_end(index)
+                return self._cache[index]
+
+            # 未缓存时连同后续的块一起读取，合并为一次Range请求
+            last_index = (self.size - 1) // self.block_size
+            end_index = index
+            while end_index < min(index + self.read_ahead, last_index) and end_index + 1 not in self._cache:
+                end_index += 1
+            start = index * self.block_size
+            end = min((end_index + 1) * self.block_size, self.size) - 1
+            data = self.storage_manage.read_range(self.key, start, end)
+            if len(data) != end - start + 1:  # 不完整的数据不放入缓存
+                raise IOError(f'{self.key}: read_range({start}, {end}) returned {len(data)} bytes')
+            bandwidth_limiter.consume(len(data), self._priority)
+            for i in range(index, end_index + 1):
+                offset = (i - index) * self.block_size
+                self._cache[i] = data[offset:offset + self.block_size]
+                self._cache.move_to_end(i)
+            while len(self._cache) > self.cache_blocks:
+                self._cache.popitem(last=False)
+            return self._cache[index]
@@ -0,0 +1,102 @@
+#!/usr/bin/python3.6+
+# -*- coding:utf-8 -*-
+"""
+@author: zhouwei
+@date: 2026/10/19
+@desc: 对象存储后端注册表
+
+各个后端依赖的SDK(oss2/obs/minio/boto3/azure)体积较大，只在第一次使用某个mode时才导入对应模块。
+第三方后端可以通过 register_backend 注册，或者在自己的包中声明 entry point：
+    entry_points={
+        'yzcore.storage_backends': ['cos = mypackage.cos:CosManager'],
+    }
+entry point指向管理器类，配置类取管理器类的 config_class 属性。
+"""
+import threading
+from importlib import import_module
+from typing import Union, Type
+
+from yzcore.extensions.storage.schemas import BaseConfig
+
+
+__all__ = ['register_backend', 'get_backend', 'available_backends', 'ENTRY_POINT_GROUP']
+
+ENTRY_POINT_GROUP = 'yzcore.storage_backends'
+
+# mode -> [管理器类或导入路径, 配置类或导入路径]
+_backends = {
+    'oss': ['yzcore.extensions.storage.oss:OssManager', 'yzcore.extensions.storage.schemas:OssConfig'],
+    'obs': ['yzcore.extensions.storage.obs:ObsManager', 'yzcore.extensions.storage.schemas:ObsConfig'],
+    'minio': ['yzcore.extensions.storage.minio:MinioManager', 'yzcore.extensions.storage.schemas:MinioConfig'],
+    's3': ['yzcore.extensions.storage.amazon:S3Manager', 'yzcore.extensions.storage.schemas:S3Config'],
+    'azure': ['yzcore.extensions.storage.azure:AzureManager', 'yzcore.extensions.storage.schemas:AzureConfig'],
+}
+_entry_points_loaded = False
+_lock = threading.Lock()
+
+
+def _import_string(path):
+    module_path, _, attr = path.partition(':')
+    return getattr(import_module(module_path), attr)
+
+
+def register_backend(mode: str, manager: Union[str, Type], config: Union[str, Type[BaseConfig]] = None):
+    """
+    注册对象存储后端
+    :param mode: 存储类型，即配置中的mode
+    :param manager: 管理器类，或 'module.path:ClassName' 形式的导入路径
+    :param config: 配置类或导入路径，不传则使用管理器类的 config_class 属性
+    """
+    with _lock:
+        _backends[mode.lower()] = [manager, config]
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # python < 3.8
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            return
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    for ep in eps:
+        # 内置后端优先，不允许被覆盖
+        _backends.setdefault(ep.name.lower(), [ep.value, None])
+
+
+def get_backend(mode: str):
+    """
+    获取mode对应的(管理器类, 配置类)，首次获取时导入
+    :raise KeyError: 未注册的mode
+    """
+    mode = mode.lower()
+    if mode not in _backends:
+        with _lock:
+            _load_entry_points()
+    with _lock:
+        backend = _backends[mode]
+        manager, config = backend
+        if isinstance(manager, str):
+            manager = backend[0] = _import_string(manager)
+        if config is None:
+            config = getattr(manager, 'config_class', BaseConfig)
+        elif isinstance(config, str):
+            config = _import_string(config)
+        backend[1] = config
+    return manager, config
+
+
+def available_backends():
+    """已注册的全部mode"""
+    with _lock:
+        _load_entry_points()
+        return list(_backends)
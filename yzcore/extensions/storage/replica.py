@@ -0,0 +1,317 @@
+#!/usr/bin/python3.6+
+# -*- coding:utf-8 -*-
+"""
+@author: zhouwei
+@date: 2026/10/19
+@desc: 多副本对象存储
+
+写入主存储后立即返回，由后台线程把文件同步到其他区域的副本；
+读取(下载、加签URL、访问链接)时，在已经同步了该文件的存储中选择延迟最低的一个。
+"""
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union, IO, AnyStr
+
+from yzcore.extensions.storage.base import StorageManagerBase, logger
+from yzcore.extensions.storage.throttle import BULK, transfer_priority
+
+
+__all__ = ['ReplicatedStorageManager']
+
+
+class _Backend(object):
+    """
+    一个存储及其延迟统计，延迟使用指数加权移动平均
+    请求失败只标记为不可用，不计入延迟，下一次测量成功后恢复
+    """
+
+    def __init__(self, storage_manage: StorageManagerBase, alpha: float):
+        self.storage_manage = storage_manage
+        self.name = f'{storage_manage.mode}:{storage_manage.endpoint}/{storage_manage.bucket_name}'
+        self.alpha = alpha
+        self.latency = None  # 秒，未测量时为None
+        self.healthy = True
+
+    def record(self, elapsed: float):
+        self.healthy = True
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency = self.alpha * elapsed + (1 - self.alpha) * self.latency
+
+    def record_failure(self):
+        self.healthy = False
+
+
+class ReplicatedStorageManager(object):
+    """
+    多副本对象存储控制器，未封装的方法和属性都透传给主存储
+    >>> storage = ReplicatedStorageManager(StorageManage(primary_conf), [StorageManage(conf) for conf in replica_confs])
+    >>> storage.upload_obj(b'...', 'a/b.glb')  # 写入主存储，后台同步到副本
+    >>> storage.get_sign_url('a/b.glb')  # 从延迟最低且已有该文件的存储生成
+    >>> storage.wait_replicated('a/b.glb', timeout=10)
+    """
+    # 返回结果与具体存储相关的读取方法，从最近的副本读取
+    read_methods = ('download', 'download_stream', 'download_file', 'read_range', 'open',
+                    'get_sign_url', 'get_file_url')
+
+    def __init__(
+            self,
+            primary: StorageManagerBase,
+            replicas: List[StorageManagerBase],
+            workers: int = 4,
+            probe_interval: float = 60,
+            latency_alpha: float = 0.3,
+            max_tracked_keys: int = 100000,
+    ):
+        """
+        :param primary: 主存储，所有写入都先写入主存储
+        :param replicas: 副本存储
+        :param workers: 同步副本的线程数
+        :param probe_interval: 主动测量各存储延迟的间隔(秒)
+        :param latency_alpha: 延迟的平滑系数，越大越偏向最近的测量结果
+        :param max_tracked_keys: 最多记录多少个key的副本同步状态，超出后最早的记录需要重新查询
+        """
+        self.primary = _Backend(primary, latency_alpha)
+        self.replicas = [_Backend(replica, latency_alpha) for replica in replicas]
+        self.probe_interval = probe_interval
+        self.max_tracked_keys = max_tracked_keys
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='storage-replica')
+        self._lock = threading.RLock()
+        self._synced = OrderedDict()  # key -> 已同步该文件的副本名称集合
+        self._pending = {}  # key -> 同步完成事件
+        self._versions = {}  # key -> 写入次数，用于丢弃过期的同步结果
+        self._last_probe = 0
+        self._probing = False
+
+    def __getattr__(self, item):
+        if item in self.read_methods:
+            def read(key, *args, **kwargs):
+                return self._read(item, key, *args, **kwargs)
+            return read
+        return getattr(self.primary.storage_manage, item)
+
+    # ---------------- 延迟 ----------------
+
+    def probe(self):
+        """测量全部存储的延迟，使用HEAD Bucket请求"""
+        def _measure(backend: _Backend):
+            start = time.monotonic()
+            try:
+                backend.storage_manage.is_exist_bucket()
+            except Exception as e:
+                logger.warning(f'replica: probe {backend.name} error: {e}')
+                backend.record_failure()
+                return
+            backend.record(time.monotonic() - start)
+
+        backends = [self.primary] + self.replicas
+        try:
+            with ThreadPoolExecutor(max_workers=len(backends)) as executor:
+                list(executor.map(_measure, backends))
+        finally:
+            self._last_probe = time.monotonic()
+            self._probing = False
+
+    def _maybe_probe(self):
+        """测量结果过期时在后台重新测量，不阻塞当前读取"""
+        if self._probing or time.monotonic() - self._last_probe < self.probe_interval:
+            return
+        with self._lock:
+            if self._probing:
+                return
+            self._probing = True
+        threading.Thread(target=self.probe, name='storage-replica-probe', daemon=True).start()
+
+    def latency(self):
+        """各存储当前的延迟(毫秒)，不可用的存储为None"""
+        return {
+            backend.name: None if backend.latency is None or not backend.healthy else round(backend.latency * 1000, 1)
+            for backend in [self.primary] + self.replicas
+        }
+
+    # ---------------- 读取 ----------------
+
+    def _has_key(self, backend: _Backend, key: str):
+        with self._lock:
+            if key in self._pending:
+                return False
+            synced = self._synced.get(key)
+            if synced is not None:
+                self._synced.move_to_end(key)
+                return backend.name in synced
+        # 没有记录(如进程启动前写入的文件)时查询副本，结果记录下来
+        start = time.monotonic()
+        try:
+            exists = backend.storage_manage.file_exists(key)
+        except Exception as e:
+            logger.warning(f'replica: file_exists {key} on {backend.name} error: {e}')
+            backend.record_failure()
+            return False
+        backend.record(time.monotonic() - start)
+        self._mark(key, backend.name, exists)
+        return exists
+
+    def _choose(self, key: str):
+        """
+        在已有该文件的存储中选择延迟最低的，主存储总是包含全部文件
+        主存储未测量或不可用时，已测量且可用的副本都可以选择
+        """
+        self._maybe_probe()
+        primary = self.primary
+        primary_latency = primary.latency if primary.latency is not None and primary.healthy else float('inf')
+        candidates = sorted(
+            (r for r in self.replicas if r.healthy and r.latency is not None and r.latency < primary_latency),
+            key=lambda r: r.latency,
+        )
+        for backend in candidates:
+            if self._has_key(backend, key):
+                return backend
+        return self.primary
+
+    def _read(self, method, key, *args, **kwargs):
+        backend = self._choose(key)
+        return getattr(backend.storage_manage, method)(key, *args, **kwargs)
+
+    # ---------------- 写入 ----------------
+
+    def _mark(self, key, name, exists=True):
+        with self._lock:
+            synced = self._synced.setdefault(key, set())
+            if exists:
+                synced.add(name)
+            else:
+                synced.discard(name)
+            self._synced.move_to_end(key)
+            while len(self._synced) > self.max_tracked_keys:
+                self._synced.popitem(last=False)
+
+    def _begin_write(self, key):
+        """写入主存储前调用，写入完成并同步之前从主存储读取"""
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._synced[key] = set()
+            self._synced.move_to_end(key)
+            self._pending[key] = self._pending.get(key) or threading.Event()
+            return self._versions[key]
+
+    def _finish(self, key, version):
+        with self._lock:
+            if self._versions.get(key) != version:
+                return
+            self._versions.pop(key, None)
+            event = self._pending.pop(key, None)
+        if event:
+            event.set()
+
+    def _replicate(self, key, version, data=None, content_type=None):
+        """
+        把主存储中的文件同步到全部副本
+        各存储upload_file支持的参数不同，写入主存储时的参数不转发，只保留content_type
+        """
+        local_name = None
+        try:
+            with transfer_priority(BULK):
+                if data is None:
+                    cache_dir = os.path.join(self.primary.storage_manage.cache_path or '.', '.replica')
+                    StorageManagerBase.make_dir(cache_dir)
+                    local_name = os.path.join(cache_dir, uuid.uuid4().hex)
+                    self.primary.storage_manage.download(key, local_name=local_name)
+                for replica in self.replicas:
+                    if self._versions.get(key) != version:
+                        return  # 同步过程中又有新的写入，交给新的同步任务
+                    try:
+                        if data is not None:
+                            replica.storage_manage.upload_obj(data, key, content_type=content_type)
+                        elif content_type:
+                            with open(local_name, 'rb') as f:
+                                replica.storage_manage.upload_obj(f, key, content_type=content_type)
+                        else:
+                            # 不指定content_type时走各存储的分片/断点续传上传
+                            replica.storage_manage.upload(local_name, key)
+                    except Exception as e:
+                        logger.error(f'replica: sync {key} to {replica.name} error: {e}')
+                    else:
+                        with self._lock:
+                            if self._versions.get(key) == version:
+                                self._mark(key, replica.name)
+        except Exception as e:
+            logger.error(f'replica: sync {key} error: {e}')
+        finally:
+            if local_name and os.path.exists(local_name):
+                os.remove(local_name)
+            self._finish(key, version)
+
+    def _write(self, key, write, data=None, content_type=None):
+        version = self._begin_write(key)
+        try:
+            result = write()
+        except Exception:
+            self._finish(key, version)
+            raise
+        self._executor.submit(self._replicate, key, version, data, content_type)
+        return result
+
+    def upload(self, filepath: Union[str, os.PathLike], key: str, **kwargs):
+        return self._write(key, lambda: self.primary.storage_manage.upload(filepath, key, **kwargs),
+                           content_type=kwargs.get('content_type'))
+
+    def upload_file(self, filepath: Union[str, os.PathLike], key: str, **kwargs):
+        return self._write(key, lambda: self.primary.storage_manage.upload_file(filepath, key, **kwargs),
+                           content_type=kwargs.get('content_type'))
+
+    def upload_obj(self, file_obj: Union[IO, AnyStr], key: str, **kwargs):
+        # bytes/str可以直接复用，文件对象已被读取，需要从主存储下载后再同步
+        data = file_obj if isinstance(file_obj, (bytes, str)) else None
+        return self._write(key, lambda: self.primary.storage_manage.upload_obj(file_obj, key, **kwargs), data,
+                           content_type=kwargs.get('content_type'))
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: list):
+        return self._write(key, lambda: self.primary.storage_manage.complete_multipart_upload(key, upload_id, parts))
+
+    def complete_multipart_session(self, key: str, upload_id: str, parts: list = None):
+        return self._write(key, lambda: self.primary.storage_manage.complete_multipart_session(key, upload_id, parts))
+
+    def update_file_headers(self, key, headers: dict):
+        """修改主存储中的文件头，副本等同步完成后再修改"""
+        result = self.primary.storage_manage.update_file_headers(key, dict(headers))
+
+        def _update():
+            self.wait_replicated(key)
+            for replica in self.replicas:
+                try:
+                    replica.storage_manage.update_file_headers(key, dict(headers))
+                except Exception as e:
+                    logger.error(f'replica: update headers of {key} on {replica.name} error: {e}')
+        self._executor.submit(_update)
+        return result
+
+    def delete_object(self, key: str):
+        version = self._begin_write(key)
+        try:
+            result = self.primary.storage_manage.delete_object(key)
+        finally:
+            def _delete():
+                try:
+                    for replica in self.replicas:
+                        try:
+                            replica.storage_manage.delete_object(key)
+                        except Exception as e:
+                            logger.error(f'replica: delete {key} from {replica.name} error: {e}')
+                finally:
+                    self._finish(key, version)
+            self._executor.submit(_delete)
+        return result
+
+    def wait_replicated(self, key: str, timeout: float = None):
+        """等待key同步到副本，返回是否在超时前完成"""
+        event = self._pending.get(key)
+        return event.wait(timeout) if event else True
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -1,10 +1,10 @@
 from typing import Optional
-from pydantic import BaseModel, root_validator
+from pydantic import BaseModel, root_validator, validator
 from .const import StorageMode, Scheme
 
 
 class BaseConfig(BaseModel):
-    mode: StorageMode
+    mode: str  # 内置后端的取值见StorageMode，第三方后端通过register_backend注册
     access_key_id: str
     access_key_secret: str
     bucket_name: str
@@ -17,9 +17,14 @@ class BaseConfig(BaseModel):
     policy_expire_time: Optional[int]  # 上传签名有效时间
     private_expire_time: Optional[int]  # 私有桶访问链接有效时间
 
+    @validator('mode', pre=True)
+    def mode_validator(cls, value):
+        if isinstance(value, StorageMode):
+            value = value.value
+        return str(value).lower()
+
     @root_validator
     def base_validator(cls, values):
-        values['mode'] = values['mode'].value
         if not values['policy_expire_time']:
             values['policy_expire_time'] = 30
         if not values['private_expire_time']:
@@ -50,3 +55,15 @@ class AzureConfig(BaseConfig):
 
 class S3Config(BaseConfig):
     pass
+
+
+class AioS3Config(BaseConfig):
+    region: str = 'us-east-1'  # 签名使用的region，minio默认为us-east-1
+    addressing_style: str = 'path'  # path: {endpoint}/{bucket} / virtual: {bucket}.{endpoint}
+    timeout: int = 60  # 单个请求的超时时间(秒)，上传下载文件内容时为建立连接和两次读取之间的超时
+
+    @validator('addressing_style')
+    def check_addressing_style(cls, v):
+        if v not in ('path', 'virtual'):
+            raise ValueError('addressing_style must be one of [path|virtual]')
+        return v
@@ -0,0 +1,323 @@
+#!/usr/bin/python3.6+
+# -*- coding:utf-8 -*-
+"""
+@author: zhouwei
+@date: 2026/10/19
+@desc: 热点前缀的key分片
+
+OSS/S3按key的前缀划分分区，同一前缀下大量写入时会触发单分区的请求频率限制。
+在热点前缀后插入一级由key哈希得到的分片目录，把写入分散到多个分区：
+    organiz/1/assets/a.glb -> organiz/1/assets/e/a.glb
+对调用方透明，get_key_from_url 和 iter_objects 返回的都是原始key。
+开启分片之前写入的文件仍在原始key下，读取时分片后的key不存在会回退到原始key。
+"""
+import heapq
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from typing import List
+
+from yzcore.exceptions import NotFoundObject
+from yzcore.extensions.storage.base import StorageManagerBase
+
+
+__all__ = ['ShardedKeyLayout', 'ShardedStorageManager']
+
+# 比目录下任何key都大的后缀，用于跳过整个目录: start_after = 目录 + _MAX_CHAR
+_MAX_CHAR = '\U0010ffff'
+
+
+class ShardedKeyLayout(object):
+    """
+    key分片规则
+    >>> layout = ShardedKeyLayout(['organiz/1/assets/'], shards=16)
+    >>> layout.shard_key('organiz/1/assets/a.glb')
+    'organiz/1/assets/e/a.glb'
+    >>> layout.unshard_key('organiz/1/assets/e/a.glb')
+    'organiz/1/assets/a.glb'
+    """
+
+    def __init__(self, prefixes: List[str], shards: int = 16):
+        """
+        :param prefixes: 需要分片的热点前缀，以 / 结尾
+        :param shards: 分片数量，分片目录为十六进制编号
+        """
+        if shards < 2:
+            raise ValueError('shards must be greater than 1')
+        # 较长的前缀优先匹配
+        self.prefixes = sorted((p if p.endswith('/') else p + '/' for p in prefixes), key=len, reverse=True)
+        self.shards = shards
+        self.width = len(f'{shards - 1:x}')
+        self._shard_names = set(self.shard_names())
+
+    def _match(self, key: str):
+        for prefix in self.prefixes:
+            if key.startswith(prefix):
+                return prefix
+        return None
+
+    def shard_of(self, key: str):
+        """原始key所在的分片目录"""
+        number = int(hashlib.md5(key.encode()).hexdigest(), 16) % self.shards
+        return f'{number:0{self.width}x}'
+
+    def shard_names(self):
+        return [f'{n:0{self.width}x}' for n in range(self.shards)]
+
+    def shard_key(self, key: str):
+        """原始key -> 实际存储的key，不在热点前缀下的key保持不变"""
+        prefix = self._match(key)
+        if prefix is None or key == prefix:
+            return key
+        return f'{prefix}{self.shard_of(key)}/{key[len(prefix):]}'
+
+    def unshard_key(self, key: str):
+        """实际存储的key -> 原始key，分片目录与哈希不一致时认为不是分片后的key，保持不变"""
+        prefix = self._match(key)
+        if prefix is None:
+            return key
+        shard, sep, rest = key[len(prefix):].partition('/')
+        if not sep or len(shard) != self.width:
+            return key
+        original = prefix + rest
+        return original if self.shard_of(original) == shard else key
+
+    def shard_dir_of(self, key: str):
+        """key所在的分片目录(包含热点前缀)，不在分片目录中时返回None"""
+        prefix = self._match(key)
+        if prefix is None:
+            return None
+        shard, sep, _ = key[len(prefix):].partition('/')
+        return f'{prefix}{shard}/' if sep and shard in self._shard_names else None
+
+    def nested_prefixes(self, prefix: str):
+        """prefix下的热点前缀，嵌套的热点前缀只返回最外层的"""
+        nested = [p for p in self.prefixes if p.startswith(prefix) and p != prefix]
+        return sorted(p for p in nested if not any(p != o and p.startswith(o) for o in nested))
+
+    def shard_prefixes(self, prefix: str):
+        """
+        列出原始前缀下的文件时需要查询的实际前缀
+        :return: [(实际前缀, 热点前缀, 分片目录)]，前缀不在热点前缀下时只有一项 (prefix, None, None)
+        """
+        hot = self._match(prefix)
+        if hot is None:
+            return [(prefix, None, None)]
+        rest = prefix[len(hot):]
+        return [(f'{hot}{shard}/{rest}', hot, shard) for shard in self.shard_names()]
+
+
+class ShardedStorageManager(object):
+    """
+    按 ShardedKeyLayout 改写key的对象存储控制器，其余方法和属性透传
+    >>> storage = ShardedStorageManager(StorageManage(conf), ShardedKeyLayout(['organiz/1/assets/']))
+    >>> url = storage.upload_obj(b'...', 'organiz/1/assets/a.glb')  # 实际写入 organiz/1/assets/e/a.glb
+    >>> storage.get_key_from_url(url)
+    'organiz/1/assets/a.glb'
+    """
+    # 方法名 -> key参数的位置
+    key_methods = {
+        'get_sign_url': 0,
+        'put_sign_url': 0,
+        'get_object_meta': 0,
+        'update_file_headers': 0,
+        'download': 0,
+        'download_stream': 0,
+        'download_file': 0,
+        'read_range': 0,
+        'open': 0,
+        'get_file_url': 0,
+        'init_multipart_upload': 0,
+        'upload_part': 0,
+        'complete_multipart_upload': 0,
+        'abort_multipart_upload': 0,
+        'sign_part_urls': 0,
+        'list_parts': 0,
+        'create_multipart_session': 0,
+        'complete_multipart_session': 0,
+        'upload': 1,
+        'upload_file': 1,
+        'upload_obj': 1,
+        'upload_from_url': 1,
+    }
+    # 读取已有文件的方法，分片后的key不存在时回退到原始key(分片之前写入的文件)
+    read_methods = ('get_object_meta', 'download', 'download_stream', 'download_file', 'read_range', 'open')
+    url_methods = ('get_sign_url', 'get_file_url')
+
+    def __init__(self, storage_manage: StorageManagerBase, layout: ShardedKeyLayout, list_concurrency: int = 8,
+                 fallback_unsharded: bool = True, max_resolved_keys: int = 10000):
+        """
+        :param storage_manage: 对象存储控制器
+        :param layout: 分片规则
+        :param list_concurrency: 跨分片列出文件时的并发数
+        :param fallback_unsharded: 兼容分片之前写入的文件，读取时分片后的key不存在则使用原始key，列出文件时包含这些文件；
+            热点前缀下与分片目录同名的目录中的文件都视为分片后的文件；全部文件迁移到分片目录后可以关闭
+        :param max_resolved_keys: 最多记录多少个key实际存储的位置
+        """
+        self.storage_manage = storage_manage
+        self.layout = layout
+        self.list_concurrency = list_concurrency
+        self.fallback_unsharded = fallback_unsharded
+        self.max_resolved_keys = max_resolved_keys
+        self._resolved = OrderedDict()  # 原始key -> 实际存储的key
+        self._lock = threading.Lock()
+
+    def __getattr__(self, item):
+        attr = getattr(self.storage_manage, item)
+        if item not in self.key_methods:
+            return attr
+        index = self.key_methods[item]
+
+        def wrapper(*args, **kwargs):
+            args = list(args)
+            if 'key' in kwargs:
+                key = kwargs['key']
+            elif len(args) > index:
+                key = args[index]
+            else:
+                return attr(*args, **kwargs)
+
+            def call(actual_key):
+                if 'key' in kwargs:
+                    kwargs['key'] = actual_key
+                else:
+                    args[index] = actual_key
+                return attr(*args, **kwargs)
+
+            sharded = self.layout.shard_key(key)
+            if sharded == key or not self.fallback_unsharded:
+                return call(sharded)
+            if item in self.read_methods:
+                return self._read(key, sharded, call)
+            if item in self.url_methods:
+                return call(self._resolve(key, sharded))
+            result = call(sharded)
+            if item in ('upload', 'upload_file', 'upload_obj', 'upload_from_url', 'complete_multipart_upload',
+                        'complete_multipart_session'):
+                self._remember(key, sharded)
+            return result
+        wrapper.__name__ = item
+        wrapper.__doc__ = attr.__doc__
+        return wrapper
+
+    def _remember(self, key, actual_key):
+        with self._lock:
+            self._resolved[key] = actual_key
+            self._resolved.move_to_end(key)
+            while len(self._resolved) > self.max_resolved_keys:
+                self._resolved.popitem(last=False)
+
+    def _read(self, key, sharded, call):
+        actual_key = self._resolved.get(key)
+        for candidate in ([actual_key] if actual_key else [sharded, key]):
+            try:
+                result = call(candidate)
+            except NotFoundObject:
+                continue
+            self._remember(key, candidate)
+            return result
+        with self._lock:
+            self._resolved.pop(key, None)
+        raise NotFoundObject()
+
+    def _resolve(self, key, sharded):
+        """生成链接时需要先确定文件实际存储的key，结果记录下来避免每次都查询"""
+        actual_key = self._resolved.get(key)
+        if actual_key is None:
+            exists = self.storage_manage.file_exists(sharded) or not self.storage_manage.file_exists(key)
+            actual_key = sharded if exists else key
+            self._remember(key, actual_key)
+        return actual_key
+
+    def file_exists(self, key):
+        sharded = self.layout.shard_key(key)
+        if self.storage_manage.file_exists(sharded):
+            return True
+        return sharded != key and self.fallback_unsharded and self.storage_manage.file_exists(key)
+
+    def delete_object(self, key):
+        sharded = self.layout.shard_key(key)
+        result = self.storage_manage.delete_object(sharded)
+        if sharded != key and self.fallback_unsharded:
+            with self._lock:
+                self._resolved.pop(key, None)
+            try:
+                self.storage_manage.delete_object(key)
+            except NotFoundObject:
+                pass
+        return result
+
+    def get_key_from_url(self, url, urldecode=False):
+        return self.layout.unshard_key(self.storage_manage.get_key_from_url(url, urldecode))
+
+    def walk_objects(self, prefix='', start_after=None, page_size=1000):
+        """遍历原始前缀下的全部文件，返回原始key并按key排序"""
+        return self._merge_objects(prefix, start_after, None, page_size)
+
+    def iter_objects(self, prefix='', marker=None, delimiter=None, max_keys=100):
+        """
+        列出原始前缀下的文件，返回原始key并按key排序
+        前缀在热点前缀下时并发查询每个分片后合并，marker为原始key
+        """
+        return list(islice(self._merge_objects(prefix, marker, delimiter, max_keys), max_keys))
+
+    def _merge_objects(self, prefix, marker, delimiter, page_size):
+        shard_prefixes = self.layout.shard_prefixes(prefix)
+        if len(shard_prefixes) == 1:
+            nested = [] if delimiter else self.layout.nested_prefixes(prefix)
+            if not nested:
+                return self._list(prefix, marker, delimiter, page_size)
+            # 前缀包含热点前缀时，热点前缀下的文件单独按原始key合并，其余文件跳过热点前缀
+            sources = [self._list(prefix, marker, None, page_size,
+                                  skip=lambda key: next((hot for hot in nested if key.startswith(hot)), None))]
+            sources.extend(self._merge_objects(hot, marker, None, page_size) for hot in nested)
+            return heapq.merge(*sources, key=lambda obj: obj['key'])
+        else:
+            hot = shard_prefixes[0][1]
+            if marker and not marker.startswith(hot) and marker > hot:
+                return iter([])  # marker在热点前缀下的全部key之后
+            # 分片内的顺序与去掉分片目录后的顺序一致，marker换算为每个分片中的key
+            rest = marker[len(hot):] if marker and marker.startswith(hot) else None
+            sources = [
+                self._list(shard_prefix, None if rest is None else f'{hot}{shard}/{rest}', delimiter, page_size)
+                for shard_prefix, _, shard in shard_prefixes
+            ]
+            if self.fallback_unsharded:
+                # 分片之前写入的文件，跳过分片目录，不重复列出已经分片的文件
+                sources.append(self._list(prefix, marker, delimiter, page_size, skip=self.layout.shard_dir_of))
+            # 并发取回每个来源的第一页，后续的页在合并时按需请求
+            with ThreadPoolExecutor(max_workers=min(self.list_concurrency, len(sources))) as executor:
+                heads = list(executor.map(lambda source: list(islice(source, 1)), sources))
+            sources = [chain(head, source) for head, source in zip(heads, sources)]
+        return heapq.merge(*[map(self._unshard_object, source) for source in sources], key=lambda obj: obj['key'])
+
+    def _list(self, prefix, marker, delimiter, page_size, skip=None):
+        """
+        按key的顺序逐个返回文件，翻页与 StorageManagerBase.walk_objects 相同
+        :param skip: skip(key) 返回key所在的需要整体跳过的目录，从该目录之后重新开始列出
+        """
+        if not delimiter:
+            while True:
+                for obj in self.storage_manage.walk_objects(prefix, start_after=marker, page_size=page_size):
+                    skipped = skip(obj['key']) if skip else None
+                    if skipped:
+                        marker = skipped + _MAX_CHAR
+                        break
+                    yield obj
+                else:
+                    return
+        while True:
+            kwargs = {'prefix': prefix, 'delimiter': delimiter, 'max_keys': page_size}
+            if marker:
+                kwargs['marker'] = marker
+            page = self.storage_manage.iter_objects(**kwargs)
+            if not page:
+                return
+            yield from page
+            marker = page[-1]['key']
+
+    def _unshard_object(self, obj):
+        # 返回新的dict，遍历时后端可能还要用原来的key翻页
+        return dict(obj, key=self.layout.unshard_key(obj['key']))
@@ -0,0 +1,210 @@
+#!/usr/bin/python3.7+
+# -*- coding:utf-8 -*-
+"""
+@author: zhouwei
+@date: 2026/10/19
+@desc: 对象存储传输限速
+
+令牌桶限制进程内对象存储传输的总带宽，并区分两种优先级：
+    interactive: 请求链路中的上传下载，默认优先级
+    bulk: 迁移、目录同步、打包等后台任务，有interactive传输在等待时让出带宽，并可单独限制速率
+
+>>> set_bandwidth_limit(rate=50 * 1024 * 1024, bulk_rate=20 * 1024 * 1024)  # 进程启动时配置，单位 bytes/s
+>>> with transfer_priority(BULK):
+...     storage_manage.upload('/tmp/a.zip', 'backup/a.zip')
+"""
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from io import BytesIO
+
+
+__all__ = [
+    'INTERACTIVE',
+    'BULK',
+    'BandwidthLimiter',
+    'ThrottledStream',
+    'ThrottledProgress',
+    'bandwidth_limiter',
+    'set_bandwidth_limit',
+    'throttle_stream',
+    'throttle_progress',
+    'transfer_priority',
+    'current_priority',
+]
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+_priority = ContextVar('storage_transfer_priority', default=INTERACTIVE)
+
+
+def current_priority():
+    return _priority.get()
+
+
+@contextmanager
+def transfer_priority(priority: str):
+    """设置当前上下文中对象存储传输的优先级"""
+    if priority not in (INTERACTIVE, BULK):
+        raise ValueError(f'transfer priority must be one of [{INTERACTIVE}|{BULK}]')
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class BandwidthLimiter(object):
+    """带优先级的令牌桶"""
+
+    def __init__(self, rate: int = 0, burst: int = None, bulk_rate: int = None):
+        self._cond = threading.Condition()
+        self._interactive_waiting = 0
+        self.configure(rate, burst, bulk_rate)
+
+    def configure(self, rate: int = 0, burst: int = None, bulk_rate: int = None):
+        """
+        :param rate: 总带宽(bytes/s)，0表示不限速
+        :param burst: 令牌桶容量，默认为1秒的流量
+        :param bulk_rate: bulk优先级的带宽上限(bytes/s)，默认与总带宽相同
+        """
+        with self._cond:
+            self.rate = rate or 0
+            self.burst = burst or self.rate
+            self.bulk_rate = bulk_rate or self.rate
+            self.bulk_burst = min(self.burst, self.bulk_rate) if self.bulk_rate else self.burst
+            self._tokens = self.burst
+            self._bulk_tokens = self.bulk_burst
+            self._updated = time.monotonic()
+            self._cond.notify_all()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._bulk_tokens = min(self.bulk_burst, self._bulk_tokens + elapsed * self.bulk_rate)
+
+    def consume(self, nbytes: int, priority: str = None):
+        """阻塞直到获取nbytes的令牌"""
+        if not self.enabled or nbytes <= 0:
+            return
+        priority = priority or current_priority()
+        while nbytes > 0:
+            size = min(nbytes, self.bulk_burst if priority == BULK else self.burst)
+            self._acquire(size, priority)
+            nbytes -= size
+
+    def _acquire(self, size, priority):
+        with self._cond:
+            if priority == INTERACTIVE:
+                self._interactive_waiting += 1
+            try:
+                while True:
+                    if not self.enabled:
+                        return
+                    self._refill()
+                    if priority == BULK and self._interactive_waiting:
+                        # 有请求链路的传输在等待，后台任务让出带宽
+                        self._cond.wait(0.05)
+                        continue
+                    if self._tokens >= size and (priority == INTERACTIVE or self._bulk_tokens >= size):
+                        self._tokens -= size
+                        if priority == BULK:
+                            self._bulk_tokens -= size
+                        return
+                    delay = (size - self._tokens) / self.rate
+                    if priority == BULK:
+                        delay = max(delay, (size - self._bulk_tokens) / self.bulk_rate)
+                    self._cond.wait(max(delay, 0.001))
+            finally:
+                if priority == INTERACTIVE:
+                    self._interactive_waiting -= 1
+                    self._cond.notify_all()
+
+
+class ThrottledStream(object):
+    """按读取的数据量消耗令牌的文件对象包装，其余属性透传给原对象"""
+
+    def __init__(self, stream, limiter: BandwidthLimiter = None, priority: str = None):
+        self._stream = stream
+        self._limiter = limiter or bandwidth_limiter
+        self._priority = priority or current_priority()
+
+    def read(self, size=-1, *args, **kwargs):
+        data = self._stream.read(size, *args, **kwargs)
+        self._limiter.consume(len(data), self._priority)
+        return data
+
+    def __iter__(self):
+        while True:
+            data = self.read(64 * 1024)
+            if not data:
+                break
+            yield data
+
+    def __getattr__(self, item):
+        return getattr(self._stream, item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if hasattr(self._stream, 'close'):
+            self._stream.close()
+
+
+class ThrottledProgress(object):
+    """
+    SDK分片/断点续传上传的进度回调，按新增的传输量消耗令牌
+    回调在SDK的传输线程中同步执行，阻塞时即推迟了后续数据的发送
+    """
+
+    def __init__(self, cumulative: bool = True, limiter: BandwidthLimiter = None, priority: str = None):
+        """
+        :param cumulative: True: 回调的第一个参数是累计传输量 / False: 本次新增的传输量
+        """
+        self._cumulative = cumulative
+        self._limiter = limiter or bandwidth_limiter
+        self._priority = priority or current_priority()
+        self._transferred = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, amount, *args):
+        if self._cumulative:
+            # 多线程上传时累计值可能乱序到达
+            with self._lock:
+                amount, self._transferred = amount - self._transferred, max(amount, self._transferred)
+        self._limiter.consume(amount, self._priority)
+
+
+def throttle_progress(cumulative: bool = True, priority: str = None):
+    """限速开启时返回SDK上传使用的进度回调，否则返回None"""
+    if not bandwidth_limiter.enabled:
+        return None
+    return ThrottledProgress(cumulative, priority=priority)
+
+
+def throttle_stream(stream, priority: str = None):
+    """限速开启时返回包装后的文件对象，bytes/str会先转为BytesIO"""
+    if not bandwidth_limiter.enabled:
+        return stream
+    if isinstance(stream, str):
+        stream = stream.encode()
+    if isinstance(stream, (bytes, bytearray)):
+        stream = BytesIO(stream)
+    return ThrottledStream(stream, priority=priority)
+
+
+bandwidth_limiter = BandwidthLimiter()
+
+
+def set_bandwidth_limit(rate: int = 0, burst: int = None, bulk_rate: int = None):
+    """配置当前进程的对象存储传输带宽，rate=0时不限速"""
+    bandwidth_limiter.configure(rate, burst, bulk_rate)
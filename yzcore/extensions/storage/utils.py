@@ -1,9 +1,18 @@
+import os
+import threading
 from io import BytesIO
 from typing import AnyStr
+from contextlib import contextmanager
 from urllib.parse import unquote, urlparse
 from pathlib import Path
 from yzcore.utils.crypto import get_random_string
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 
 def create_temp_file(text_length=16):
     """创建一个包含随机字符串的内存文件"""
@@ -33,3 +42,91 @@ def AnyStr2BytesIO(t: AnyStr):
     else:
         obj = BytesIO(t.encode())
     return obj
+
+
+_key_locks = {}  # name -> [threading.Lock, 引用计数]
+_key_locks_guard = threading.Lock()
+
+
+@contextmanager
+def key_lock(name):
+    """进程内按名称加锁，锁对象在没有使用者时自动释放"""
+    with _key_locks_guard:
+        item = _key_locks.setdefault(name, [threading.Lock(), 0])
+        item[1] += 1
+    try:
+        with item[0]:
+            yield
+    finally:
+        with _key_locks_guard:
+            item[1] -= 1
+            if item[1] == 0:
+                _key_locks.pop(name, None)
+
+
+class FileLock(object):
+    """
+    跨进程的文件排他锁，Windows上使用msvcrt锁定文件的第一个字节
+    同一进程内不同的FileLock对象之间同样互斥
+    """
+
+    def __init__(self, lock_path):
+        self.lock_path = lock_path
+        self._file = None
+
+    def acquire(self, blocking: bool = True):
+        """获得锁返回True；blocking=False时锁被占用立即返回False"""
+        f = open(self.lock_path, 'a')
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                while True:
+                    try:
+                        # LK_LOCK 重试10次(约10秒)后仍未获得锁会抛出OSError，继续等待
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+        except OSError:
+            f.close()
+            if blocking:
+                raise
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        f, self._file = self._file, None
+        if f is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            f.close()
+
+
+@contextmanager
+def file_lock(lock_path):
+    """跨进程的文件排他锁"""
+    lock = FileLock(lock_path)
+    lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def file_signature(path):
+    """文件的(inode, 修改时间, 大小)，文件不存在时返回None，用于判断文件是否被替换过"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
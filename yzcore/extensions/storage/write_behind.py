@@ -0,0 +1,345 @@
+#!/usr/bin/python3.6+
+# -*- coding:utf-8 -*-
+"""
+@author: zhouwei
+@date: 2026/10/19
+@desc: 对象存储异步上传队列（write-behind）
+
+文件先落地到 cache_path 下的暂存目录，立即返回最终的访问链接，由后台线程池负责上传，
+上传失败会重试，进程重启后会继续上传暂存目录中未完成的文件。
+每个上传队列使用暂存目录下自己的子目录，并在存活期间持有该子目录的文件锁；
+启动时只接管锁已释放(所属进程已退出)的子目录中的任务，多个进程共用暂存目录时互不影响。
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+import threading
+from queue import Queue
+from collections import OrderedDict
+from typing import Union, IO, AnyStr
+
+from yzcore.extensions.storage.base import StorageManagerBase, StorageRequestError, logger
+from yzcore.extensions.storage.throttle import BULK, transfer_priority
+from yzcore.extensions.storage.utils import FileLock, file_lock
+
+
+__all__ = ['WriteBehindUploader', 'UploadStatus']
+
+
+class UploadStatus(object):
+    pending = 'pending'
+    uploading = 'uploading'
+    done = 'done'
+    failed = 'failed'
+    superseded = 'superseded'  # 同一个key有更新的上传任务，旧任务被跳过
+
+
+class _Task(object):
+
+    def __init__(self, task_id, key, content_type=None, created=None, attempts=0):
+        self.task_id = task_id
+        self.key = key
+        self.content_type = content_type
+        self.created = created or time.time()
+        self.attempts = attempts
+        self.status = UploadStatus.pending
+        self.error = None
+        self.finished = threading.Event()
+
+    def to_dict(self):
+        return {
+            'task_id': self.task_id,
+            'key': self.key,
+            'content_type': self.content_type,
+            'created': self.created,
+            'attempts': self.attempts,
+            'status': self.status,
+            'error': self.error,
+        }
+
+
+class WriteBehindUploader(object):
+    """
+    异步上传队列
+    >>> uploader = WriteBehindUploader(storage_manage, workers=4)
+    >>> uploader.start()  # 启动后台线程，并恢复暂存目录中未完成的任务
+    >>> file_url = uploader.submit(b'...', 'exports/a.xlsx')  # 立即返回最终的访问链接
+    >>> uploader.status('exports/a.xlsx')  # pending / uploading / done / failed
+    >>> uploader.wait('exports/a.xlsx', timeout=10)
+    >>> await uploader.wait_async('exports/a.xlsx', timeout=10)
+    >>> uploader.stop()
+    """
+    _stop_signal = object()
+    _key_lock_count = 64  # 按key哈希分配的上传锁数量
+
+    def __init__(
+            self,
+            storage_manage: StorageManagerBase,
+            spool_dir: str = None,
+            workers: int = 4,
+            max_retries: int = 3,
+            retry_delay: float = 1,
+            max_finished: int = 10000,
+    ):
+        """
+        :param storage_manage: 对象存储控制器
+        :param spool_dir: 暂存目录，默认为 {cache_path}/.upload_spool/{bucket_name}，可以由多个进程共用
+        :param workers: 上传线程数
+        :param max_retries: 上传失败的最大重试次数
+        :param retry_delay: 重试间隔(秒)，按次数指数增长
+        :param max_finished: 最多保留多少个已结束任务的状态，用于 status/wait 查询
+        """
+        self.storage_manage = storage_manage
+        self.spool_root = spool_dir or os.path.join(
+            storage_manage.cache_path or '.', '.upload_spool', storage_manage.bucket_name)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_finished = max_finished
+
+        self._queue = Queue()
+        self._tasks = {}  # key -> 最新的未结束的_Task
+        self._finished = OrderedDict()  # key -> 最近结束的_Task
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(self._key_lock_count)]
+        self._threads = []
+
+        # 当前队列独占的子目录，锁在队列的整个生命周期内持有，进程退出后自动释放
+        StorageManagerBase.make_dir(self.spool_root)
+        name = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._owner_lock = FileLock(os.path.join(self.spool_root, f'{name}.lock'))
+        self._owner_lock.acquire()
+        self.spool_dir = os.path.join(self.spool_root, name)
+        StorageManagerBase.make_dir(self.spool_dir)
+
+    def start(self):
+        """启动上传线程，并恢复暂存目录中未完成的任务"""
+        if self._threads:
+            return
+        self._recover()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'write-behind-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, wait: bool = True):
+        """停止上传线程，未上传完成的文件保留在暂存目录中，下次启动时继续上传"""
+        for _ in self._threads:
+            self._queue.put(self._stop_signal)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def submit(self, file_obj: Union[IO, AnyStr], key: str, content_type: str = None):
+        """
+        将文件写入暂存目录并加入上传队列
+        :param file_obj: 文件内容或文件对象
+        :param key: 对象存储中的key
+        :param content_type: 不传则根据key的后缀判断
+        :return: 文件的访问链接
+        """
+        task = _Task(f'{hashlib.md5(key.encode()).hexdigest()}-{uuid.uuid4().hex}', key, content_type)
+        data_path = self._data_path(task.task_id)
+        tmp_path = f'{data_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            if isinstance(file_obj, str):
+                f.write(file_obj.encode())
+            elif isinstance(file_obj, (bytes, bytearray)):
+                f.write(file_obj)
+            else:
+                shutil.copyfileobj(file_obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, data_path)
+        # 元数据落地后任务才算提交成功
+        self._write_meta(task)
+
+        with self._lock:
+            self._tasks[key] = task
+            self._finished.pop(key, None)
+        self._queue.put(task)
+        return self.storage_manage.get_file_url(key)
+
+    def _get_task(self, key: str):
+        with self._lock:
+            return self._tasks.get(key) or self._finished.get(key)
+
+    def _finish(self, task: _Task, status: str):
+        """任务结束，从未结束的任务中移除，只保留最近的max_finished个结果"""
+        task.status = status
+        with self._lock:
+            if self._tasks.get(task.key) is task:
+                del self._tasks[task.key]
+                self._finished[task.key] = task
+                self._finished.move_to_end(task.key)
+                while len(self._finished) > self.max_finished:
+                    self._finished.popitem(last=False)
+        task.finished.set()
+
+    def status(self, key: str):
+        """查询key最近一次提交的上传状态，没有提交记录时返回None"""
+        task = self._get_task(key)
+        return task.status if task else None
+
+    def wait(self, key: str, timeout: float = None):
+        """
+        等待key的上传完成
+        :return: 文件的访问链接
+        """
+        task = self._get_task(key)
+        if task is None:
+            raise StorageRequestError(f'write-behind: no upload task for {key}')
+        if not task.finished.wait(timeout):
+            raise TimeoutError(f'write-behind: wait for {key} timeout')
+        if task.status == UploadStatus.failed:
+            raise StorageRequestError(f'write-behind upload {key} failed: {task.error}')
+        return self.storage_manage.get_file_url(key)
+
+    async def wait_async(self, key: str, timeout: float = None):
+        """异步等待key的上传完成"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.wait, key, timeout)
+
+    def pending_count(self):
+        """队列中等待上传的任务数量"""
+        return self._queue.qsize()
+
+    def _data_path(self, task_id):
+        return os.path.join(self.spool_dir, f'{task_id}.data')
+
+    def _meta_path(self, task_id):
+        return os.path.join(self.spool_dir, f'{task_id}.json')
+
+    def _write_meta(self, task: _Task):
+        meta_path = self._meta_path(task.task_id)
+        tmp_path = f'{meta_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(task.to_dict(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, meta_path)
+
+    def _remove_task_files(self, task: _Task):
+        for path in (self._data_path(task.task_id), self._meta_path(task.task_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _recover(self):
+        """接管所属进程已退出的子目录中的任务，同一个key只保留最新的任务"""
+        with file_lock(os.path.join(self.spool_root, '.recover.lock')):
+            for name in os.listdir(self.spool_root):
+                path = os.path.join(self.spool_root, name)
+                if path == self.spool_dir or not os.path.isdir(path):
+                    continue
+                owner_lock = FileLock(f'{path}.lock')
+                if not owner_lock.acquire(blocking=False):
+                    continue  # 所属进程仍在运行
+                try:
+                    self._adopt(path)
+                finally:
+                    owner_lock.release()
+                try:
+                    os.remove(f'{path}.lock')
+                except OSError:
+                    pass
+
+        tasks = []
+        known_ids = {task.task_id for task in self._tasks.values()}  # start之前通过submit提交的任务
+        for filename in os.listdir(self.spool_dir):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.spool_dir, filename)
+            try:
+                with open(path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                logger.error(f'write-behind: broken spool meta {path}')
+                continue
+            if meta['task_id'] in known_ids or meta['status'] == UploadStatus.failed \
+                    or not os.path.isfile(self._data_path(meta['task_id'])):
+                continue
+            tasks.append(_Task(meta['task_id'], meta['key'], meta.get('content_type'),
+                               meta.get('created'), meta.get('attempts', 0)))
+
+        for task in sorted(tasks, key=lambda t: t.created):
+            with self._lock:
+                latest = self._tasks.get(task.key)
+                if latest is None or latest.created < task.created:
+                    self._tasks[task.key] = task
+            self._queue.put(task)
+        if tasks:
+            logger.info(f'write-behind: recovered {len(tasks)} upload tasks into {self.spool_dir}')
+
+    def _adopt(self, path):
+        """把已退出进程的任务文件移动到当前子目录，丢弃写入过程中崩溃留下的文件"""
+        filenames = os.listdir(path)
+        task_ids = {filename[:-len('.json')] for filename in filenames if filename.endswith('.json')}
+        for filename in filenames:
+            task_id, ext = os.path.splitext(filename)
+            if ext == '.json' or (ext == '.data' and task_id in task_ids):
+                os.replace(os.path.join(path, filename), os.path.join(self.spool_dir, filename))
+            else:
+                # .tmp 临时文件，以及没有元数据的数据文件(提交未完成的任务)
+                os.remove(os.path.join(path, filename))
+        os.rmdir(path)
+
+    def _worker(self):
+        while True:
+            task = self._queue.get()
+            if task is self._stop_signal:
+                break
+            try:
+                self._upload(task)
+            except Exception as e:
+                logger.error(f'write-behind: unexpected error for {task.key}: {e}')
+
+    def _key_lock(self, key):
+        """同一个key的上传串行执行，避免旧内容晚于新内容写入"""
+        return self._key_locks[int(hashlib.md5(key.encode()).hexdigest(), 16) % self._key_lock_count]
+
+    def _is_superseded(self, task: _Task):
+        latest = self._tasks.get(task.key)
+        return latest is not None and latest.task_id != task.task_id
+
+    def _skip(self, task: _Task):
+        self._remove_task_files(task)
+        self._finish(task, UploadStatus.superseded)
+
+    def _upload(self, task: _Task):
+        task.status = UploadStatus.uploading
+        while True:
+            # 每次尝试前都在key锁内检查是否已有更新的任务，更新的任务会等当前尝试结束后再上传
+            with self._key_lock(task.key):
+                if self._is_superseded(task):
+                    return self._skip(task)
+                try:
+                    with open(self._data_path(task.task_id), 'rb') as f, transfer_priority(BULK):
+                        self.storage_manage.upload_obj(f, task.key, content_type=task.content_type)
+                except Exception as e:
+                    error = e
+                else:
+                    task.error = None
+                    self._remove_task_files(task)
+                    self._finish(task, UploadStatus.done)
+                    return
+
+            if self._is_superseded(task):
+                return self._skip(task)
+            task.attempts += 1
+            task.error = str(error)
+            if task.attempts > self.max_retries:
+                logger.error(f'write-behind: upload {task.key} failed after {task.attempts} attempts: {error}')
+                task.status = UploadStatus.failed
+                self._write_meta(task)  # 保留数据文件用于排查和人工重传
+                self._finish(task, UploadStatus.failed)
+                return
+            logger.warning(f'write-behind: upload {task.key} failed, retry {task.attempts}: {error}')
+            self._write_meta(task)
+            time.sleep(self.retry_delay * 2 ** (task.attempts - 1))
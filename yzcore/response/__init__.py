@@ -6,6 +6,6 @@
 @desc: ...
 """
 # from .response import render_data
-from .response import response
+from .response import response, stream_json, stream_csv
 
 from .response_code import *
@@ -5,7 +5,9 @@
 @date: 2020-9-13
 @desc: ...
 """
+import io
 import os
+import csv
 import json
 import typing
 from starlette.datastructures import URL
@@ -18,6 +20,9 @@ from fastapi.responses import (
 )
 
 
+from yzcore.core.encoders import jsonable_encoder
+
+
 class XMLResponse(_Response):
     media_type = "application/xml"
 
@@ -73,8 +78,18 @@ def response(
     return _response_cls(**kwargs)
 
 
+_UNSET = object()  # 区分未传入的参数和传入的None
+
+
 def render_data(data=None, code=10000, message='Successfully.',
-                limit: int = 10, offset: int = 0, total: int = 0):
+                limit: int = 10, offset: int = 0, total: int = 0,
+                cursor: str = _UNSET, next_cursor: str = _UNSET, is_cursor: bool = None):
+    """
+    :param cursor: 游标分页时当前页的游标，第一页为None
+    :param next_cursor: 游标分页时下一页的游标，最后一页为None；
+        传入了cursor或next_cursor参数(包括None)时分页信息使用游标格式
+    :param is_cursor: 显式指定是否为游标分页，不传则根据是否传入了cursor/next_cursor参数判断
+    """
     if data is None:
         return dict(
             code=code,
@@ -86,17 +101,30 @@ def render_data(data=None, code=10000, message='Successfully.',
             )
         )
     if isinstance(data, list):
+        if is_cursor is None:
+            is_cursor = cursor is not _UNSET or next_cursor is not _UNSET
+        if is_cursor:
+            cursor = None if cursor is _UNSET else cursor
+            next_cursor = None if next_cursor is _UNSET else next_cursor
+            pagination = dict(
+                limit=limit,
+                cursor=cursor,
+                next_cursor=next_cursor,
+                has_more=next_cursor is not None
+            )
+        else:
+            pagination = dict(
+                limit=limit,
+                offset=offset,
+                total=total
+            )
         result = dict(
             code=code,
             message=message,
             info=dict(),
             list=dict(
                 data=data,
-                pagination=dict(
-                    limit=limit,
-                    offset=offset,
-                    total=total
-                )
+                pagination=pagination
             )
         )
     # elif isinstance(data, Container):
@@ -111,3 +139,107 @@ def render_data(data=None, code=10000, message='Successfully.',
             )
         )
     return result
+
+
+def _iter_chunks(rows, render, chunk_rows):
+    """把行渲染成文本并按chunk_rows行合并后输出，同时支持同步和异步可迭代对象"""
+    if hasattr(rows, '__aiter__'):
+        async def _agen():
+            buffer = []
+            async for row in rows:
+                buffer.append(render(row))
+                if len(buffer) >= chunk_rows:
+                    yield ''.join(buffer)
+                    buffer = []
+            if buffer:
+                yield ''.join(buffer)
+        return _agen()
+
+    def _gen():
+        buffer = []
+        for row in rows:
+            buffer.append(render(row))
+            if len(buffer) >= chunk_rows:
+                yield ''.join(buffer)
+                buffer = []
+        if buffer:
+            yield ''.join(buffer)
+    return _gen()
+
+
+def _prepend(first, chunks, last=None):
+    if hasattr(chunks, '__aiter__'):
+        async def _agen():
+            yield first
+            async for chunk in chunks:
+                yield chunk
+            if last:
+                yield last
+        return _agen()
+
+    def _gen():
+        yield first
+        yield from chunks
+        if last:
+            yield last
+    return _gen()
+
+
+def _attachment(filename):
+    return {'Content-Disposition': f'attachment; filename="{filename}"'} if filename else None
+
+
+def stream_json(rows, chunk_rows: int = 500, filename: str = None, headers: dict = None):
+    """
+    以JSON数组的形式流式返回，rows可以是ORM对象、dict、元组的(异步)可迭代对象，如 crud.iter_list(db)
+    :param chunk_rows: 每次发送的行数
+    """
+    state = {'first': True}
+
+    def render(row):
+        text = json.dumps(jsonable_encoder(row), ensure_ascii=False)
+        if state['first']:
+            state['first'] = False
+            return text
+        return ',' + text
+
+    headers = {**(_attachment(filename) or {}), **(headers or {})}
+    content = _prepend('[', _iter_chunks(rows, render, chunk_rows), ']')
+    return StreamingResponse(content, media_type='application/json', headers=headers)
+
+
+def stream_csv(rows, columns: typing.List[str] = None, chunk_rows: int = 500,
+               filename: str = None, headers: dict = None):
+    """
+    以CSV的形式流式返回，rows可以是ORM对象、dict、元组的(异步)可迭代对象，如 crud.iter_list(db, row_type='dict')
+    :param columns: 表头；dict和ORM对象按表头取值，不传时使用第一行的字段；元组按顺序输出
+    :param chunk_rows: 每次发送的行数
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    state = {'columns': columns, 'header': columns is not None}
+
+    def render(row):
+        if not isinstance(row, (tuple, list)):
+            row = row if isinstance(row, dict) else jsonable_encoder(row)
+            if state['columns'] is None:
+                state['columns'] = list(row)
+            row = [row.get(column) for column in state['columns']]
+        if not state['header']:
+            state['header'] = True
+            if state['columns'] is not None:
+                writer.writerow(state['columns'])
+        writer.writerow(row)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    headers = {**(_attachment(filename) or {}), **(headers or {})}
+    content = _iter_chunks(rows, render, chunk_rows)
+    if columns:
+        writer.writerow(columns)
+        content = _prepend(buffer.getvalue(), content)
+        buffer.seek(0)
+        buffer.truncate()
+    return StreamingResponse(content, media_type='text/csv', headers=headers)